@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Measure async extraction throughput and event loop latency under concurrent requests
+
+Generates --files synthetic documents and starts --requests extractions at
+once through extract_comments_async, on the default thread pool and on a
+process pool, with --limit parses allowed at a time. Reports requests per
+second, request latency percentiles and the worst delay seen by a timer
+ticking on the event loop meanwhile (how long the loop was stalled).
+
+Usage:
+    python benchmarks/bench_async.py --requests 100 --files 20 --pages 200
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pdf_comment_viewer'))
+
+from synthetic import generate_pdf
+from pdf_processor import extract_comments
+import async_extraction
+
+TICK = 0.01
+
+
+async def run_requests(paths, requests, executor):
+    stalls = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(TICK)
+            stalls.append(time.perf_counter() - started - TICK)
+
+    async def request(path):
+        started = time.perf_counter()
+        await async_extraction.extract_comments_async(path, executor=executor)
+        return time.perf_counter() - started
+
+    ticking = asyncio.ensure_future(ticker())
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(request(paths[i % len(paths)]) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await ticking
+    return elapsed, sorted(latencies), max(stalls, default=0.0)
+
+
+def report(name, requests, elapsed, latencies, stall):
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] * 1000
+
+    print(f"  {name:<16} {requests / elapsed:8.1f} req/s  p50 {percentile(50):8.1f} ms  "
+          f"p99 {percentile(99):8.1f} ms  worst loop stall {stall * 1000:6.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=100, help='Extractions started at once')
+    parser.add_argument('--files', type=int, default=20, help='Distinct documents to extract')
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=os.cpu_count() or 1, help='Parses allowed at a time')
+    args = parser.parse_args()
+
+    async_extraction.set_max_parses(args.limit)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(args.files):
+            path = os.path.join(tmp, f'doc{i}.pdf')
+            generate_pdf(path, pages=args.pages, annots_per_page=2.0, seed=i)
+            paths.append(path)
+
+        started = time.perf_counter()
+        for i in range(args.requests):
+            extract_comments(paths[i % len(paths)])
+        blocking = time.perf_counter() - started
+
+        print(f"{args.requests} requests over {args.files} files of {args.pages} pages, {args.limit} parses at a time")
+        print(f"  {'blocking loop':<16} {args.requests / blocking:8.1f} req/s  (one after another, loop stalled)")
+        report('threads', args.requests, *asyncio.run(run_requests(paths, args.requests, None)))
+        with ProcessPoolExecutor(max_workers=args.limit) as executor:
+            report('processes', args.requests, *asyncio.run(run_requests(paths, args.requests, executor)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Compare the memory held by comment records in the old and new format
+
+Builds a million comments (by default) the way the pypdf path used to, as
+a dict per comment holding pypdf string objects, and as Comment records,
+and reports the memory each list holds according to tracemalloc.
+
+Usage:
+    python benchmarks/bench_comment_memory.py --comments 1000000
+"""
+
+import os
+import sys
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pdf_comment_viewer'))
+
+from pypdf.generic import TextStringObject, NameObject
+
+from comment import Comment
+
+AUTHORS = [f"Reviewer {i}" for i in range(20)]
+TYPES = ['/Text', '/Highlight', '/Underline', '/FreeText']
+
+
+def raw_values(i):
+    """Values as pypdf hands them out: fresh objects for every annotation"""
+    return dict(
+        id=i + 10,
+        page=i // 25 + 1,
+        index=i % 25,
+        content=TextStringObject(f"Please check the wording of paragraph {i % 40}"),
+        author=TextStringObject(AUTHORS[i % len(AUTHORS)]),
+        date=TextStringObject("D:20250101120000Z"),
+        type=NameObject(TYPES[i % len(TYPES)]),
+    )
+
+
+def measure(count, build):
+    tracemalloc.start()
+    records = [build(raw_values(i)) for i in range(count)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--comments', type=int, default=1000000)
+    args = parser.parse_args()
+
+    as_dicts = measure(args.comments, dict)
+    as_records = measure(args.comments, lambda values: Comment(**values))
+
+    print(f"{args.comments} comments")
+    print(f"  dicts of pypdf objects : {as_dicts / 2**20:8.1f} MiB ({as_dicts / args.comments:.0f} B/comment)")
+    print(f"  Comment records        : {as_records / 2**20:8.1f} MiB ({as_records / args.comments:.0f} B/comment)"
+          f"  ({1 - as_records / as_dicts:.0%} less)")
+
+
+if __name__ == '__main__':
+    main()
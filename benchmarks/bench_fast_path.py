@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Compare the default page walk with the annotation-only fast path
+
+Generates an annotation-sparse document (one sticky note every N pages by
+default) and times extract_comments with fast=False and fast=True.
+
+Usage:
+    python benchmarks/bench_fast_path.py --pages 2000 --every 50
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pdf_comment_viewer'))
+
+from pypdf import PdfWriter
+from pypdf.annotations import Text
+
+from pdf_processor import extract_comments
+
+
+def write_sparse_pdf(path, pages, every):
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=612, height=792)
+    for page_index in range(0, pages, every):
+        writer.add_annotation(
+            page_number=page_index,
+            annotation=Text(text=f"Note {page_index + 1}", rect=(50, 700, 70, 720))
+        )
+    with open(path, 'wb') as f:
+        writer.write(f)
+
+
+def best_of(repeat, func):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=2000)
+    parser.add_argument('--every', type=int, default=50, help='Annotate one page in this many')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'sparse.pdf')
+        write_sparse_pdf(path, args.pages, args.every)
+
+        default_time, default_comments = best_of(args.repeat, lambda: extract_comments(path))
+        fast_time, fast_comments = best_of(args.repeat, lambda: extract_comments(path, fast=True))
+
+    assert default_comments == fast_comments, "fast path returned different comments"
+
+    print(f"{args.pages} pages, {len(fast_comments)} comments (best of {args.repeat})")
+    print(f"  reader.pages : {default_time * 1000:8.1f} ms")
+    print(f"  fast         : {fast_time * 1000:8.1f} ms  ({default_time / fast_time:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Time the comment list filters used by the viewer's search box
+
+Builds a model of synthetic comments (100k by default) and times loading it
+and applying each kind of filter, including typing a search term one
+character at a time, which the viewer must keep under 50 ms per keystroke.
+
+Usage:
+    python benchmarks/bench_filter.py --comments 100000
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pdf_comment_viewer'))
+
+from comment_model import CommentModel, CommentFilter
+
+WORDS = "figure table typo reference unclear wording citation missing results section method".split()
+
+
+def make_comments(count, seed=0):
+    rng = random.Random(seed)
+    authors = [f"Reviewer {i}" for i in range(25)]
+    types = ['/Text', '/Highlight', '/Underline', '/FreeText', '/StrikeOut']
+    return [
+        {
+            'page': i // 20 + 1,
+            'index': i % 20,
+            'content': ' '.join(rng.choice(WORDS) for _ in range(12)),
+            'author': rng.choice(authors),
+            'date': '',
+            'type': rng.choice(types)
+        }
+        for i in range(count)
+    ]
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--comments', type=int, default=100000)
+    args = parser.parse_args()
+
+    comments = make_comments(args.comments)
+    model = CommentModel()
+
+    print(f"{args.comments} comments")
+    print(f"  load                : {timed(lambda: model.set_comments(comments)):8.1f} ms")
+
+    worst = 0.0
+    term = "citation"
+    for length in range(1, len(term) + 1):
+        worst = max(worst, timed(lambda: model.apply(CommentFilter(text=term[:length]))))
+    print(f"  typing '{term}'   : {worst:8.1f} ms worst keystroke, {len(model)} rows")
+
+    for label, comment_filter in [
+        ("author", CommentFilter(author="Reviewer 3")),
+        ("type", CommentFilter(type="Highlight")),
+        ("page range", CommentFilter(pages=(100, 2000))),
+        ("all combined", CommentFilter(author="Reviewer 3", type="Highlight", pages=(100, 2000), text="table")),
+        ("cleared", CommentFilter()),
+    ]:
+        elapsed = timed(lambda: model.apply(comment_filter))
+        print(f"  {label:<20}: {elapsed:8.1f} ms, {len(model)} rows")
+
+
+if __name__ == '__main__':
+    main()
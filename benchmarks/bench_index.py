@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Time search index queries over a large synthetic comment corpus
+
+Fills a fresh index with --files documents of --comments comments each
+(records are generated directly, nothing is parsed) and times a set of
+typical queries.
+
+Usage:
+    python benchmarks/bench_index.py --files 1000 --comments 1000
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pdf_comment_viewer'))
+
+from comment_index import CommentIndex
+
+WORDS = (
+    "please check wording figure table reference missing unclear typo section results tolerance "
+    "dimension drawing revise approved rejected clarify spec weld bolt torque clearance"
+).split()
+# A long tail of rare words, so term frequencies look like real text
+RARE = [f"term{i}" for i in range(5000)]
+AUTHORS = [f"{first} {last}" for first in "AJKMRS" for last in ("Smith", "Jones", "Lee", "Patel", "Garcia")]
+
+QUERIES = (
+    ('common word', dict(text='please')),
+    ('two words', dict(text='tolerance weld')),
+    ('rare word', dict(text='term4242')),
+    ('prefix', dict(text='toler*')),
+    ('word + author', dict(text='tolerance', author='J. Smith')),
+    ('word + author + dates', dict(text='tolerance', author='J. Smith', since='2024-01', until='2024-03')),
+    ('author only', dict(author='R. Patel')),
+)
+
+
+def make_records(rng, count):
+    records = []
+    for i in range(count):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(3, 15))] + [rng.choice(RARE)]
+        rng.shuffle(words)
+        first, last = rng.choice(AUTHORS).split()
+        records.append({
+            'id': i + 10,
+            'page': i // 5 + 1,
+            'index': i % 5,
+            'content': ' '.join(words).capitalize(),
+            'author': f"{first}. {last}",
+            'date': f"D:2024{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}120000",
+            'type': rng.choice(('/Text', '/Highlight', '/FreeText')),
+        })
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', type=int, default=1000)
+    parser.add_argument('--comments', type=int, default=1000, help='Comments per file')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        index = CommentIndex(os.path.join(tmp, 'index.sqlite3'))
+
+        start = time.perf_counter()
+        for n in range(args.files):
+            # put() records the file's size and modification time
+            path = os.path.join(tmp, f'doc{n}.pdf')
+            with open(path, 'wb') as f:
+                f.write(b'%PDF-1.4\n')
+            index.put(path, make_records(rng, args.comments))
+        elapsed = time.perf_counter() - start
+        files, comments = index.summary()
+        size = os.path.getsize(index.path) / 2**20
+        print(f"Indexed {comments} comments from {files} files in {elapsed:.1f}s ({size:.0f} MiB)")
+
+        for name, query in QUERIES:
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                results = index.search(limit=50, **query)
+                timings.append(time.perf_counter() - start)
+            print(f"  {name:<22} {min(timings) * 1000:8.2f} ms  {len(results)} results")
+        index.close()
+
+
+if __name__ == '__main__':
+    main()
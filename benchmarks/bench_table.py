@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Time the columnar comment table at report scale
+
+Builds a CommentTable of --rows synthetic comments (1M by default) with
+dated records, then times filtering, sorting and each grouping used by the
+report command. Runs with NumPy when it is installed; --no-numpy times the
+plain Python fallback instead.
+
+Usage:
+    python benchmarks/bench_table.py --rows 1000000
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pdf_comment_viewer'))
+
+import comment_table
+from comment_table import CommentTable, date_bound
+
+WORDS = "figure table typo reference unclear wording citation missing results section method".split()
+
+
+def make_records(count, seed=0):
+    rng = random.Random(seed)
+    authors = [f"Reviewer {i}" for i in range(50)]
+    types = ['/Text', '/Highlight', '/Underline', '/FreeText', '/StrikeOut']
+    return [
+        {
+            'page': i // 20 + 1,
+            'index': i % 20,
+            'content': ' '.join(rng.choice(WORDS) for _ in range(8)),
+            'author': rng.choice(authors),
+            'date': f"D:2024{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}{rng.randint(0, 23):02d}"
+                    f"{rng.randint(0, 59):02d}{rng.randint(0, 59):02d}+01'00'",
+            'type': rng.choice(types),
+        }
+        for i in range(count)
+    ]
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    print(f"  {label:<24}: {(time.perf_counter() - start) * 1000:9.1f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--no-numpy', action='store_true', help='Time the pure Python fallback')
+    args = parser.parse_args()
+    if args.no_numpy:
+        comment_table.np = None
+
+    records = make_records(args.rows)
+    print(f"{args.rows} comments, {'NumPy' if comment_table.np is not None else 'pure Python'}")
+    table = timed("build (with dates)", lambda: CommentTable(records, file='bench.pdf'))
+    timed("parse dates only", lambda: comment_table.parse_pdf_dates([r['date'] for r in records]))
+
+    rows = timed("filter author", lambda: table.filter(author='Reviewer 7'))
+    timed("filter type + pages", lambda: table.filter(type='Highlight', pages=(100, 20000)))
+    timed("filter date range", lambda: table.filter(since=date_bound('2024-03'), until=date_bound('2024-05', end=True)))
+    timed("filter text", lambda: table.filter(text='citation'))
+    timed("sort all by date", lambda: table.sort(by='date'))
+    timed("sort all by author", lambda: table.sort(by='author'))
+    for by in ('author', 'type', 'pages', 'week', 'month'):
+        timed(f"count by {by}", lambda: table.counts(by))
+    timed("count by week (1 author)", lambda: table.counts('week', rows))
+
+
+if __name__ == '__main__':
+    main()
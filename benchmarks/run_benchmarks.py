@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Time every extraction path against a set of synthetic documents
+
+Each scenario is generated once with benchmarks/synthetic.py, then every
+parser is timed (best of --repeat) and its peak Python memory measured in a
+separate run under tracemalloc, so tracing doesn't skew the timings. Comment
+counts are checked against what the generator wrote.
+
+Results can be saved with --output and compared with a previous run with
+--baseline, which exits with status 1 when any path got slower or used more
+memory by more than --threshold.
+
+Usage:
+    python benchmarks/run_benchmarks.py --quick
+    python benchmarks/run_benchmarks.py --output before.json
+    python benchmarks/run_benchmarks.py --baseline before.json --threshold 0.1
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pdf_comment_viewer'))
+
+import pypdf
+
+from synthetic import generate_pdf
+from pdf_processor import extract_comments
+from alternate_parser import clear_index_cache, extract_comments_alternate, parse_pdf_manually
+
+# name: generate_pdf arguments
+SCENARIOS = {
+    'dense': dict(pages=200, annots_per_page=5, popup_ratio=0.3),
+    'sparse': dict(pages=2000, annots_per_page=0.05),
+    'popups': dict(pages=200, annots_per_page=3, popup_ratio=1.0),
+    'threads': dict(pages=200, annots_per_page=3, reply_ratio=0.8),
+    'encrypted': dict(pages=200, annots_per_page=2, encrypt=True),
+    'objstm': dict(pages=500, annots_per_page=2, object_streams=True),
+    'incremental': dict(pages=200, annots_per_page=2, incremental_updates=20),
+}
+
+# Differences smaller than these are noise, whatever the relative change
+MIN_SECONDS = 0.005
+MIN_BYTES = 64 * 1024
+
+
+def _raw(path):
+    # The object index is cached per file, drop it so every run parses the xref
+    clear_index_cache()
+    return parse_pdf_manually(path)
+
+
+def available_paths():
+    paths = {
+        'pypdf': lambda path: extract_comments(path),
+        'pypdf-fast': lambda path: extract_comments(path, fast=True),
+        'raw': _raw,
+    }
+    try:
+        import fitz  # noqa: F401
+        paths['pymupdf'] = extract_comments_alternate
+    except ImportError:
+        pass
+    return paths
+
+
+def measure(func, path, repeat):
+    """Return (best seconds, peak traced bytes, comment count) for one path"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        comments = func(path)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        func(path)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(timings), peak, len(comments)
+
+
+def run(scenarios, paths, repeat, scale):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, options in scenarios.items():
+            options = dict(options, pages=max(1, options['pages'] // scale))
+            path = os.path.join(tmp, f'{name}.pdf')
+            expected = generate_pdf(path, **options)
+            print(f"{name}: {options['pages']} pages, {expected} comments, "
+                  f"{os.path.getsize(path) / 1024:.0f} KiB")
+
+            for path_name, func in paths.items():
+                try:
+                    seconds, peak, count = measure(func, path, repeat)
+                except Exception as e:
+                    print(f"  {path_name:<11} failed: {e}")
+                    continue
+                note = '' if count == expected else f'  (expected {expected} comments, got {count})'
+                print(f"  {path_name:<11} {seconds * 1000:9.1f} ms {peak / 2**20:9.1f} MiB{note}")
+                results.append({
+                    'scenario': name,
+                    'path': path_name,
+                    'seconds': seconds,
+                    'peak_bytes': peak,
+                    'comments': count,
+                    'expected': expected,
+                })
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Print regressions against a baseline run
+
+    Returns:
+        bool: Whether anything regressed
+    """
+    previous = {(r['scenario'], r['path']): r for r in baseline['results']}
+    regressed = False
+    for result in results:
+        before = previous.get((result['scenario'], result['path']))
+        if before is None:
+            continue
+        for key, floor, unit, div in (('seconds', MIN_SECONDS, 'ms', 1e-3), ('peak_bytes', MIN_BYTES, 'MiB', 2**20)):
+            old, new = before[key], result[key]
+            if new - old > max(old * threshold, floor):
+                regressed = True
+                print(f"REGRESSION {result['scenario']}/{result['path']} {key}: "
+                      f"{old / div:.1f} -> {new / div:.1f} {unit} (+{(new / old - 1) * 100 if old else 0:.0f}%)")
+        if result['comments'] != before['comments']:
+            print(f"CHANGED {result['scenario']}/{result['path']} comments: "
+                  f"{before['comments']} -> {result['comments']}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='Run only this scenario (repeatable)')
+    parser.add_argument('--path', action='append', help='Run only this extraction path (repeatable)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--quick', action='store_true', help='Use documents a tenth of the size')
+    parser.add_argument('-o', '--output', help='Write results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against results saved with --output')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative slowdown or memory growth counted as a regression (default: 0.2)')
+    args = parser.parse_args()
+
+    # The parsers log every page at INFO
+    logging.getLogger().setLevel(logging.WARNING)
+
+    scenarios = {name: SCENARIOS[name] for name in (args.scenario or SCENARIOS)}
+    paths = available_paths()
+    if args.path:
+        unknown = set(args.path) - set(paths)
+        if unknown:
+            parser.error(f"unknown or unavailable path(s): {', '.join(sorted(unknown))}")
+        paths = {name: paths[name] for name in args.path}
+
+    results = run(scenarios, paths, args.repeat, 10 if args.quick else 1)
+
+    if args.output:
+        report = {
+            'meta': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'pypdf': pypdf.__version__,
+                'quick': args.quick,
+                'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            },
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['meta'].get('quick') != args.quick:
+            print("warning: baseline was run with a different --quick setting")
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+        print("No regressions")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+"""
+Generate annotated PDFs with a known number of comments for benchmarks
+
+The base document is written with pypdf. Object streams are added by
+repacking that file, since pypdf cannot write them, and incremental
+updates are appended the way a PDF editor saving a new comment would.
+"""
+
+import io
+import zlib
+import random
+
+from pypdf import PdfReader, PdfWriter
+from pypdf.annotations import FreeText, Highlight, Link, Popup, Text
+from pypdf.generic import ArrayObject, FloatObject, IndirectObject, NameObject, StreamObject, TextStringObject
+
+# Objects packed into each object stream by repack_object_streams
+OBJECTS_PER_STREAM = 200
+
+WORDS = "please check wording figure table reference missing unclear typo section results".split()
+
+
+def _sentence(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 12))).capitalize()
+
+
+def _add_replies(writer, page_index, note, reply_ratio, rng, x, y):
+    """
+    Answer a note with a reply chain, returning the number of replies
+
+    Each reply is itself answered with probability reply_ratio, so chains
+    get geometrically rarer with depth.
+    """
+    replies = 0
+    parent = note
+    while rng.random() < reply_ratio:
+        reply = Text(text=_sentence(rng), rect=(x, y, x + 20, y + 20))
+        reply[NameObject('/T')] = TextStringObject(f"Reviewer {rng.randint(1, 12)}")
+        reply[NameObject('/IRT')] = parent.indirect_reference
+        parent = writer.add_annotation(page_index, reply)
+        replies += 1
+    return replies
+
+
+def _add_annotations(writer, page_index, count, popup_ratio, rng, reply_ratio=0.0):
+    """Add count annotations to a page, returning how many are comments"""
+    comments = 0
+    for i in range(count):
+        x, y = 50 + (i % 5) * 100, 700 - (i // 5) * 40
+        kind = rng.random()
+        author = TextStringObject(f"Reviewer {rng.randint(1, 12)}")
+
+        if kind < 0.5:
+            if rng.random() < popup_ratio:
+                # Contents only on the popup, as some editors write them
+                note = writer.add_annotation(page_index, Text(text="", rect=(x, y, x + 20, y + 20)))
+                note[NameObject('/T')] = author
+                popup = Popup(rect=(x + 30, y - 80, x + 200, y), parent=note)
+                popup[NameObject('/Contents')] = TextStringObject(_sentence(rng))
+                writer.add_annotation(page_index, popup)
+            else:
+                note = Text(text=_sentence(rng), rect=(x, y, x + 20, y + 20))
+                note[NameObject('/T')] = author
+                note = writer.add_annotation(page_index, note)
+            comments += 1 + _add_replies(writer, page_index, note, reply_ratio, rng, x, y)
+        elif kind < 0.8:
+            quad = ArrayObject([FloatObject(v) for v in (x, y + 20, x + 90, y + 20, x, y, x + 90, y)])
+            highlight = Highlight(rect=(x, y, x + 90, y + 20), quad_points=quad)
+            highlight[NameObject('/T')] = author
+            writer.add_annotation(page_index, highlight)
+            comments += 1
+        elif kind < 0.9:
+            free_text = FreeText(text=_sentence(rng), rect=(x, y, x + 90, y + 30))
+            free_text[NameObject('/T')] = author
+            writer.add_annotation(page_index, free_text)
+            comments += 1
+        else:
+            # Not a comment, must be skipped by every parser
+            writer.add_annotation(page_index, Link(rect=(x, y, x + 90, y + 20), url="https://example.com"))
+    return comments
+
+
+def repack_object_streams(path):
+    """
+    Rewrite a PDF so every non-stream object lives in a compressed object stream
+
+    Stream objects stay top-level, as the specification requires, and the
+    cross-reference table becomes a compressed xref stream.
+    """
+    reader = PdfReader(path)
+    numbers = sorted(num for num, _ in reader.xref[0].items())
+
+    out = bytearray(b"%PDF-1.5\n%\xe2\xe3\xcf\xd3\n")
+    rows = {0: (0, 0, 65535)}
+    packed = []
+    for num in numbers:
+        obj = reader.get_object(num)
+        if isinstance(obj, StreamObject):
+            rows[num] = (1, len(out), 0)
+            data = io.BytesIO()
+            obj.write_to_stream(data)
+            out += b"%d 0 obj\n" % num + data.getvalue() + b"\nendobj\n"
+        else:
+            packed.append((num, obj))
+
+    next_num = max(numbers) + 1
+    for start in range(0, len(packed), OBJECTS_PER_STREAM):
+        chunk = packed[start:start + OBJECTS_PER_STREAM]
+        header, body = [], b""
+        for i, (num, obj) in enumerate(chunk):
+            rows[num] = (2, next_num, i)
+            header.append(b"%d %d" % (num, len(body)))
+            data = io.BytesIO()
+            obj.write_to_stream(data)
+            body += data.getvalue() + b"\n"
+        header = b" ".join(header) + b"\n"
+        stream = zlib.compress(header + body)
+        rows[next_num] = (1, len(out), 0)
+        out += b"%d 0 obj\n<< /Type /ObjStm /N %d /First %d /Filter /FlateDecode /Length %d >>\nstream\n" % (
+            next_num, len(chunk), len(header), len(stream))
+        out += stream + b"\nendstream\nendobj\n"
+        next_num += 1
+
+    xref_num = next_num
+    rows[xref_num] = (1, len(out), 0)
+    table = b"".join(
+        bytes([kind]) + field.to_bytes(4, "big") + gen.to_bytes(2, "big")
+        for kind, field, gen in (rows.get(num, (0, 0, 0)) for num in range(xref_num + 1))
+    )
+    data = zlib.compress(table)
+    trailer = io.BytesIO()
+    for key in ('/Root', '/Info', '/ID'):
+        if key in reader.trailer:
+            trailer.write(key.encode() + b" ")
+            reader.trailer.raw_get(key).write_to_stream(trailer)
+            trailer.write(b" ")
+    xref_offset = len(out)
+    out += b"%d 0 obj\n<< /Type /XRef /Size %d /W [1 4 2] %s/Filter /FlateDecode /Length %d >>\nstream\n" % (
+        xref_num, xref_num + 1, trailer.getvalue(), len(data))
+    out += data + b"\nendstream\nendobj\nstartxref\n%d\n%%%%EOF\n" % xref_offset
+
+    with open(path, "wb") as f:
+        f.write(bytes(out))
+
+
+def append_incremental_update(path, rng):
+    """
+    Add one sticky note to a random page with an incremental save
+
+    The rewritten page and the new note are appended with their own xref
+    section and a trailer pointing back to the previous one. pypdf's own
+    incremental writer reuses the numbers of earlier xref stream objects
+    for new objects, which its reader then resolves to the wrong object.
+    """
+    with open(path, "rb") as f:
+        out = bytearray(f.read())
+    startxref = int(out[out.rindex(b"startxref") + 9:].split()[0])
+    if not out.endswith(b"\n"):
+        out += b"\n"
+
+    reader = PdfReader(io.BytesIO(bytes(out)))
+    size = int(reader.trailer['/Size'])
+    page = reader.pages[rng.randrange(len(reader.pages))]
+    page_num = page.indirect_reference.idnum
+
+    note = Text(text=_sentence(rng), rect=(20, 20, 40, 40))
+    note[NameObject('/T')] = TextStringObject("Late reviewer")
+    note[NameObject('/P')] = page.indirect_reference
+    annots = page.get('/Annots')
+    annots = list(annots.get_object()) if annots is not None else []
+    page[NameObject('/Annots')] = ArrayObject(annots + [IndirectObject(size, 0, reader)])
+
+    offsets = {}
+    for num, obj in ((page_num, page), (size, note)):
+        offsets[num] = len(out)
+        data = io.BytesIO()
+        obj.write_to_stream(data)
+        out += b"%d 0 obj\n" % num + data.getvalue() + b"\nendobj\n"
+
+    xref_offset = len(out)
+    out += b"xref\n"
+    for num in sorted(offsets):
+        out += b"%d 1\n%010d 00000 n \n" % (num, offsets[num])
+    root = reader.trailer.raw_get('/Root')
+    out += b"trailer\n<< /Size %d /Root %d %d R /Prev %d >>\nstartxref\n%d\n%%%%EOF\n" % (
+        size + 1, root.idnum, root.generation, startxref, xref_offset)
+    with open(path, "wb") as f:
+        f.write(bytes(out))
+
+
+def generate_pdf(path, pages=100, annots_per_page=2.0, popup_ratio=0.0, encrypt=False,
+                 object_streams=False, incremental_updates=0, seed=0, reply_ratio=0.0):
+    """
+    Write a synthetic annotated PDF
+
+    Args:
+        path (str): Output file
+        pages (int): Number of pages
+        annots_per_page (float): Average annotations per page; fractions put
+            one more annotation on that share of pages (0.02 annotates about
+            one page in fifty)
+        popup_ratio (float): Share of sticky notes whose text is only on a
+            /Popup annotation
+        encrypt (bool): Encrypt with an empty user password
+        object_streams (bool): Pack objects into compressed object streams
+        incremental_updates (int): Number of incremental saves appended, each
+            adding one sticky note
+        seed (int): Random seed, the same arguments always give the same file
+        reply_ratio (float): Chance that a sticky note, and then each reply to
+            it, is answered with a reply (/IRT); replies are not counted in
+            annots_per_page
+
+    Returns:
+        int: Number of comments the document contains
+    """
+    if encrypt and (object_streams or incremental_updates):
+        raise ValueError("encrypted documents cannot be repacked or incrementally updated")
+
+    rng = random.Random(seed)
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=612, height=792)
+
+    whole, fraction = divmod(annots_per_page, 1)
+    comments = 0
+    for page_index in range(pages):
+        count = int(whole) + (1 if rng.random() < fraction else 0)
+        comments += _add_annotations(writer, page_index, count, popup_ratio, rng, reply_ratio)
+
+    if encrypt:
+        writer.encrypt(user_password="", owner_password="owner", algorithm="RC4-128")
+    with open(path, "wb") as f:
+        writer.write(f)
+
+    if object_streams:
+        repack_object_streams(path)
+
+    for _ in range(incremental_updates):
+        append_incremental_update(path, rng)
+    return comments + incremental_updates
@@ -1,62 +1,1130 @@
+import os
 import re
+import mmap
+import zlib
 import logging
+import threading
+from collections import OrderedDict, deque, namedtuple
+
+from comment import Comment, annotation_key
 
 logger = logging.getLogger(__name__)
 
-def parse_pdf_manually(pdf_file_path):
+# Supported annotation subtypes
+COMMENT_SUBTYPES = frozenset([
+    '/Text', '/FreeText', '/Highlight', '/Underline',
+    '/Squiggly', '/StrikeOut', '/Stamp', '/Caret',
+    '/Ink', '/Square', '/Circle', '/Polygon', '/PolyLine', '/Line',
+    '/FileAttachment', '/Sound', '/Note'
+])
+
+# Text markup annotations, which are kept even without any contents
+MARKUP_SUBTYPES = frozenset(['/Highlight', '/Underline', '/StrikeOut', '/Squiggly'])
+
+# /T (author) and /Contents entries with a literal string value, matched in a
+# single pass. Escaped characters inside the string are allowed.
+FIELD_PATTERN = re.compile(rb'/(Contents|T)\s*\(((?:\\.|[^\\)])*)\)', re.DOTALL)
+
+# How far before a /Contents entry an author may appear to be attributed to it
+AUTHOR_WINDOW = 200
+
+# Number of object indexes kept for reuse across queries on the same files
+INDEX_CACHE_SIZE = 16
+
+# Upper bound on the decompressed size of one stream, and on the total size
+# of decompressed object streams a RawDocument keeps around at once
+MAX_STREAM_BYTES = 64 * 1024 * 1024
+
+# Compressed bytes fed to zlib per step while inflating a stream
+INFLATE_CHUNK = 64 * 1024
+
+# How far into a file its %PDF- header may start, and how much of its end is
+# searched for a trailer that cannot be parsed
+HEADER_WINDOW = 1024
+TRAILER_WINDOW = 64 * 1024
+
+# Most xref sections (revisions) sniff() follows back from the newest
+SNIFF_SECTIONS = 64
+
+
+class PdfSyntaxError(ValueError):
+    """Raised when the raw parser meets bytes it cannot make sense of"""
+
+
+# An indirect reference ("12 0 R")
+Ref = namedtuple('Ref', ['num', 'gen'])
+
+# What sniff() learns about a file without parsing it
+PdfTraits = namedtuple('PdfTraits', ['version', 'encrypted', 'xref_stream', 'object_streams'])
+
+# Assumed for files without a %PDF- header near the start, which pypdf still
+# reads when the header comes after junk such as a mail or HTTP preamble
+UNKNOWN_TRAITS = PdfTraits(None, False, False, False)
+
+_WS = rb'[\x00\t\n\x0c\r ]'
+_WHITESPACE_RE = re.compile(rb'(?:' + _WS + rb'+|%[^\r\n]*)*')
+_NAME_RE = re.compile(rb'/([^\x00\t\n\x0c\r ()<>\[\]{}/%]*)')
+_NAME_ESCAPE_RE = re.compile(rb'#([0-9A-Fa-f]{2})')
+_NUMBER_RE = re.compile(rb'[+-]?(?:\d+\.?\d*|\.\d+)')
+_REF_RE = re.compile(rb'(\d+)' + _WS + rb'+(\d+)' + _WS + rb'+R(?![A-Za-z])')
+_KEYWORD_RE = re.compile(rb'(true|false|null)(?![A-Za-z])')
+_HEX_RE = re.compile(rb'<([0-9A-Fa-f\x00\t\n\x0c\r ]*)>')
+_STRING_SPECIAL_RE = re.compile(rb'[()\\]')
+_STRING_ESCAPE_RE = re.compile(rb'\\([0-7]{1,3}|\r\n|[\r\n]|.)', re.DOTALL)
+_STRING_ESCAPES = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f'}
+
+# Where PDFDocEncoding, used by text strings without a byte order mark, differs
+# from latin-1: accents at 0x18-0x1f and typographic punctuation at 0x80-0xa0
+_PDFDOC_TRANSLATION = {
+    **dict(zip(range(0x18, 0x20), '\u02d8\u02c7\u02c6\u02d9\u02dd\u02db\u02da\u02dc')),
+    **dict(zip(range(0x80, 0x9f), '\u2022\u2020\u2021\u2026\u2014\u2013\u0192\u2044\u2039\u203a\u2212\u2030'
+                                  '\u201e\u201c\u201d\u2018\u2019\u201a\u2122\ufb01\ufb02\u0141\u0152\u0160'
+                                  '\u0178\u017d\u0131\u0142\u0153\u0161\u017e')),
+    0xa0: '\u20ac',
+}
+
+_OBJ_HEADER_RE = re.compile(rb'(\d+)' + _WS + rb'+(\d+)' + _WS + rb'+obj(?![A-Za-z])')
+_OBJ_SCAN_RE = re.compile(
+    rb'(?<![0-9])(\d+)' + _WS + rb'+(\d+)' + _WS + rb'+obj(?![A-Za-z])|endobj'
+    rb'|/Type' + _WS + rb'*/(ObjStm|XRef)(?![A-Za-z])'
+)
+_STARTXREF_RE = re.compile(rb'startxref' + _WS + rb'+(\d+)')
+_XREF_SUBSECTION_RE = re.compile(rb'(\d+)' + _WS + rb'+(\d+)')
+_XREF_ENTRY_RE = re.compile(rb'(\d{10})' + _WS + rb'(\d{5})' + _WS + rb'([nf])')
+
+
+def _skip_whitespace(buffer, pos):
+    return _WHITESPACE_RE.match(buffer, pos).end()
+
+def _unescape_literal(raw):
+    """Resolve the backslash escapes of a literal string"""
+    if b'\\' not in raw:
+        return raw
+    
+    def replace(match):
+        escape = match.group(1)
+        if 48 <= escape[0] <= 55:
+            return bytes([int(escape, 8) & 0xFF])
+        if escape in (b'\r\n', b'\r', b'\n'):
+            return b''
+        return _STRING_ESCAPES.get(escape, escape)
+    
+    return _STRING_ESCAPE_RE.sub(replace, raw)
+
+def _parse_literal(buffer, pos):
+    """Parse a literal string starting at the opening parenthesis"""
+    depth = 1
+    i = pos + 1
+    while True:
+        match = _STRING_SPECIAL_RE.search(buffer, i)
+        if not match:
+            raise PdfSyntaxError(f"Unterminated string at offset {pos}")
+        i = match.end()
+        char = match.group()
+        if char == b'\\':
+            i += 1
+        elif char == b'(':
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return _unescape_literal(buffer[pos + 1:match.start()]), i
+
+def parse_value(buffer, pos):
     """
-    Attempt to parse PDF comments using a lower-level approach
-    This is a fallback method for PDFs that don't work with pypdf
+    Parse one PDF object starting at pos
+    
+    Dictionaries become dicts keyed by '/Name' strings, arrays become lists,
+    strings become bytes, names become '/Name' strings and indirect
+    references become Ref tuples.
+    
+    Args:
+        buffer: bytes-like object (bytes or mmap)
+        pos (int): Offset to start parsing at
+        
+    Returns:
+        tuple: (value, offset just past the value)
+    """
+    pos = _skip_whitespace(buffer, pos)
+    lead = buffer[pos:pos + 2]
+    
+    if lead == b'<<':
+        result = {}
+        pos += 2
+        while True:
+            pos = _skip_whitespace(buffer, pos)
+            if buffer[pos:pos + 2] == b'>>':
+                return result, pos + 2
+            key = _NAME_RE.match(buffer, pos)
+            if not key:
+                raise PdfSyntaxError(f"Expected a name at offset {pos}")
+            value, pos = parse_value(buffer, key.end())
+            result[_decode_name(key.group(1))] = value
+    
+    first = lead[:1]
+    if first == b'[':
+        result = []
+        pos += 1
+        while True:
+            pos = _skip_whitespace(buffer, pos)
+            if buffer[pos:pos + 1] == b']':
+                return result, pos + 1
+            value, pos = parse_value(buffer, pos)
+            result.append(value)
+    
+    if first == b'/':
+        match = _NAME_RE.match(buffer, pos)
+        return _decode_name(match.group(1)), match.end()
+    
+    if first == b'(':
+        return _parse_literal(buffer, pos)
+    
+    if first == b'<':
+        match = _HEX_RE.match(buffer, pos)
+        if not match:
+            raise PdfSyntaxError(f"Malformed hex string at offset {pos}")
+        digits = re.sub(rb'[^0-9A-Fa-f]', b'', match.group(1))
+        if len(digits) % 2:
+            digits += b'0'
+        return bytes.fromhex(digits.decode('ascii')), match.end()
+    
+    match = _REF_RE.match(buffer, pos)
+    if match:
+        return Ref(int(match.group(1)), int(match.group(2))), match.end()
+    
+    match = _NUMBER_RE.match(buffer, pos)
+    if match:
+        token = match.group()
+        value = float(token) if b'.' in token else int(token)
+        return value, match.end()
+    
+    match = _KEYWORD_RE.match(buffer, pos)
+    if match:
+        return {b'true': True, b'false': False, b'null': None}[match.group(1)], match.end()
+    
+    raise PdfSyntaxError(f"Unexpected token {bytes(buffer[pos:pos + 10])!r} at offset {pos}")
+
+def _decode_name(raw):
+    if b'#' in raw:
+        raw = _NAME_ESCAPE_RE.sub(lambda m: bytes([int(m.group(1), 16)]), raw)
+    return '/' + raw.decode('latin-1')
+
+def decode_text(value):
+    """Convert a parsed PDF string (or other value) to text"""
+    if value is None:
+        return ''
+    if isinstance(value, bytes):
+        if value.startswith(b'\xfe\xff'):
+            return value[2:].decode('utf-16-be', errors='replace')
+        if value.startswith(b'\xef\xbb\xbf'):
+            return value[3:].decode('utf-8', errors='replace')
+        return value.decode('latin-1').translate(_PDFDOC_TRANSLATION)
+    return str(value)
+
+
+def _stream_data_start(buffer, pos):
+    """Return the offset of a stream's data if a stream keyword follows pos"""
+    pos = _skip_whitespace(buffer, pos)
+    if buffer[pos:pos + 6] != b'stream':
+        return None
+    pos += 6
+    if buffer[pos:pos + 2] == b'\r\n':
+        return pos + 2
+    if buffer[pos:pos + 1] in (b'\n', b'\r'):
+        return pos + 1
+    return pos
+
+def _inflate(buffer, start, end, max_output):
+    """
+    Inflate FlateDecode data from buffer[start:end] in bounded chunks
+    
+    Compressed input is sliced INFLATE_CHUNK bytes at a time and output
+    stops after max_output bytes, so neither side is ever held in full.
+    
+    Returns:
+        tuple: (decompressed bytes, whether the whole stream was inflated)
+    """
+    decompressor = zlib.decompressobj()
+    parts = []
+    produced = 0
+    pending = b''
+    pos = start
+    while produced < max_output:
+        if not pending:
+            if pos >= end:
+                break
+            pending = buffer[pos:min(pos + INFLATE_CHUNK, end)]
+            pos += len(pending)
+        data = decompressor.decompress(pending, max_output - produced)
+        pending = decompressor.unconsumed_tail
+        parts.append(data)
+        produced += len(data)
+        if decompressor.eof:
+            return b''.join(parts), True
+    complete = produced < max_output or (not pending and pos >= end)
+    return b''.join(parts), complete
+
+def _apply_predictor(data, params):
+    """Undo a PNG predictor (as used by xref streams) described by /DecodeParms"""
+    predictor = params.get('/Predictor', 1) if isinstance(params, dict) else 1
+    if predictor < 10:
+        if predictor != 1:
+            raise PdfSyntaxError(f"Unsupported predictor {predictor}")
+        return data
+    
+    bits_per_pixel = params.get('/Colors', 1) * params.get('/BitsPerComponent', 8)
+    bpp = max(1, bits_per_pixel // 8)
+    row_length = (bits_per_pixel * params.get('/Columns', 1) + 7) // 8
+    output = bytearray()
+    previous = bytearray(row_length)
+    for row_start in range(0, len(data), row_length + 1):
+        kind = data[row_start]
+        row = bytearray(data[row_start + 1:row_start + 1 + row_length])
+        for i in range(len(row)):
+            left = row[i - bpp] if i >= bpp else 0
+            up = previous[i]
+            if kind == 1:
+                row[i] = (row[i] + left) & 0xFF
+            elif kind == 2:
+                row[i] = (row[i] + up) & 0xFF
+            elif kind == 3:
+                row[i] = (row[i] + ((left + up) >> 1)) & 0xFF
+            elif kind == 4:
+                upper_left = previous[i - bpp] if i >= bpp else 0
+                estimate = left + up - upper_left
+                distances = (abs(estimate - left), abs(estimate - up), abs(estimate - upper_left))
+                nearest = (left, up, upper_left)[distances.index(min(distances))]
+                row[i] = (row[i] + nearest) & 0xFF
+        output += row
+        previous = row
+    return bytes(output)
+
+def decode_stream(buffer, stream_dict, data_start, length=None, max_output=MAX_STREAM_BYTES):
+    """
+    Return the decoded data of a stream, up to max_output bytes
+    
+    Only unfiltered and FlateDecode streams are supported. When length is
+    not known the data is assumed to end at the next endstream keyword.
+    
+    Returns:
+        tuple: (decoded bytes, whether the whole stream was decoded)
+    """
+    if isinstance(length, int) and length >= 0:
+        end = min(data_start + length, len(buffer))
+    else:
+        end = buffer.find(b'endstream', data_start)
+        end = len(buffer) if end == -1 else end
+    
+    filters = stream_dict.get('/Filter')
+    if isinstance(filters, str):
+        filters = [filters]
+    params = stream_dict.get('/DecodeParms')
+    if isinstance(params, list):
+        params = params[0] if params else None
+    
+    if not filters:
+        data = buffer[data_start:min(end, data_start + max_output)]
+        return data, end - data_start <= max_output
+    if filters != ['/FlateDecode']:
+        raise PdfSyntaxError(f"Unsupported stream filter {filters}")
+    
+    data, complete = _inflate(buffer, data_start, end, max_output)
+    if params:
+        data = _apply_predictor(data, params)
+    return data, complete
+
+
+class ObjectIndex:
+    """
+    Byte offsets of the indirect objects in a PDF
+    
+    The index is read from the xref tables or xref streams (following /Prev
+    into older sections) when present. If there are none, or they turn out to
+    point at the wrong place, the whole file is scanned once for "N G obj"
+    headers instead. The index holds no reference to the file itself, so it
+    can be kept and reused for as long as the file is unchanged.
+    
+    Objects stored inside compressed object streams (/ObjStm) are listed in
+    compressed. A rebuild scan cannot see into those streams, so it only
+    records the streams in pending_streams; RawDocument reads their headers
+    lazily when it looks for an object that hasn't been located yet. Cached
+    indexes are shared by every reader of the file, so those reads hold lock.
+    
+    Attributes:
+        offsets (dict): Object number -> (generation, byte offset of "N G obj")
+        compressed (dict): Object number -> (object stream number, index in stream)
+        pending_streams (deque): Object streams whose headers haven't been read
+        trailer (dict): Merged trailer dictionary, newest entries first
+        rebuilt (bool): Whether the index came from a full scan
+        lock (threading.RLock): Held while pending object streams are read
+    """
+    
+    def __init__(self, offsets, trailer, rebuilt=False, compressed=None, pending_streams=()):
+        self.offsets = offsets
+        self.compressed = compressed if compressed is not None else {}
+        self.pending_streams = deque(pending_streams)
+        self.trailer = trailer
+        self.rebuilt = rebuilt
+        self.lock = threading.RLock()
+        self._spans = {}
+        self._replacement = None
+    
+    @classmethod
+    def build(cls, buffer):
+        """Build an index for buffer, from the xref sections when possible"""
+        try:
+            index = cls._from_xref(buffer)
+            if index is not None:
+                return index
+        except (PdfSyntaxError, ValueError, IndexError, KeyError, TypeError, zlib.error) as e:
+            logger.debug(f"Cross-reference table unusable, rebuilding: {str(e)}")
+        return cls._from_scan(buffer)
+    
+    @classmethod
+    def _from_xref(cls, buffer):
+        startxref = find_startxref(buffer)
+        if startxref is None:
+            return None
+        sections = read_xref_sections(buffer, startxref)
+        if sections is None:
+            return None
+        return cls.from_entries(*sections[:2])
+    
+    @classmethod
+    def from_entries(cls, entries, trailer):
+        """Create an index from the entries collected by read_xref_sections"""
+        offsets = {num: entry[1:] for num, entry in entries.items() if entry and entry[0] == 1}
+        compressed = {num: entry[1:] for num, entry in entries.items() if entry and entry[0] == 2}
+        return cls(offsets, trailer, compressed=compressed)
+    
+    @classmethod
+    def _from_scan(cls, buffer):
+        offsets = {}
+        spans = {}
+        object_streams = []
+        xref_stream = None
+        current = None
+        for match in _OBJ_SCAN_RE.finditer(buffer):
+            if match.group(3) is not None:
+                # A /Type entry inside the object that is currently open
+                if current is not None:
+                    if match.group(3) == b'ObjStm':
+                        object_streams.append(current)
+                    else:
+                        xref_stream = current
+                continue
+            if match.group(1) is None:
+                # endobj closes the object opened most recently
+                if current is not None:
+                    spans[current] = (offsets[current][1], match.start())
+                    current = None
+                continue
+            current = int(match.group(1))
+            # Later definitions come from incremental updates and win
+            offsets[current] = (int(match.group(2)), match.start())
+            spans.pop(current, None)
+        
+        trailer = {}
+        pos = buffer.rfind(b'trailer')
+        if pos != -1:
+            try:
+                value, _ = parse_value(buffer, pos + len(b'trailer'))
+                if isinstance(value, dict):
+                    trailer = value
+            except PdfSyntaxError:
+                pass
+        if not trailer and xref_stream is not None:
+            # Files with xref streams keep their trailer entries in the stream dict
+            header = _OBJ_HEADER_RE.match(buffer, offsets[xref_stream][1])
+            try:
+                value, _ = parse_value(buffer, header.end())
+                if isinstance(value, dict):
+                    trailer = {k: v for k, v in value.items() if k in ('/Root', '/Info', '/Encrypt', '/ID', '/Size')}
+            except PdfSyntaxError:
+                pass
+        
+        # Newest object streams first, matching the precedence of later definitions
+        object_streams = list(dict.fromkeys(num for num in reversed(object_streams) if num in offsets))
+        index = cls(offsets, trailer, rebuilt=True, pending_streams=object_streams)
+        index._spans = spans
+        return index
+    
+    def rebuild(self, buffer):
+        """
+        Return an index from a full scan, for when this one's offsets are wrong
+        
+        The scan runs once: the new index replaces this one in the index
+        cache, and readers still holding this one get the same new index.
+        """
+        with self.lock:
+            if self._replacement is None:
+                self._replacement = ObjectIndex._from_scan(buffer)
+                _replace_cached_index(self, self._replacement)
+            return self._replacement
+    
+    def span(self, buffer, num):
+        """
+        Return the (start, end) byte span of object num, or None
+        
+        The span runs from the "N G obj" header to just before "endobj".
+        """
+        span = self._spans.get(num)
+        if span is not None:
+            return span
+        entry = self.offsets.get(num)
+        if entry is None:
+            return None
+        start = entry[1]
+        end = buffer.find(b'endobj', start)
+        span = (start, end if end != -1 else len(buffer))
+        self._spans[num] = span
+        return span
+
+
+def find_startxref(buffer):
+    """Return the offset given by the last startxref keyword, or None"""
+    tail = buffer.rfind(b'startxref', max(0, len(buffer) - 2048))
+    if tail == -1:
+        return None
+    match = _STARTXREF_RE.match(buffer, tail)
+    return int(match.group(1)) if match else None
+
+def sniff(buffer):
+    """
+    Inspect a file's header and last trailer without indexing or parsing it
+    
+    Only the header and the trailer dictionaries of the xref sections are
+    read, so the cost depends on the number of revisions, not the file size.
+    
+    Args:
+        buffer: The file's contents (bytes or mmap)
+        
+    Returns:
+        PdfTraits: The PDF version, whether it has an /Encrypt dictionary,
+        whether its newest xref section is a stream, and whether it may
+        hold compressed object streams (only possible with xref streams).
+        None if there is no %PDF- header.
+    """
+    header = buffer.find(b'%PDF-', 0, HEADER_WINDOW)
+    if header == -1:
+        return None
+    version = bytes(buffer[header + 5:header + 8]).decode('latin-1', errors='replace')
+    
+    trailer = None
+    xref_stream = False
+    object_streams = False
+    offset = find_startxref(buffer)
+    seen = set()
+    # Earlier revisions may use xref streams even if the newest doesn't, so
+    # the /Prev chain is followed, reading only each section's dictionary
+    while offset is not None and offset < len(buffer) and offset not in seen and len(seen) < SNIFF_SECTIONS:
+        seen.add(offset)
+        pos = _skip_whitespace(buffer, offset)
+        section = None
+        try:
+            obj_header = _OBJ_HEADER_RE.match(buffer, pos)
+            if obj_header:
+                section, _ = parse_value(buffer, obj_header.end())
+            elif buffer[pos:pos + 4] == b'xref':
+                trailer_pos = buffer.find(b'trailer', pos)
+                if trailer_pos != -1:
+                    section, _ = parse_value(buffer, trailer_pos + 7)
+        except PdfSyntaxError:
+            section = None
+        if not isinstance(section, dict):
+            break
+        
+        if trailer is None:
+            trailer = section
+            xref_stream = obj_header is not None
+        object_streams = object_streams or obj_header is not None or '/XRefStm' in section
+        prev = section.get('/Prev')
+        offset = prev if isinstance(prev, int) else None
+    
+    if trailer is not None:
+        encrypted = '/Encrypt' in trailer
+    else:
+        tail = buffer[max(0, len(buffer) - TRAILER_WINDOW):]
+        encrypted = b'/Encrypt' in tail
+        object_streams = b'/XRef' in tail
+    return PdfTraits(version, encrypted, xref_stream, object_streams)
+
+def read_xref_sections(buffer, offset, stop_at=None):
+    """
+    Read the chain of xref sections starting at offset
+    
+    Each section is either a classic table or an xref stream, and /Prev
+    leads to the section of the previous revision. Newer entries win over
+    older ones. When stop_at is given, reading stops before the section at
+    that offset, which collects only the revisions appended after it.
+    
+    Args:
+        buffer: The file's contents (bytes or mmap)
+        offset (int): Offset of the newest section (from startxref)
+        stop_at (int): Offset of a section not to read
+        
+    Returns:
+        tuple: (entries, merged trailer, whether stop_at was reached), or
+        None if some offset does not hold an xref section. Entries map
+        object numbers to (1, generation, offset), (2, object stream number,
+        index) or None for free objects.
+    """
+    entries = {}
+    trailer = {}
+    seen = set()
+    while offset is not None and offset not in seen:
+        if offset == stop_at:
+            break
+        seen.add(offset)
+        section_trailer = _read_xref_table(buffer, offset, entries)
+        if section_trailer is None:
+            section_trailer = _read_xref_stream(buffer, offset, entries)
+        elif isinstance(section_trailer.get('/XRefStm'), int):
+            # Hybrid file: compressed objects are listed in a separate stream
+            _read_xref_stream(buffer, section_trailer['/XRefStm'], entries)
+        if section_trailer is None:
+            return None
+        for key, value in section_trailer.items():
+            trailer.setdefault(key, value)
+        prev = section_trailer.get('/Prev')
+        offset = prev if isinstance(prev, int) else None
+    
+    for key in ('/Prev', '/XRefStm', '/Type', '/W', '/Index', '/Filter', '/DecodeParms', '/Length'):
+        trailer.pop(key, None)
+    return entries, trailer, stop_at is not None and offset == stop_at
+
+def _read_xref_table(buffer, offset, entries):
+    """
+    Read one classic xref section into entries, keeping existing entries
+    
+    Entries are (1, generation, offset) for objects in use and None for free
+    objects. Returns the section's trailer dictionary, or None if there is no
+    xref table at offset.
+    """
+    pos = _skip_whitespace(buffer, offset)
+    if buffer[pos:pos + 4] != b'xref':
+        return None
+    pos += 4
+    
+    while True:
+        pos = _skip_whitespace(buffer, pos)
+        if buffer[pos:pos + 7] == b'trailer':
+            trailer, _ = parse_value(buffer, pos + 7)
+            return trailer if isinstance(trailer, dict) else {}
+        
+        header = _XREF_SUBSECTION_RE.match(buffer, pos)
+        if not header:
+            raise PdfSyntaxError(f"Malformed xref subsection at offset {pos}")
+        first, count = int(header.group(1)), int(header.group(2))
+        pos = header.end()
+        
+        for num in range(first, first + count):
+            pos = _skip_whitespace(buffer, pos)
+            entry = _XREF_ENTRY_RE.match(buffer, pos)
+            if not entry:
+                raise PdfSyntaxError(f"Malformed xref entry at offset {pos}")
+            pos = entry.end()
+            if num in entries:
+                continue
+            entry_offset = int(entry.group(1))
+            if entry.group(3) == b'n' and entry_offset:
+                entries[num] = (1, int(entry.group(2)), entry_offset)
+            else:
+                # Free entries hide any older definition of the object
+                entries[num] = None
+
+
+def _read_xref_stream(buffer, offset, entries):
+    """
+    Read one cross-reference stream into entries, keeping existing entries
+    
+    Besides the entries a classic table has, xref streams list objects that
+    live in object streams as (2, object stream number, index in stream).
+    Returns the stream dictionary, which doubles as the trailer, or None if
+    there is no xref stream at offset.
+    """
+    header = _OBJ_HEADER_RE.match(buffer, _skip_whitespace(buffer, offset))
+    if not header:
+        return None
+    stream_dict, pos = parse_value(buffer, header.end())
+    if not isinstance(stream_dict, dict) or stream_dict.get('/Type') != '/XRef':
+        return None
+    data_start = _stream_data_start(buffer, pos)
+    if data_start is None:
+        return None
+    
+    data, complete = decode_stream(buffer, stream_dict, data_start, stream_dict.get('/Length'))
+    if not complete:
+        raise PdfSyntaxError("Cross-reference stream exceeds the stream size limit")
+    
+    widths = stream_dict['/W']
+    row_length = sum(widths)
+    subsections = stream_dict.get('/Index', [0, stream_dict.get('/Size', 0)])
+    
+    row_start = 0
+    for first, count in zip(subsections[0::2], subsections[1::2]):
+        for num in range(first, first + count):
+            if row_start + row_length > len(data):
+                return stream_dict
+            fields = []
+            pos = row_start
+            for width in widths:
+                fields.append(int.from_bytes(data[pos:pos + width], 'big'))
+                pos += width
+            row_start += row_length
+            
+            # A zero-width type field means every entry is an in-use object
+            kind = fields[0] if widths[0] else 1
+            if num in entries:
+                continue
+            if kind == 1 and fields[1]:
+                entries[num] = (1, fields[2] if len(fields) > 2 else 0, fields[1])
+            elif kind == 2:
+                entries[num] = (2, fields[1], fields[2])
+            else:
+                entries[num] = None
+    
+    return stream_dict
+
+
+_index_cache = OrderedDict()
+_index_cache_lock = threading.Lock()
+
+def get_object_index(pdf_file_path, buffer):
+    """
+    Return the object index for a file, reusing a previous one if unchanged
+    
+    Indexes are cached by path, size and modification time, so repeated
+    queries against the same file skip the xref read or rebuild scan.
     
     Args:
         pdf_file_path (str): Path to the PDF file
+        buffer: The file's contents (bytes or mmap)
         
     Returns:
-        list: List of potential comments found
+        ObjectIndex: Index of the file's objects
     """
-    try:
+    stat = os.stat(pdf_file_path)
+    key = (os.path.realpath(pdf_file_path), stat.st_size, stat.st_mtime_ns)
+    
+    with _index_cache_lock:
+        index = _index_cache.get(key)
+        if index is not None:
+            _index_cache.move_to_end(key)
+            return index
+    
+    index = ObjectIndex.build(buffer)
+    
+    with _index_cache_lock:
+        _index_cache[key] = index
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
+
+
+def _replace_cached_index(old, new):
+    with _index_cache_lock:
+        for key, index in _index_cache.items():
+            if index is old:
+                _index_cache[key] = new
+
+
+def clear_index_cache():
+    """Forget all cached object indexes, so the next query rebuilds them"""
+    with _index_cache_lock:
+        _index_cache.clear()
+
+
+class RawDocument:
+    """
+    Resolves objects of a PDF through an ObjectIndex
+    
+    Parsed objects are memoized, so following the same reference twice
+    (for example a shared /Popup) costs a dict lookup. Objects inside object
+    streams are parsed from the decompressed stream, which is inflated on
+    first use and kept in a cache bounded by max_stream_bytes.
+    
+    Attributes:
+        inflated (set): Object streams that have been fully decompressed
+        source (str): Value of the 'source' field of comments (omitted if None)
+    """
+    
+    def __init__(self, buffer, index, max_stream_bytes=MAX_STREAM_BYTES, source='alternate_parser'):
+        self.buffer = buffer
+        self.index = index
+        self.max_stream_bytes = max_stream_bytes
+        self.source = source
+        self.inflated = set()
+        self._objects = {}
+        self._stream_starts = {}
+        self._object_streams = OrderedDict()
+        self._object_stream_bytes = 0
+    
+    @property
+    def resolved(self):
+        """Number of objects parsed so far"""
+        return len(self._objects)
+    
+    def get(self, num):
+        """Return the parsed value of object num, or None if it is unknown"""
+        if num in self._objects:
+            return self._objects[num]
+        
+        if num in self.index.offsets:
+            value = self._get_direct(num)
+        else:
+            location = self._locate_compressed(num)
+            value = self._get_compressed(num, *location) if location else None
+        
+        self._objects[num] = value
+        return value
+    
+    def _get_direct(self, num):
+        span = self.index.span(self.buffer, num)
+        header = _OBJ_HEADER_RE.match(self.buffer, span[0])
+        if header is None or int(header.group(1)) != num:
+            if self.index.rebuilt:
+                return None
+            # Stale or broken xref table, rebuild once and retry
+            logger.debug("xref offset of object %d is wrong, rebuilding index", num)
+            self.index = self.index.rebuild(self.buffer)
+            self._objects.clear()
+            self._stream_starts.clear()
+            return self.get(num)
+        
+        try:
+            value, pos = parse_value(self.buffer, header.end())
+        except PdfSyntaxError as e:
+            logger.debug("Could not parse object %d: %s", num, e)
+            return None
+        if isinstance(value, dict):
+            data_start = _stream_data_start(self.buffer, pos)
+            if data_start is not None:
+                self._stream_starts[num] = data_start
+        return value
+    
+    def _read_stream(self, num, max_output):
+        """Decode up to max_output bytes of stream object num"""
+        stream_dict = self.get(num)
+        data_start = self._stream_starts.get(num)
+        if not isinstance(stream_dict, dict) or data_start is None:
+            raise PdfSyntaxError(f"Object {num} is not a stream")
+        length = self.resolve(stream_dict.get('/Length'))
+        return decode_stream(self.buffer, stream_dict, data_start, length, max_output)
+    
+    def _object_stream_header(self, stream_num, data=None):
+        """Return the (object number, offset) pairs at the start of an object stream"""
+        stream_dict = self.get(stream_num)
+        count = stream_dict.get('/N', 0)
+        first = stream_dict.get('/First', 0)
+        if data is None:
+            # Only inflate as far as the header reaches
+            data, _ = self._read_stream(stream_num, first)
+        
+        numbers = [int(n) for n in re.findall(rb'\d+', data[:first])]
+        return list(zip(numbers[0:2 * count:2], numbers[1:2 * count:2])), first
+    
+    def _locate_compressed(self, num):
+        """
+        Find which object stream holds num
+        
+        With an index built by a rebuild scan, the headers of pending object
+        streams are read one at a time until one of them lists num. Objects
+        that were already located elsewhere are not registered again.
+        """
+        index = self.index
+        location = index.compressed.get(num)
+        if location is not None:
+            return location
+        
+        with index.lock:
+            location = index.compressed.get(num)
+            while location is None and index.pending_streams:
+                stream_num = index.pending_streams.popleft()
+                try:
+                    pairs, _ = self._object_stream_header(stream_num)
+                except (PdfSyntaxError, zlib.error, AttributeError) as e:
+                    logger.debug("Could not read object stream %d: %s", stream_num, e)
+                    continue
+                for i, (obj_num, _) in enumerate(pairs):
+                    if obj_num not in index.offsets and obj_num not in index.compressed:
+                        index.compressed[obj_num] = (stream_num, i)
+                location = index.compressed.get(num)
+        return location
+    
+    def locate_all(self):
+        """Read the headers of all pending object streams"""
+        while self.index.pending_streams:
+            # No object has a negative number, so every pending stream is read
+            self._locate_compressed(-1)
+    
+    def _object_stream(self, stream_num):
+        """Return (data, header pairs, first) for an object stream, inflating it if needed"""
+        cached = self._object_streams.get(stream_num)
+        if cached is not None:
+            self._object_streams.move_to_end(stream_num)
+            return cached
+        
+        data, complete = self._read_stream(stream_num, self.max_stream_bytes)
+        if not complete:
+            logger.warning(
+                f"Object stream {stream_num} is larger than {self.max_stream_bytes} bytes, "
+                "objects past the limit are skipped"
+            )
+        pairs, first = self._object_stream_header(stream_num, data)
+        self.inflated.add(stream_num)
+        
+        cached = (data, pairs, first)
+        self._object_streams[stream_num] = cached
+        self._object_stream_bytes += len(data)
+        while self._object_stream_bytes > self.max_stream_bytes and len(self._object_streams) > 1:
+            _, (evicted, _, _) = self._object_streams.popitem(last=False)
+            self._object_stream_bytes -= len(evicted)
+        return cached
+    
+    def _get_compressed(self, num, stream_num, index):
+        try:
+            data, pairs, first = self._object_stream(stream_num)
+        except (PdfSyntaxError, zlib.error, AttributeError) as e:
+            logger.debug("Could not inflate object stream %d: %s", stream_num, e)
+            return None
+        
+        if index >= len(pairs) or pairs[index][0] != num:
+            # The index into the stream is a hint, fall back to the header
+            offsets = [offset for obj_num, offset in pairs if obj_num == num]
+            if not offsets:
+                return None
+            offset = offsets[0]
+        else:
+            offset = pairs[index][1]
+        
+        try:
+            value, _ = parse_value(data, first + offset)
+        except (PdfSyntaxError, IndexError) as e:
+            logger.debug("Could not parse object %d in stream %d: %s", num, stream_num, e)
+            return None
+        return value
+    
+    def resolve(self, value):
+        """Follow indirect references until a direct value is reached"""
+        seen = set()
+        while isinstance(value, Ref) and value.num not in seen:
+            seen.add(value.num)
+            value = self.get(value.num)
+        return None if isinstance(value, Ref) else value
+    
+    def iter_pages(self):
+        """Yield the dictionary of each page in page-tree order"""
+        for _, page in self.iter_page_refs():
+            yield page
+    
+    def iter_page_refs(self, nodes=None):
+        """
+        Yield (object number, dictionary) for each page in page-tree order
+        
+        The object number is None for pages stored as direct objects. If
+        nodes is a set, the object numbers of the intermediate /Pages nodes
+        (and of indirect /Kids arrays) are added to it.
+        """
+        catalog = self.resolve(self.index.trailer.get('/Root'))
+        if not isinstance(catalog, dict):
+            return
+        
+        visited = set()
+        stack = [catalog.get('/Pages')]
+        while stack:
+            node_ref = stack.pop()
+            num = node_ref.num if isinstance(node_ref, Ref) else None
+            if num is not None:
+                if num in visited:
+                    continue
+                visited.add(num)
+            node = self.resolve(node_ref)
+            if not isinstance(node, dict):
+                continue
+            kids_ref = node.get('/Kids')
+            kids = self.resolve(kids_ref)
+            if kids is None:
+                yield num, node
+                continue
+            if nodes is not None:
+                nodes.update(ref.num for ref in (node_ref, kids_ref) if isinstance(ref, Ref))
+            if isinstance(kids, list):
+                stack.extend(reversed(kids))
+    
+    def page_comments(self, page, page_num):
+        """Return the comments from the /Annots array of one page dictionary"""
         comments = []
+        annots = self.resolve(page.get('/Annots'))
+        if not isinstance(annots, list):
+            return comments
+        for i, annot_ref in enumerate(annots):
+            obj_id = annot_ref.num if isinstance(annot_ref, Ref) else None
+            comment = self.comment(self.resolve(annot_ref), page_num, i, obj_id)
+            if comment:
+                comments.append(comment)
+        return comments
+    
+    def iter_comments(self):
+        """
+        Yield comments from the annotations of each page
         
-        with open(pdf_file_path, 'rb') as file:
-            pdf_content = file.read()
-            
-        # Look for potential annotations using pattern matching
-        # This is a simplified approach and might not work for all PDFs
+        Annotations are found through each page's /Annots array, which gives
+        correct page numbers. If the document has no usable page tree, every
+        indexed object with /Type /Annot is used instead, without page numbers.
+        """
+        found_pages = False
+        for page_num, page in enumerate(self.iter_pages(), 1):
+            found_pages = True
+            yield from self.page_comments(page, page_num)
         
-        # Look for /Annot objects
-        annot_pattern = rb'/Annot\s'
-        annot_positions = [m.start() for m in re.finditer(annot_pattern, pdf_content)]
+        if found_pages:
+            return
         
-        # Look for /Text (comment) annotations
-        text_pattern = rb'/Text\s'
-        text_positions = [m.start() for m in re.finditer(text_pattern, pdf_content)]
+        logger.debug("No page tree found, scanning indexed objects for annotations")
+        self.locate_all()
+        numbers = sorted(self.index.offsets, key=lambda num: self.index.offsets[num][1])
+        numbers += sorted(self.index.compressed)
+        for num in numbers:
+            annot = self.get(num)
+            if isinstance(annot, dict) and annot.get('/Type') == '/Annot':
+                comment = self.comment(annot, None, None, num)
+                if comment:
+                    yield comment
+    
+    def comment(self, annot, page_num, index, obj_id=None):
+        """
+        Build a comment record from an annotation dictionary
         
-        # Look for /Contents entries (comment content)
-        contents_pattern = rb'/Contents\s*\(([^\)]*)\)'
-        contents_matches = re.finditer(contents_pattern, pdf_content)
+        Returns None for annotations that are not comments, and for empty
+        ones other than text markup.
+        """
+        if not isinstance(annot, dict):
+            return None
         
-        for i, match in enumerate(contents_matches):
-            try:
-                content = match.group(1).decode('latin-1', errors='replace')
-                # Try to clean up content
-                content = content.replace('\\r', '\r').replace('\\n', '\n')
-                content = content.replace('\\(', '(').replace('\\)', ')')
-                
-                # Look for author pattern near this content
-                author = "Unknown"
-                search_range = pdf_content[max(0, match.start()-200):match.start()]
-                author_match = re.search(rb'/T\s*\(([^\)]*)\)', search_range)
-                if author_match:
-                    author = author_match.group(1).decode('latin-1', errors='replace')
-                
-                comments.append({
-                    'content': content,
-                    'author': author,
-                    'date': '',
-                    'source': 'alternate_parser'
-                })
-            except Exception as e:
-                logger.debug(f"Error extracting comment content: {str(e)}")
+        subtype = annot.get('/Subtype', '')
+        if subtype not in COMMENT_SUBTYPES:
+            return None
+        
+        content = decode_text(self.resolve(annot.get('/Contents')))
+        if not content:
+            popup = self.resolve(annot.get('/Popup'))
+            if isinstance(popup, dict):
+                content = decode_text(self.resolve(popup.get('/Contents')))
+        
+        if not content:
+            if subtype not in MARKUP_SUBTYPES:
+                return None
+            content = f"[{subtype.replace('/', '')} annotation]"
+        
+        author = ''
+        for key in ('/T', '/TI', '/TU'):
+            author = decode_text(self.resolve(annot.get(key)))
+            if author:
+                break
+        
+        date = decode_text(self.resolve(annot.get('/M'))) or \
+            decode_text(self.resolve(annot.get('/CreationDate')))
+        
+        # /RT /Group marks an annotation grouped with /IRT rather than a reply
+        irt = annot.get('/IRT')
+        reply = isinstance(irt, Ref) and self.resolve(annot.get('/RT', '/R')) == '/R'
+        
+        rect = self.resolve(annot.get('/Rect'))
+        if isinstance(rect, list):
+            rect = [self.resolve(value) for value in rect]
+        
+        return Comment(
+            id=obj_id,
+            page=page_num,
+            index=index,
+            content=content,
+            author=author or 'Unknown',
+            date=date,
+            type=subtype,
+            source=self.source or None,
+            parent_id=irt.num if reply else None,
+            key=annotation_key(decode_text(self.resolve(annot.get('/NM'))), subtype, rect, author or 'Unknown',
+                               page_num),
+            state=decode_text(self.resolve(annot.get('/State'))) or None
+        )
+
+
+def _decode_literal(raw):
+    """Decode the raw bytes of a PDF literal string and resolve common escapes"""
+    text = raw.decode('latin-1', errors='replace')
+    if '\\' in text:
+        text = text.replace('\\r', '\r').replace('\\n', '\n')
+        text = text.replace('\\(', '(').replace('\\)', ')')
+        text = text.replace('\\\\', '\\')
+    return text
+
+def _scan_fields(pdf_content):
+    """
+    Pattern-match /T and /Contents entries anywhere in the file
+    
+    This is a last resort for files whose objects cannot be indexed. The
+    most recent /T entry is remembered so the author lookup for each
+    /Contents entry doesn't need to rescan the bytes before it.
+    """
+    comments = []
+    last_author = None
+    last_author_start = -1
+    
+    for match in FIELD_PATTERN.finditer(pdf_content):
+        if match.group(1) == b'T':
+            last_author = match.group(2)
+            last_author_start = match.start()
+            continue
+        
+        try:
+            content = _decode_literal(match.group(2))
+            
+            # Look for author pattern near this content
+            author = "Unknown"
+            if last_author is not None and match.start() - last_author_start <= AUTHOR_WINDOW:
+                author = _decode_literal(last_author)
+            
+            comments.append(Comment(
+                content=content,
+                author=author,
+                date='',
+                source='alternate_parser'
+            ))
+        except Exception as e:
+            logger.debug("Error extracting comment content: %s", e)
+    
+    return comments
+
+def parse_pdf_manually(pdf_file_path, max_stream_bytes=MAX_STREAM_BYTES, buffer=None):
+    """
+    Attempt to parse PDF comments using a lower-level approach
+    This is a fallback method for PDFs that don't work with pypdf
+    
+    The file is memory-mapped rather than read. Objects are located through
+    an ObjectIndex, including those inside compressed object streams, and
+    annotation fields are read from each annotation's own dictionary. Files
+    that cannot be indexed fall back to a single-pass pattern scan.
+    
+    Args:
+        pdf_file_path (str): Path to the PDF file
+        max_stream_bytes (int): Memory cap for decompressed object streams
+        buffer: The file's contents if the caller already mapped it, so the
+            file is not opened again
+        
+    Returns:
+        list: List of potential comments found
+    """
+    try:
+        if buffer is not None:
+            comments = _parse_buffer(pdf_file_path, buffer, max_stream_bytes) if len(buffer) else []
+        else:
+            with open(pdf_file_path, 'rb') as file:
+                if os.fstat(file.fileno()).st_size == 0:
+                    comments = []
+                else:
+                    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as pdf_content:
+                        comments = _parse_buffer(pdf_file_path, pdf_content, max_stream_bytes)
         
         logger.info(f"Alternative parser found {len(comments)} potential comments")
         return comments
@@ -65,54 +1133,97 @@ def parse_pdf_manually(pdf_file_path):
         logger.error(f"Alternative parser failed: {str(e)}")
         return []
 
+def _parse_buffer(pdf_file_path, buffer, max_stream_bytes):
+    document = RawDocument(
+        buffer,
+        get_object_index(pdf_file_path, buffer),
+        max_stream_bytes=max_stream_bytes
+    )
+    if '/Encrypt' in document.index.trailer:
+        logger.warning("PDF is encrypted, comment text found by the alternative parser may be unreadable")
+    
+    comments = list(document.iter_comments())
+    if not comments:
+        comments = _scan_fields(buffer)
+    return comments
+
+
+def _fitz_string(doc, xref, key):
+    """Return a string entry of an annotation's dictionary as PyMuPDF reads it"""
+    kind, value = doc.xref_get_key(xref, key)
+    return value if kind in ('string', 'name') else ''
 
-def extract_comments_alternate(pdf_file_path):
+def _fitz_rect(doc, xref):
+    """Return the unflipped /Rect entry of an annotation, as the other parsers read it"""
+    kind, value = doc.xref_get_key(xref, 'Rect')
+    return value.strip('[]').split() if kind == 'array' else None
+
+def extract_comments_pymupdf(pdf_file_path):
     """
-    Extract comments using PyMuPDF if available, otherwise fallback to manual parsing
+    Extract comments using PyMuPDF
     
     Args:
         pdf_file_path (str): Path to the PDF file
         
     Returns:
-        list: List of dictionaries containing comment information
+        list: List of Comment records
+        
+    Raises:
+        ImportError: If PyMuPDF is not installed
     """
+    import fitz
+    logger.info("Using PyMuPDF for comment extraction")
+    
     comments = []
+    doc = fitz.open(pdf_file_path)
     
-    # Try using PyMuPDF (fitz) if available
-    try:
-        import fitz
-        logger.info("Using PyMuPDF for comment extraction")
-        
-        doc = fitz.open(pdf_file_path)
-        
-        for page_num, page in enumerate(doc, 1):
-            annots = page.annots()
-            for i, annot in enumerate(annots):
-                annot_info = annot.info
-                annot_type = annot.type[1]  # Get annotation type
-                
-                content = annot_info.get("content", "")
-                author = annot_info.get("title", "Unknown")
-                date = annot_info.get("modDate", "")
-                
-                # Skip empty annotations unless they're highlights
-                if not content and annot_type not in [8, 9, 10, 11]:  # highlight, underline, strikeout, squiggly
-                    continue
-                    
-                comments.append({
-                    'page': page_num,
-                    'index': i,
-                    'content': content,
-                    'author': author,
-                    'date': date,
-                    'type': f'/{annot_type}',
-                    'source': 'pymupdf'
-                })
+    for page_num, page in enumerate(doc, 1):
+        annots = page.annots()
+        for i, annot in enumerate(annots):
+            annot_info = annot.info
+            annot_type = annot.type[1]  # Get annotation type
+            
+            content = annot_info.get("content", "")
+            author = annot_info.get("title", "Unknown")
+            date = annot_info.get("modDate", "")
+            
+            # Skip empty annotations unless they're highlights
+            if not content and annot_type not in [8, 9, 10, 11]:  # highlight, underline, strikeout, squiggly
+                continue
                 
-        logger.info(f"PyMuPDF found {len(comments)} comments")
-        return comments
+            comments.append(Comment(
+                id=annot.xref,
+                page=page_num,
+                index=i,
+                content=content,
+                author=author,
+                date=date,
+                type=f'/{annot_type}',
+                source='pymupdf',
+                parent_id=annot.irt_xref or None,
+                key=annotation_key(annot_info.get("id"), f'/{annot_type}', _fitz_rect(doc, annot.xref), author,
+                                   page_num),
+                state=_fitz_string(doc, annot.xref, 'State') or None
+            ))
+            
+    logger.info(f"PyMuPDF found {len(comments)} comments")
+    return comments
+
+def extract_comments_alternate(pdf_file_path, buffer=None):
+    """
+    Extract comments using PyMuPDF if available, otherwise fallback to manual parsing
+    
+    Args:
+        pdf_file_path (str): Path to the PDF file
+        buffer: The file's contents if already mapped, passed on to the manual
+            parser (PyMuPDF opens the file itself)
         
+    Returns:
+        list: List of Comment records
+    """
+    try:
+        return extract_comments_pymupdf(pdf_file_path)
     except ImportError:
         logger.info("PyMuPDF not available, falling back to manual parsing")
         # Fallback to manual parsing
-        return parse_pdf_manually(pdf_file_path)
\ No newline at end of file
+        return parse_pdf_manually(pdf_file_path, buffer=buffer)
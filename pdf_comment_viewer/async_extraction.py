@@ -0,0 +1,284 @@
+import os
+import time
+import queue
+import asyncio
+import logging
+import threading
+import multiprocessing
+from weakref import WeakKeyDictionary
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+
+from cache import get_cache
+from pdf_processor import extract_comments, iter_comments, ExtractionCancelled
+
+logger = logging.getLogger(__name__)
+
+# Default number of parses running at once across all callers in a process
+MAX_PARSES = os.cpu_count() or 1
+
+# Pages of comments an async iterator holds before the parser waits for the
+# consumer to catch up
+PAGE_BUFFER = 64
+
+# How often a process worker checks whether it was cancelled (each check is
+# a round trip to the manager process) and how long blocking waits last
+# between such checks
+CANCEL_POLL = 0.05
+
+_max_parses = MAX_PARSES
+_semaphores = WeakKeyDictionary()
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def set_max_parses(limit):
+    """
+    Set how many parses may run at once
+
+    Takes effect in event loops that haven't started an extraction yet.
+    """
+    global _max_parses
+    _max_parses = max(1, int(limit))
+
+
+def _semaphore():
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(_max_parses)
+    return semaphore
+
+
+def _get_manager():
+    """Return the manager process holding cancel events and queues for process workers"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = multiprocessing.Manager()
+        return _manager
+
+
+def _remaining(deadline):
+    if deadline is None:
+        return None
+    remaining = deadline - asyncio.get_running_loop().time()
+    if remaining <= 0:
+        raise asyncio.TimeoutError()
+    return remaining
+
+
+@asynccontextmanager
+async def _parse_slot(deadline):
+    """Hold one of the max parses slots, waiting at most until deadline for it"""
+    semaphore = _semaphore()
+    await asyncio.wait_for(semaphore.acquire(), _remaining(deadline))
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+def _cancel_event(executor):
+    if isinstance(executor, ProcessPoolExecutor):
+        return _get_manager().Event()
+    return threading.Event()
+
+
+class _CancelCheck:
+    """Raise ExtractionCancelled from a worker once its cancel event is set"""
+
+    def __init__(self, event):
+        self.event = event
+        # Events held by the manager are only asked every CANCEL_POLL seconds
+        self.interval = 0.0 if isinstance(event, threading.Event) else CANCEL_POLL
+        self.checked = 0.0
+
+    def __call__(self, *args):
+        now = time.monotonic()
+        if now - self.checked >= self.interval:
+            self.checked = now
+            if self.event.is_set():
+                raise ExtractionCancelled()
+
+
+async def _stop(future, cancel):
+    """Ask a worker to stop at its next page boundary and wait until it has"""
+    if not future.done():
+        cancel.set()
+        await asyncio.wait({future})
+    if not future.cancelled():
+        future.exception()
+
+
+def _extract(path, cancel, options):
+    options = dict(options)
+    cache = options.pop('cache', False)
+    if cache:
+        options['cache'] = get_cache(cache if isinstance(cache, str) else None)
+    check = _CancelCheck(cancel)
+    check()
+    return extract_comments(path, progress=check, **options)
+
+
+async def extract_comments_async(path, *, executor=None, timeout=None, **options):
+    """
+    Extract comments without blocking the event loop
+
+    The parse runs on executor, a thread or process pool (None for the
+    loop's default thread pool). Parses wait for one of the slots set by
+    set_max_parses, so however many requests arrive, only that many
+    documents are being parsed, and held in memory, at once.
+
+    On timeout or cancellation the worker is asked to stop at its next page
+    boundary, and this returns once it has, so the slot is only released
+    when the parse is really over. Results served from the cache or by the
+    alternate parser are not split into pages and always run to the end.
+
+    Args:
+        path (str): Path to the PDF file
+        executor (concurrent.futures.Executor): Where to run the parse
+        timeout (float): Seconds allowed, including the wait for a slot
+        **options: Extra keyword arguments for extract_comments; cache is
+            given as in batch.extract_file (True or a database path)
+
+    Returns:
+        list: Comment records
+
+    Raises:
+        asyncio.TimeoutError: If the extraction took longer than timeout
+    """
+    loop = asyncio.get_running_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+    async with _parse_slot(deadline):
+        cancel = _cancel_event(executor)
+        future = loop.run_in_executor(executor, _extract, path, cancel, options)
+        try:
+            done, _ = await asyncio.wait({future}, timeout=_remaining(deadline))
+            if not done:
+                raise asyncio.TimeoutError()
+            return future.result()
+        finally:
+            await _stop(future, cancel)
+
+
+class _LoopChannel:
+    """Comments handed from a worker thread to the event loop, at most size pages at a time"""
+
+    def __init__(self, loop, size):
+        self.loop = loop
+        self.items = asyncio.Queue()
+        self.credits = threading.Semaphore(size)
+
+    def put(self, item, cancel):
+        while not self.credits.acquire(timeout=CANCEL_POLL):
+            if cancel.is_set():
+                raise ExtractionCancelled()
+        self.loop.call_soon_threadsafe(self.items.put_nowait, item)
+
+    def finish(self):
+        self.loop.call_soon_threadsafe(self.items.put_nowait, None)
+
+    async def get(self, future):
+        item = await self.items.get()
+        if item is not None:
+            self.credits.release()
+        return item
+
+
+class _QueueChannel:
+    """Comments handed from a worker process through a manager queue"""
+
+    def __init__(self, size):
+        self.queue = _get_manager().Queue(size)
+
+    def put(self, item, cancel):
+        while True:
+            try:
+                self.queue.put(item, timeout=CANCEL_POLL)
+                return
+            except queue.Full:
+                if cancel.is_set():
+                    raise ExtractionCancelled()
+
+    def finish(self):
+        try:
+            self.queue.put(None, timeout=CANCEL_POLL)
+        except queue.Full:
+            # The consumer also notices when the worker is done
+            pass
+
+    async def get(self, future):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                return await loop.run_in_executor(None, self.queue.get, True, CANCEL_POLL)
+            except queue.Empty:
+                if future.done():
+                    try:
+                        return self.queue.get_nowait()
+                    except queue.Empty:
+                        return None
+
+
+def _iter_pages(path, cancel, channel, options):
+    check = _CancelCheck(cancel)
+    pending = []
+
+    def progress(page_num, page_count, comments):
+        check()
+        if pending:
+            channel.put(list(pending), cancel)
+            pending.clear()
+
+    try:
+        check()
+        for comment in iter_comments(path, progress=progress, **options):
+            pending.append(comment)
+        if pending:
+            channel.put(pending, cancel)
+    finally:
+        channel.finish()
+
+
+async def iter_comments_async(path, *, executor=None, timeout=None, buffer=PAGE_BUFFER, **options):
+    """
+    Iterate over the comments of a PDF file with async for, page by page
+
+    Like iter_comments, run on executor under the same parse slots as
+    extract_comments_async. At most buffer pages of comments are held for a
+    slow consumer before the parser waits. Leaving the loop early, a timeout
+    or cancellation stops the parser at its next page boundary.
+
+    Args:
+        path (str): Path to the PDF file
+        executor (concurrent.futures.Executor): Where to run the parse
+        timeout (float): Seconds allowed for the whole iteration
+        buffer (int): Most pages of comments waiting for the consumer
+        **options: Extra keyword arguments for iter_comments
+
+    Yields:
+        Comment: Comment information
+
+    Raises:
+        asyncio.TimeoutError: If the iteration took longer than timeout
+    """
+    loop = asyncio.get_running_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+    async with _parse_slot(deadline):
+        cancel = _cancel_event(executor)
+        if isinstance(executor, ProcessPoolExecutor):
+            channel = _QueueChannel(buffer)
+        else:
+            channel = _LoopChannel(loop, buffer)
+        future = loop.run_in_executor(executor, _iter_pages, path, cancel, channel, options)
+        try:
+            while True:
+                comments = await asyncio.wait_for(channel.get(future), _remaining(deadline))
+                if comments is None:
+                    break
+                for comment in comments:
+                    yield comment
+            await future
+        finally:
+            await _stop(future, cancel)
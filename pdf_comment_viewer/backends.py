@@ -0,0 +1,279 @@
+import os
+import mmap
+import time
+import logging
+import threading
+import importlib.util
+import multiprocessing
+from multiprocessing.connection import wait
+
+from alternate_parser import sniff, PdfSyntaxError, UNKNOWN_TRAITS
+from stats import NULL_STATS
+
+logger = logging.getLogger(__name__)
+
+# Expected seconds per megabyte of input for each speed class, used to rank
+# backends until timings have been recorded for them
+SPEED_CLASSES = {'fast': 0.01, 'medium': 0.05, 'slow': 0.25}
+
+# Weight of the newest run in a backend's recorded timing
+TIMING_WEIGHT = 0.2
+
+# Backends started by race mode
+RACE_WIDTH = 2
+
+# Set in the worker processes of a batch (see mark_worker_process)
+_in_worker = False
+
+
+class Backend:
+    """
+    One way of extracting the comments of a file, and what it can handle
+
+    Args:
+        name (str): Name to select it by
+        extract (callable): extract(pdf_file_path, buffer, **options) returns
+            the comments; buffer is the mapped file. Options it doesn't use
+            (fast, workers, progress, stats) are passed and ignored.
+        speed (str): Speed class (see SPEED_CLASSES), its rank until timed
+        encryption (bool): Reads encrypted files (with the empty password)
+        object_streams (bool): Finds objects inside compressed object streams
+        requires (str): Module that must be importable for it to run
+    """
+
+    def __init__(self, name, extract, speed='medium', encryption=False, object_streams=True, requires=None):
+        if speed not in SPEED_CLASSES:
+            raise ValueError(f"Unknown speed class {speed!r}")
+        self.name = name
+        self.extract = extract
+        self.speed = speed
+        self.encryption = encryption
+        self.object_streams = object_streams
+        self.requires = requires
+
+    def __repr__(self):
+        return f'Backend({self.name!r}, speed={self.speed!r})'
+
+    @property
+    def available(self):
+        return self.requires is None or importlib.util.find_spec(self.requires) is not None
+
+    def supports(self, traits):
+        """Whether the backend can read a file with these sniffed traits"""
+        return (self.encryption or not traits.encrypted) and (self.object_streams or not traits.object_streams)
+
+
+# Registered backends by name, in registration order
+BACKENDS = {}
+
+
+def register_backend(backend):
+    """Make a backend selectable by name, replacing one of the same name"""
+    BACKENDS[backend.name] = backend
+    return backend
+
+
+def get_backend(name):
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown backend {name!r}, expected one of {', '.join(BACKENDS)}")
+
+
+def mark_worker_process():
+    """
+    Mark this process as one of a pool's workers, where race mode is skipped
+
+    The pool already runs one extraction per core; racing inside each
+    worker would start two more processes for every one of them.
+    """
+    global _in_worker
+    _in_worker = True
+
+
+class BackendTimings:
+    """
+    Recent seconds per megabyte of each backend, as a moving average
+
+    Runs in this process are recorded as they finish; a backend without
+    runs is estimated from its speed class.
+    """
+
+    def __init__(self, weight=TIMING_WEIGHT):
+        self.weight = weight
+        self.rates = {}
+        self.runs = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, size):
+        rate = seconds / max(size / 1e6, 0.001)
+        with self._lock:
+            previous = self.rates.get(name)
+            self.rates[name] = rate if previous is None else previous + self.weight * (rate - previous)
+            self.runs[name] = self.runs.get(name, 0) + 1
+
+    def estimate(self, backend):
+        return self.rates.get(backend.name, SPEED_CLASSES[backend.speed])
+
+
+TIMINGS = BackendTimings()
+
+
+def select_backends(traits, timings=TIMINGS):
+    """
+    Return the available backends that can read a file, best first
+
+    Args:
+        traits (PdfTraits): The file's sniffed traits (see alternate_parser.sniff)
+        timings (BackendTimings): Recorded speeds to rank by
+
+    Returns:
+        list: Backends, the fastest expected first; registration order
+        breaks ties
+    """
+    candidates = [backend for backend in BACKENDS.values() if backend.available and backend.supports(traits)]
+    return sorted(candidates, key=timings.estimate)
+
+
+def _run(backend, pdf_file_path, buffer, timings, **options):
+    started = time.perf_counter()
+    comments = list(backend.extract(pdf_file_path, buffer, **options))
+    timings.record(backend.name, time.perf_counter() - started, len(buffer))
+    return comments
+
+
+def extract_with_backends(pdf_file_path, backend='auto', race=False, fallback=False, timings=TIMINGS,
+                          stats=NULL_STATS, **options):
+    """
+    Extract comments with a named backend, or one picked for the file
+
+    With backend 'auto' the file's traits are sniffed and the backends that
+    can read it are tried best first (see select_backends): the next one
+    runs when a backend fails, or finds nothing and fallback is set. With
+    race, the best two run at the same time in separate processes and the
+    first to find comments wins; the other is stopped.
+
+    Args:
+        pdf_file_path (str): Path to the PDF file
+        backend (str): A registered backend name, or 'auto'
+        race (bool): Race the best two backends ('auto' only)
+        fallback (bool): Try the next backend when one finds nothing
+        timings (BackendTimings): Where runs are recorded and ranked from
+        stats (ExtractionStats): Records the backend used
+        **options: Passed on to the backends (fast, workers, progress)
+
+    Returns:
+        tuple: (list of comments, name of the backend that produced them)
+    """
+    with open(pdf_file_path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        try:
+            traits = sniff(buffer)
+            if traits is None:
+                logger.warning(f"No %PDF- header at the start of {os.path.basename(pdf_file_path)}")
+                traits = UNKNOWN_TRAITS
+            if backend != 'auto':
+                chosen = get_backend(backend)
+                stats.use(chosen.name)
+                return _run(chosen, pdf_file_path, buffer, timings, stats=stats, **options), chosen.name
+
+            candidates = select_backends(traits, timings)
+            if not candidates:
+                raise PdfSyntaxError(f"No available backend can read this file ({traits})")
+            logger.info(f"Backends for {os.path.basename(pdf_file_path)}: {', '.join(b.name for b in candidates)}")
+
+            if race and len(candidates) > 1:
+                if _in_worker or multiprocessing.current_process().daemon:
+                    logger.debug("Not racing backends inside a worker process")
+                else:
+                    comments, name = _race(pdf_file_path, candidates[:RACE_WIDTH], size, timings, options)
+                    stats.use(f'{name} (race)')
+                    return comments, name
+
+            error = None
+            for candidate in candidates:
+                try:
+                    comments = _run(candidate, pdf_file_path, buffer, timings, stats=stats, **options)
+                except Exception as e:
+                    logger.warning(f"Backend {candidate.name} failed: {str(e)}")
+                    stats.fallback(f'{candidate.name} failed')
+                    error = e
+                    continue
+                if comments or not fallback:
+                    stats.use(candidate.name)
+                    return comments, candidate.name
+                stats.fallback(f'{candidate.name} found nothing')
+            if error is not None:
+                raise error
+            return [], candidates[-1].name
+        finally:
+            if size:
+                buffer.close()
+
+
+def _race_worker(name, pdf_file_path, options, connection):
+    # Importing the parsers registers the built-in backends in a spawned process
+    import pdf_processor  # noqa: F401
+
+    try:
+        with open(pdf_file_path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+            try:
+                started = time.perf_counter()
+                comments = list(get_backend(name).extract(pdf_file_path, buffer, **options))
+                connection.send((comments, None, time.perf_counter() - started))
+            finally:
+                if size:
+                    buffer.close()
+    except Exception as e:
+        connection.send((None, f"{type(e).__name__}: {e}", 0.0))
+    finally:
+        connection.close()
+
+
+def _race(pdf_file_path, contenders, size, timings, options):
+    """Run contenders in processes and return (comments, name) of the first to find comments"""
+    # Progress callbacks and stats can't be shared with another process
+    options = {key: value for key, value in options.items() if key in ('fast', 'workers')}
+    running = {}
+    try:
+        for backend in contenders:
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(
+                target=_race_worker, args=(backend.name, pdf_file_path, options, sender), daemon=True
+            )
+            process.start()
+            sender.close()
+            running[receiver] = (backend, process)
+
+        result = None
+        errors = []
+        while running:
+            for receiver in wait(list(running)):
+                backend, process = running.pop(receiver)
+                try:
+                    comments, error, seconds = receiver.recv()
+                except EOFError:
+                    comments, error, seconds = None, "worker exited", 0.0
+                receiver.close()
+                process.join()
+                if error:
+                    logger.warning(f"Backend {backend.name} failed: {error}")
+                    errors.append(f"{backend.name}: {error}")
+                    continue
+                timings.record(backend.name, seconds, size)
+                if comments:
+                    logger.info(f"Backend {backend.name} won the race")
+                    return comments, backend.name
+                if result is None:
+                    result = (comments, backend.name)
+        if result is None:
+            raise PdfSyntaxError(f"Every backend failed ({'; '.join(errors)})")
+        return result
+    finally:
+        for receiver, (backend, process) in running.items():
+            process.terminate()
+            process.join()
+            receiver.close()
@@ -0,0 +1,189 @@
+import os
+import glob
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from pdf_processor import extract_comments
+from backends import mark_worker_process
+from cache import get_cache
+
+logger = logging.getLogger(__name__)
+
+
+def iter_pdf_paths(inputs):
+    """
+    Expand files, directories and glob patterns into PDF file paths
+
+    Directories are walked recursively and only files with a .pdf extension
+    are yielded. Each path is yielded at most once.
+
+    Args:
+        inputs (iterable): File paths, directory paths or glob patterns
+
+    Yields:
+        str: Path to a PDF file
+    """
+    seen = set()
+
+    def _once(path):
+        key = os.path.normcase(os.path.abspath(path))
+        if key in seen:
+            return False
+        seen.add(key)
+        return True
+
+    for item in inputs:
+        if glob.has_magic(item):
+            candidates = sorted(glob.iglob(item, recursive=True))
+        else:
+            candidates = [item]
+
+        for candidate in candidates:
+            if os.path.isdir(candidate):
+                for dirpath, dirnames, filenames in os.walk(candidate):
+                    dirnames.sort()
+                    for filename in sorted(filenames):
+                        if filename.lower().endswith('.pdf'):
+                            path = os.path.join(dirpath, filename)
+                            if _once(path):
+                                yield path
+            elif _once(candidate):
+                yield candidate
+
+
+def to_record(comment):
+    """Convert a comment into a JSON-serialisable dictionary of plain values"""
+    record = {}
+    for key, value in comment.items():
+        if isinstance(value, bytes):
+            value = value.decode('latin-1', errors='replace')
+        elif isinstance(value, str):
+            value = str(value)
+        elif isinstance(value, bool) or value is None:
+            pass
+        elif isinstance(value, int):
+            value = int(value)
+        else:
+            value = str(value)
+        record[key] = value
+    return record
+
+
+def extract_file(pdf_file_path, fallback=False, cache=False, **options):
+    """
+    Extract comments from one file, isolating any failure
+
+    Args:
+        pdf_file_path (str): Path to the PDF file
+        fallback (bool): Retry with the alternate parser when nothing is found
+        cache (bool or str): Use the extraction cache; a string selects the
+            cache database file instead of the default one
+        **options: Extra keyword arguments for extract_comments
+
+    Returns:
+        tuple: (path, list of comment records, error message or None)
+    """
+    if cache:
+        options['cache'] = get_cache(cache if isinstance(cache, str) else None)
+
+    try:
+        comments = extract_comments(pdf_file_path, fallback=fallback, **options)
+        return pdf_file_path, [to_record(c) for c in comments], None
+    except Exception as e:
+        return pdf_file_path, [], f"{type(e).__name__}: {e}"
+
+
+def _init_worker(log_level):
+    logging.getLogger().setLevel(log_level)
+    mark_worker_process()
+
+
+class BatchStats:
+    """Running totals for a batch extraction"""
+
+    def __init__(self):
+        self.files = 0
+        self.failed = 0
+        self.comments = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def add(self, comments, error):
+        self.files += 1
+        if error:
+            self.failed += 1
+        self.comments += len(comments)
+        self.elapsed = time.perf_counter() - self.started
+
+    @property
+    def files_per_sec(self):
+        return self.files / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def comments_per_sec(self):
+        return self.comments / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        return (
+            f"{self.files} files ({self.failed} failed), {self.comments} comments "
+            f"in {self.elapsed:.2f}s - {self.files_per_sec:.1f} files/s, "
+            f"{self.comments_per_sec:.1f} comments/s"
+        )
+
+
+def run_batch(paths, jobs=None, fallback=False, stats=None, **options):
+    """
+    Extract comments from many files on a process pool
+
+    Results are yielded as soon as each file finishes, so the order follows
+    completion rather than input order. At most a few tasks per worker are in
+    flight at a time, which keeps memory flat on very large file lists.
+
+    Args:
+        paths (iterable): PDF file paths
+        jobs (int): Number of worker processes (defaults to the core count);
+            1 runs everything in the current process
+        fallback (bool): Retry with the alternate parser when nothing is found
+        stats (BatchStats): Optional stats object updated as results arrive
+        **options: Extra keyword arguments for extract_comments
+
+    Yields:
+        tuple: (path, list of comment records, error message or None)
+    """
+    jobs = jobs or os.cpu_count() or 1
+    stats = stats if stats is not None else BatchStats()
+
+    if jobs == 1:
+        for path in paths:
+            result = extract_file(path, fallback, **options)
+            stats.add(result[1], result[2])
+            yield result
+        return
+
+    max_pending = jobs * 4
+    paths = iter(paths)
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_init_worker,
+        initargs=(logging.getLogger().level,)
+    ) as executor:
+        pending = set()
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < max_pending:
+                try:
+                    path = next(paths)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.add(executor.submit(extract_file, path, fallback, **options))
+
+            if not pending:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                stats.add(result[1], result[2])
+                yield result
@@ -0,0 +1,308 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections.abc import Mapping
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever a change to the parsers changes what they extract, so stale
+# results from older versions are never served
+PARSER_VERSION = 5
+
+# Default size cap of the stored comment data
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Hits only refresh an entry's LRU timestamp when it is older than this,
+# so reopening the same file repeatedly doesn't write on every lookup
+TOUCH_INTERVAL = 60.0
+
+HASH_CHUNK = 1024 * 1024
+
+# Digests of files that missed, kept for the put that usually follows
+MISS_MEMORY = 64
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    hash TEXT NOT NULL,
+    variant TEXT NOT NULL,
+    comments TEXT NOT NULL,
+    nbytes INTEGER NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (hash, variant)
+);
+CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT NOT NULL,
+    variant TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    PRIMARY KEY (path, variant)
+);
+CREATE TABLE IF NOT EXISTS revisions (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    nbytes INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS revisions_last_access ON revisions (last_access);
+"""
+
+
+def default_cache_dir():
+    """Return the per-user cache directory for this application"""
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser(os.path.join('~', 'AppData', 'Local'))
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser(os.path.join('~', 'Library', 'Caches'))
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser(os.path.join('~', '.cache'))
+    return os.path.join(base, 'pdf-comment-viewer')
+
+
+def content_hash(pdf_file_path):
+    """Return a hex digest of the file's contents"""
+    digest = hashlib.blake2b(digest_size=20)
+    buffer = bytearray(HASH_CHUNK)
+    view = memoryview(buffer)
+    with open(pdf_file_path, 'rb') as file:
+        while True:
+            size = file.readinto(buffer)
+            if not size:
+                break
+            digest.update(view[:size])
+    return digest.hexdigest()
+
+
+def _json_default(value):
+    if isinstance(value, Mapping):
+        # Comment records
+        return dict(value)
+    if isinstance(value, bytes):
+        return value.decode('latin-1', errors='replace')
+    return str(value)
+
+
+class ExtractionCache:
+    """
+    Persistent store of extracted comments keyed by file content
+
+    Lookups first match the file's path, size and modification time, which
+    costs a stat and one indexed query. Only when that misses is the file
+    hashed, so a renamed or touched but unchanged file still hits. The
+    digest of a miss is remembered so storing the result for the same,
+    unchanged file doesn't hash it again. Entries
+    are evicted least recently used first once the stored comment data
+    exceeds max_bytes.
+
+    Args:
+        path (str): SQLite database file (defaults to the user cache dir)
+        max_bytes (int): Size cap of the stored comment data
+    """
+
+    def __init__(self, path=None, max_bytes=DEFAULT_MAX_BYTES):
+        if path is None:
+            path = os.path.join(default_cache_dir(), 'extraction-cache.sqlite3')
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._misses = {}
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    @staticmethod
+    def variant(**options):
+        """Build the part of the key that depends on parser version and options"""
+        settings = ','.join(f'{key}={options[key]!r}' for key in sorted(options))
+        return f'v{PARSER_VERSION}:{settings}'
+
+    def get(self, pdf_file_path, variant=''):
+        """
+        Return cached comments for a file, or None on a miss
+
+        Args:
+            pdf_file_path (str): Path to the PDF file
+            variant (str): Key suffix from ExtractionCache.variant()
+
+        Returns:
+            list: Comment dictionaries, or None
+        """
+        stat = os.stat(pdf_file_path)
+        path = os.path.abspath(pdf_file_path)
+
+        with self._lock:
+            row = self._db.execute(
+                'SELECT e.hash, e.comments, e.last_access FROM files f '
+                'JOIN entries e ON e.hash = f.hash AND e.variant = f.variant '
+                'WHERE f.path = ? AND f.variant = ? AND f.size = ? AND f.mtime_ns = ?',
+                (path, variant, stat.st_size, stat.st_mtime_ns)
+            ).fetchone()
+
+        if row is None:
+            digest = content_hash(pdf_file_path)
+            with self._lock:
+                row = self._db.execute(
+                    'SELECT hash, comments, last_access FROM entries WHERE hash = ? AND variant = ?',
+                    (digest, variant)
+                ).fetchone()
+                if row is None:
+                    self._remember_miss(path, stat, digest)
+                    return None
+                self._remember_file(path, variant, stat, digest)
+                self._db.commit()
+
+        digest, comments, last_access = row
+        now = time.time()
+        if now - last_access > TOUCH_INTERVAL:
+            with self._lock:
+                self._db.execute(
+                    'UPDATE entries SET last_access = ? WHERE hash = ? AND variant = ?',
+                    (now, digest, variant)
+                )
+                self._db.commit()
+
+        return json.loads(comments)
+
+    def put(self, pdf_file_path, comments, variant=''):
+        """Store the comments extracted from a file, evicting old entries if needed"""
+        stat = os.stat(pdf_file_path)
+        path = os.path.abspath(pdf_file_path)
+        with self._lock:
+            miss = self._misses.pop(path, None)
+        if miss is not None and miss[:2] == (stat.st_size, stat.st_mtime_ns):
+            digest = miss[2]
+        else:
+            digest = content_hash(pdf_file_path)
+        data = json.dumps(list(comments), default=_json_default, ensure_ascii=False)
+
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO entries (hash, variant, comments, nbytes, last_access) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (digest, variant, data, len(data), time.time())
+            )
+            self._remember_file(path, variant, stat, digest)
+            self._evict()
+            self._db.commit()
+
+    def get_revision(self, pdf_file_path):
+        """
+        Return the incremental extraction state last stored for a path
+
+        Returns:
+            dict: State saved by put_revision (including 'size' and
+            'mtime_ns' of the file it describes), or None if there is none
+            or it was stored by another parser version
+        """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT state FROM revisions WHERE path = ?', (os.path.abspath(pdf_file_path),)
+            ).fetchone()
+            if row is not None:
+                self._db.execute(
+                    'UPDATE revisions SET last_access = ? WHERE path = ?',
+                    (time.time(), os.path.abspath(pdf_file_path))
+                )
+                self._db.commit()
+        if row is None:
+            return None
+        state = json.loads(row[0])
+        return state if state.get('version') == PARSER_VERSION else None
+
+    def put_revision(self, pdf_file_path, state):
+        """Store the incremental extraction state of a path"""
+        data = json.dumps(dict(state, version=PARSER_VERSION), default=_json_default, ensure_ascii=False)
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO revisions (path, size, mtime_ns, state, nbytes, last_access) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (os.path.abspath(pdf_file_path), state['size'], state['mtime_ns'], data, len(data), time.time())
+            )
+            self._evict()
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute('DELETE FROM entries')
+            self._db.execute('DELETE FROM files')
+            self._db.execute('DELETE FROM revisions')
+            self._db.commit()
+
+    def _remember_miss(self, path, stat, digest):
+        self._misses.pop(path, None)
+        if len(self._misses) >= MISS_MEMORY:
+            del self._misses[next(iter(self._misses))]
+        self._misses[path] = (stat.st_size, stat.st_mtime_ns, digest)
+
+    def _remember_file(self, path, variant, stat, digest):
+        self._db.execute(
+            'INSERT OR REPLACE INTO files (path, variant, size, mtime_ns, hash) VALUES (?, ?, ?, ?, ?)',
+            (path, variant, stat.st_size, stat.st_mtime_ns, digest)
+        )
+
+    def _evict(self):
+        total = self._db.execute(
+            'SELECT (SELECT COALESCE(SUM(nbytes), 0) FROM entries) + '
+            '(SELECT COALESCE(SUM(nbytes), 0) FROM revisions)'
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        evicted = 0
+        for table, key, variant, nbytes, _ in self._db.execute(
+            "SELECT 'entries', hash, variant, nbytes, last_access FROM entries "
+            "UNION ALL SELECT 'revisions', path, NULL, nbytes, last_access FROM revisions "
+            "ORDER BY last_access"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            if table == 'entries':
+                self._db.execute('DELETE FROM entries WHERE hash = ? AND variant = ?', (key, variant))
+            else:
+                self._db.execute('DELETE FROM revisions WHERE path = ?', (key,))
+            total -= nbytes
+            evicted += 1
+
+        self._db.execute(
+            'DELETE FROM files WHERE NOT EXISTS '
+            '(SELECT 1 FROM entries e WHERE e.hash = files.hash AND e.variant = files.variant)'
+        )
+        logger.info(f"Evicted {evicted} cached extraction results")
+
+
+_shared_caches = {}
+_shared_lock = threading.Lock()
+
+
+def get_cache(path=None, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Return a cache shared by everything in this process that uses the same path
+
+    Returns None (and logs a warning) if the cache cannot be opened, so
+    callers can carry on without caching.
+    """
+    with _shared_lock:
+        key = path or ''
+        if key not in _shared_caches:
+            try:
+                _shared_caches[key] = ExtractionCache(path, max_bytes=max_bytes)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"Extraction cache unavailable: {str(e)}")
+                _shared_caches[key] = None
+        return _shared_caches[key]
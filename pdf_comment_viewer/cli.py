@@ -0,0 +1,499 @@
+import os
+import sys
+import json
+import signal
+import asyncio
+import logging
+import sqlite3
+import argparse
+import threading
+
+from batch import iter_pdf_paths, run_batch, BatchStats
+from pdf_processor import extract_comments
+from backends import BACKENDS
+from comment_index import CommentIndex
+from comment_table import CommentTable, GROUPS, SORT_KEYS, date_bound
+from comment_model import parse_page_range
+from diff import diff_comments, extract_revisions, CHANGES
+from stats import ExtractionStats
+from server import serve, DEFAULT_HOST, DEFAULT_PORT
+from watcher import FolderWatcher, WatchState, JsonlSink, IndexSink
+from version import __version__
+
+logger = logging.getLogger(__name__)
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+def cmd_extract(args):
+    """Extract comments from files and directory trees as JSONL"""
+    if args.race and args.jobs != 1:
+        logger.error("--race starts processes of its own for each file, use it with --jobs 1")
+        return 2
+    stats = BatchStats()
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+
+    try:
+        results = run_batch(
+            iter_pdf_paths(args.paths),
+            jobs=args.jobs,
+            fallback=args.fallback,
+            stats=stats,
+            fast=args.fast,
+            incremental=args.incremental,
+            workers=args.workers,
+            backend=args.backend,
+            race=args.race,
+            cache=False if args.no_cache else (args.cache_path or True)
+        )
+        for path, records, error in results:
+            if error:
+                logger.error(f"{path}: {error}")
+                continue
+            for record in records:
+                record = dict(file=path, **record)
+                output.write(json.dumps(record, ensure_ascii=False) + '\n')
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        else:
+            output.flush()
+
+    print(stats.summary(), file=sys.stderr)
+    return 1 if stats.failed else 0
+
+
+def cmd_profile(args):
+    """Extract files one at a time and report where the time went in each"""
+    failed = 0
+    for path in iter_pdf_paths(args.paths):
+        stats = ExtractionStats()
+        try:
+            comments = extract_comments(
+                path, use_alternate=args.alternate, fast=args.fast, fallback=args.fallback,
+                workers=args.workers, stats=stats, backend=args.backend, race=args.race
+            )
+        except Exception as e:
+            logger.error(f"{path}: {type(e).__name__}: {e}")
+            failed += 1
+            continue
+
+        if args.json:
+            print(json.dumps(dict(file=path, comments=len(comments), **stats.to_dict())))
+        else:
+            print(f"{path}: {len(comments)} comments")
+            print(stats.format())
+    return 1 if failed else 0
+
+
+def cmd_index(args):
+    """Add files to the search index, re-extracting only those that changed"""
+    stats = BatchStats()
+    try:
+        index = CommentIndex(args.index_path)
+        updated = index.update(
+            iter_pdf_paths(args.paths),
+            jobs=args.jobs,
+            stats=stats,
+            fallback=args.fallback,
+            fast=args.fast,
+            cache=False if args.no_cache else (args.cache_path or True)
+        )
+        removed = index.prune()
+        files, comments = index.summary()
+    except sqlite3.Error as e:
+        logger.error(f"Search index unavailable: {e}")
+        return 1
+
+    print(f"{updated} files indexed ({stats.failed} failed), {removed} removed", file=sys.stderr)
+    if updated:
+        print(stats.summary(), file=sys.stderr)
+    print(f"Index holds {comments} comments from {files} files", file=sys.stderr)
+    return 1 if stats.failed else 0
+
+
+def cmd_search(args):
+    """Query the search index built by the index command"""
+    try:
+        index = CommentIndex(args.index_path)
+        results = index.search(
+            ' '.join(args.query), author=args.author, type=args.type, since=args.since, until=args.until,
+            path=args.file, limit=args.limit, raw=args.raw
+        )
+    except ValueError as e:
+        logger.error(str(e))
+        return 2
+    except sqlite3.Error as e:
+        logger.error(f"Search failed: {e}")
+        return 1
+
+    for result in results:
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False))
+        else:
+            content = ' '.join(result['content'].split())
+            print(f"{result['file']}:{result['page'] or '?'}  {result['author']}  {content[:200]}")
+    return 0
+
+
+def cmd_report(args):
+    """Count the comments of many files by author, type, page band or date"""
+    try:
+        since = date_bound(args.since) if args.since else None
+        until = date_bound(args.until, end=True) if args.until else None
+    except ValueError as e:
+        logger.error(str(e))
+        return 2
+    pages = parse_page_range(args.pages) if args.pages else None
+    if args.pages and pages is None:
+        logger.error(f"Not a page range: {args.pages!r}")
+        return 2
+
+    stats = BatchStats()
+    table = CommentTable()
+    results = run_batch(
+        iter_pdf_paths(args.paths),
+        jobs=args.jobs,
+        fallback=args.fallback,
+        stats=stats,
+        fast=args.fast,
+        cache=False if args.no_cache else (args.cache_path or True)
+    )
+    for path, records, error in results:
+        if error:
+            logger.error(f"{path}: {error}")
+            continue
+        table.extend(records, file=path)
+
+    rows = table.filter(
+        author=args.author, type=args.type, pages=pages, since=since, until=until, text=args.text.lower()
+    )
+    if args.json:
+        for by in args.by or ['author']:
+            print(json.dumps({'by': by, 'groups': table.counts(by, rows, band=args.band)}, ensure_ascii=False))
+    else:
+        print(f"{len(rows)} of {len(table)} comments from {stats.files - stats.failed} files")
+        for by in args.by or ['author']:
+            groups = table.counts(by, rows, band=args.band)
+            width = max([len(by)] + [len(str(group)) for group, _ in groups])
+            print(f"\n{by:<{width}}  {'comments':>8}")
+            for group, count in groups:
+                print(f"{group if group is not None else '(none)':<{width}}  {count:>8}")
+
+    if args.list:
+        for row in table.sort(rows, by=args.sort, descending=args.descending).tolist()[:args.limit]:
+            comment = table.comments[row]
+            if args.json:
+                print(json.dumps(dict(file=table.file(row), **comment), ensure_ascii=False))
+            else:
+                content = ' '.join(str(comment.get('content', '')).split())
+                print(f"{table.file(row)}:{comment.get('page', '?')}  {table.author(row)}  "
+                      f"{comment.get('date', '')}  {content[:120]}")
+    return 1 if stats.failed else 0
+
+
+def cmd_diff(args):
+    """Show the comments added, removed, edited, moved or resolved between two revisions"""
+    (old, old_error), (new, new_error) = extract_revisions(
+        args.old, args.new,
+        fallback=args.fallback,
+        fast=args.fast,
+        cache=False if args.no_cache else (args.cache_path or True)
+    )
+    for path, error in ((args.old, old_error), (args.new, new_error)):
+        if error:
+            logger.error(f"{path}: {error}")
+    if old_error or new_error:
+        return 1
+
+    counts = dict.fromkeys(CHANGES, 0)
+    for event in diff_comments(old, new):
+        counts[event['change']] += 1
+        if args.json:
+            print(json.dumps(event, ensure_ascii=False), flush=True)
+            continue
+        comment = event['new'] or event['old']
+        content = ' '.join(str(comment.get('content', '')).split())
+        detail = ''
+        if event['change'] == 'moved':
+            detail = f"  (from page {event['old'].get('page', '?')})"
+        elif event['change'] == 'edited':
+            previous = ' '.join(str(event['old'].get('content', '')).split())
+            detail = f"  (was: {previous[:60]})" if previous != content else f"  (was by {event['old'].get('author')})"
+        elif event.get('state'):
+            detail = f"  ({event['state']})"
+        print(f"{event['change']:<9} {comment.get('page', '?'):>4}  {comment.get('author', '')}  {content[:100]}{detail}",
+              flush=True)
+
+    print(', '.join(f"{count} {change}" for change, count in counts.items()), file=sys.stderr)
+    return 0
+
+
+def cmd_watch(args):
+    """Keep extracting new and changed PDFs under some folders until interrupted"""
+    try:
+        if args.output:
+            sink = JsonlSink(args.output)
+            state_path = args.state or args.output + '.watch-state'
+        else:
+            index = CommentIndex(args.index_path)
+            sink = IndexSink(index)
+            state_path = args.state or index.path + '.watch-state'
+        state = WatchState(state_path)
+    except (OSError, sqlite3.Error) as e:
+        logger.error(f"Cannot open output: {e}")
+        return 1
+
+    watcher = FolderWatcher(
+        args.folders, sink, state,
+        jobs=args.jobs,
+        settle=args.settle,
+        fallback=args.fallback,
+        fast=args.fast,
+        incremental=args.incremental,
+        cache=False if args.no_cache else (args.cache_path or True)
+    )
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    print(f"Watching {', '.join(watcher.roots)} ({len(state.files)} files already processed)", file=sys.stderr)
+    try:
+        watcher.run(interval=args.interval, stop=stop, once=args.once)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        sink.close()
+        state.close()
+    return 0
+
+
+def cmd_serve(args):
+    """Answer extraction requests over HTTP until interrupted"""
+    def ready(address):
+        print(f"Serving on http://{address[0]}:{address[1]}/ with {args.jobs} workers", file=sys.stderr)
+
+    try:
+        asyncio.run(serve(
+            args.host, args.port, jobs=args.jobs, max_queue=args.max_queue, ready=ready,
+            cache=False if args.no_cache else (args.cache_path or True)
+        ))
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        logger.error(f"Cannot serve on {args.host}:{args.port}: {e}")
+        return 1
+    return 0
+
+
+def positive_int(text):
+    """argparse type for counts that must be at least 1"""
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not an integer: {text!r}")
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return value
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='pdf-comments',
+        description='Extract comments from PDF files without the GUI'
+    )
+    parser.add_argument('--version', action='version', version=f'%(prog)s {__version__}')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Show parser progress messages')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    extract = subparsers.add_parser(
+        'extract',
+        help='Extract comments as JSON lines, one record per comment'
+    )
+    extract.add_argument('paths', nargs='+', help='PDF files, directories or glob patterns')
+    extract.add_argument(
+        '-j', '--jobs', type=int, default=os.cpu_count() or 1,
+        help='Number of worker processes (default: number of cores)'
+    )
+    extract.add_argument('-o', '--output', help='Write records to this file instead of stdout')
+    extract.add_argument(
+        '--fallback', action='store_true',
+        help='Retry with the alternate parser when no comments are found'
+    )
+    extract.add_argument(
+        '--fast', action='store_true',
+        help='Only walk the page tree for annotations (faster on sparse documents)'
+    )
+    extract.add_argument(
+        '--workers', type=int, default=None,
+        help='Split each large file into page ranges extracted by this many processes '
+             '(useful for a few very large files; combine with --jobs 1)'
+    )
+    extract.add_argument(
+        '--backend', choices=['auto', *BACKENDS],
+        help='Extract with this backend, or pick one per file with auto'
+    )
+    extract.add_argument(
+        '--race', action='store_true',
+        help='Run the two best backends for each file at once and keep the first result '
+             '(only with --jobs 1; implies --backend auto)'
+    )
+    extract.add_argument(
+        '--incremental', action='store_true',
+        help='Only parse revisions appended to files since they were last extracted'
+    )
+    extract.add_argument('--no-cache', action='store_true', help='Always re-parse, ignoring cached results')
+    extract.add_argument('--cache-path', help='Extraction cache database (default: in the user cache dir)')
+    extract.set_defaults(func=cmd_extract)
+
+    index = subparsers.add_parser(
+        'index',
+        help='Add PDF files to the search index (only new and changed files are extracted)'
+    )
+    index.add_argument('paths', nargs='+', help='PDF files, directories or glob patterns')
+    index.add_argument(
+        '-j', '--jobs', type=int, default=os.cpu_count() or 1,
+        help='Number of worker processes (default: number of cores)'
+    )
+    index.add_argument('--index-path', help='Search index database (default: in the user cache dir)')
+    index.add_argument('--fallback', action='store_true', help='Retry with the alternate parser when no comments are found')
+    index.add_argument('--fast', action='store_true', help='Only walk the page tree for annotations')
+    index.add_argument('--no-cache', action='store_true', help='Always re-parse, ignoring cached results')
+    index.add_argument('--cache-path', help='Extraction cache database (default: in the user cache dir)')
+    index.set_defaults(func=cmd_index)
+
+    search = subparsers.add_parser('search', help='Search the comments of indexed files')
+    search.add_argument('query', nargs='*', help='Words that must all appear (a trailing * matches prefixes)')
+    search.add_argument('--author', default='', help='Only comments whose author contains this')
+    search.add_argument('--type', default='', help='Only this annotation type (e.g. Text, Highlight)')
+    search.add_argument('--since', default='', help='Only comments dated on or after YYYY[-MM[-DD]]')
+    search.add_argument('--until', default='', help='Only comments dated on or before YYYY[-MM[-DD]]')
+    search.add_argument('--file', default='', help='Only files whose path contains this')
+    search.add_argument('--limit', type=int, default=50, help='Maximum number of results (default: 50)')
+    search.add_argument('--raw', action='store_true', help='Pass the query to SQLite FTS5 unchanged')
+    search.add_argument('--json', action='store_true', help='Print one JSON object per result')
+    search.add_argument('--index-path', help='Search index database (default: in the user cache dir)')
+    search.set_defaults(func=cmd_search)
+
+    report = subparsers.add_parser(
+        'report',
+        help='Count comments per author, type, file, page band, week or month'
+    )
+    report.add_argument('paths', nargs='+', help='PDF files, directories or glob patterns')
+    report.add_argument(
+        '--by', action='append', choices=GROUPS,
+        help='Group to count by (repeatable, default: author)'
+    )
+    report.add_argument('--band', type=positive_int, default=10, help='Pages per band with --by pages (default: 10)')
+    report.add_argument('--author', default='', help='Only comments by this author (exact)')
+    report.add_argument('--type', default='', help='Only this annotation type (e.g. Text, Highlight)')
+    report.add_argument('--pages', default='', help='Only these pages, e.g. 5, 3-10, 7- or -4')
+    report.add_argument('--since', default='', help='Only comments dated on or after YYYY[-MM[-DD]]')
+    report.add_argument('--until', default='', help='Only comments dated on or before YYYY[-MM[-DD]]')
+    report.add_argument('--text', default='', help='Only comments containing this text')
+    report.add_argument('--list', action='store_true', help='Also list the matching comments')
+    report.add_argument('--sort', choices=SORT_KEYS, default='page', help='Order of --list (default: page)')
+    report.add_argument('--descending', action='store_true', help='Reverse the --sort order')
+    report.add_argument('--limit', type=int, default=50, help='Most comments listed (default: 50)')
+    report.add_argument('--json', action='store_true', help='Print JSON lines instead of tables')
+    report.add_argument(
+        '-j', '--jobs', type=int, default=os.cpu_count() or 1,
+        help='Number of worker processes (default: number of cores)'
+    )
+    report.add_argument('--fallback', action='store_true', help='Retry with the alternate parser when no comments are found')
+    report.add_argument('--fast', action='store_true', help='Only walk the page tree for annotations')
+    report.add_argument('--no-cache', action='store_true', help='Always re-parse, ignoring cached results')
+    report.add_argument('--cache-path', help='Extraction cache database (default: in the user cache dir)')
+    report.set_defaults(func=cmd_report)
+
+    diff = subparsers.add_parser(
+        'diff',
+        help='Compare the comments of two revisions of a PDF'
+    )
+    diff.add_argument('old', help='Earlier revision')
+    diff.add_argument('new', help='Later revision')
+    diff.add_argument('--json', action='store_true', help='Print one JSON object per change')
+    diff.add_argument('--fallback', action='store_true', help='Retry with the alternate parser when no comments are found')
+    diff.add_argument('--fast', action='store_true', help='Only walk the page tree for annotations')
+    diff.add_argument('--no-cache', action='store_true', help='Always re-parse, ignoring cached results')
+    diff.add_argument('--cache-path', help='Extraction cache database (default: in the user cache dir)')
+    diff.set_defaults(func=cmd_diff)
+
+    watch = subparsers.add_parser(
+        'watch',
+        help='Watch folders and extract PDFs as they are added or changed'
+    )
+    watch.add_argument('folders', nargs='+', help='Folders to watch (including subfolders)')
+    output = watch.add_mutually_exclusive_group(required=True)
+    output.add_argument('-o', '--output', help='Append one JSON line per processed file to this file')
+    output.add_argument('--index', action='store_true', help='Keep the search index up to date instead')
+    watch.add_argument('--index-path', help='Search index database (default: in the user cache dir)')
+    watch.add_argument(
+        '--state',
+        help='File recording what was already processed, so a restart skips unchanged files '
+             '(default: next to the output)'
+    )
+    watch.add_argument('--interval', type=float, default=5.0, help='Seconds between folder scans (default: 5)')
+    watch.add_argument(
+        '--settle', type=float, default=2.0,
+        help='Seconds a file must stay unchanged before it is read, so copies in progress are skipped (default: 2)'
+    )
+    watch.add_argument(
+        '-j', '--jobs', type=int, default=os.cpu_count() or 1,
+        help='Number of worker processes (default: number of cores)'
+    )
+    watch.add_argument('--once', action='store_true', help='Exit once every change found has been processed')
+    watch.add_argument('--fallback', action='store_true', help='Retry with the alternate parser when no comments are found')
+    watch.add_argument('--fast', action='store_true', help='Only walk the page tree for annotations')
+    watch.add_argument(
+        '--incremental', action='store_true',
+        help='Only parse revisions appended to files since they were last extracted'
+    )
+    watch.add_argument('--no-cache', action='store_true', help='Always re-parse, ignoring cached results')
+    watch.add_argument('--cache-path', help='Extraction cache database (default: in the user cache dir)')
+    watch.set_defaults(func=cmd_watch)
+
+    server = subparsers.add_parser(
+        'serve',
+        help='Run a local HTTP service that extracts comments on a pool of warm worker processes'
+    )
+    server.add_argument('--host', default=DEFAULT_HOST, help=f'Interface to listen on (default: {DEFAULT_HOST})')
+    server.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'Port to listen on (default: {DEFAULT_PORT})')
+    server.add_argument(
+        '-j', '--jobs', type=int, default=os.cpu_count() or 1,
+        help='Number of worker processes (default: number of cores)'
+    )
+    server.add_argument(
+        '--max-queue', type=int, default=None,
+        help='Extractions queued or running before requests are refused with 503 (default: 4 per worker)'
+    )
+    server.add_argument('--no-cache', action='store_true', help='Always re-parse, ignoring cached results')
+    server.add_argument('--cache-path', help='Extraction cache database (default: in the user cache dir)')
+    server.set_defaults(func=cmd_serve)
+
+    profile = subparsers.add_parser(
+        'profile',
+        help='Show per-stage timings and counters for each file (the cache is not used)'
+    )
+    profile.add_argument('paths', nargs='+', help='PDF files, directories or glob patterns')
+    profile.add_argument('--fast', action='store_true', help='Profile the fast page-tree walk')
+    profile.add_argument('--fallback', action='store_true', help='Allow the alternate parser fallback')
+    profile.add_argument('--alternate', action='store_true', help='Try the alternate parser first')
+    profile.add_argument('--workers', type=int, default=None, help='Split large files across processes')
+    profile.add_argument('--backend', choices=['auto', *BACKENDS], help='Profile this backend, or the one auto picks')
+    profile.add_argument('--race', action='store_true', help='Race the two best backends for each file')
+    profile.add_argument('--json', action='store_true', help='Print one JSON object per file')
+    profile.set_defaults(func=cmd_profile)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(format=LOG_FORMAT)
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
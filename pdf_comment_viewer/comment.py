@@ -0,0 +1,135 @@
+import sys
+import hashlib
+from collections.abc import Mapping
+
+# Fields in the order they appear in records
+FIELDS = ('id', 'page', 'index', 'content', 'author', 'date', 'type', 'source', 'parent_id', 'thread_id', 'key',
+          'state')
+
+# Fields left out of the record when they are None: page and index are
+# unknown for annotations found outside the page tree, source is only set by
+# the alternate parsers, parent_id only for replies, thread_id only for
+# comments in a reply thread (see threads.assign_threads), key only when the
+# parser read the annotation's dictionary, and state only for review state
+# replies
+OPTIONAL_FIELDS = frozenset(('page', 'index', 'source', 'parent_id', 'thread_id', 'key', 'state'))
+
+
+def _text(value):
+    """Normalize a string-like value to a plain str, dropping pypdf object types"""
+    if value is None:
+        return ''
+    if isinstance(value, bytes):
+        return value.decode('latin-1', errors='replace')
+    return str(value)
+
+
+def annotation_key(name, type, rect, author, page):
+    """
+    Return a key identifying an annotation across revisions of a document
+
+    The annotation's unique name (/NM) is used when it has one. Otherwise the
+    key is a hash of its subtype, rectangle (rounded to hundredths of a
+    point), author and page, which stays the same as long as the annotation
+    is not moved or reassigned.
+
+    Args:
+        name: The /NM entry, or None
+        type (str): Annotation subtype such as '/Text'
+        rect: The /Rect entry as four numbers, or None
+        author (str): Annotation author
+        page (int): 1-based page number, or None
+
+    Returns:
+        str: The key
+    """
+    name = _text(name)
+    if name:
+        return f'nm:{name}'
+    try:
+        corners = ','.join(f'{float(value):.2f}' for value in rect)
+    except (TypeError, ValueError):
+        corners = ''
+    data = '\x00'.join((_text(type), corners, _text(author), str(page if page is not None else '')))
+    return 'h:' + hashlib.blake2b(data.encode('utf-8', errors='replace'), digest_size=8).hexdigest()
+
+
+class Comment(Mapping):
+    """
+    One extracted comment
+
+    id is the annotation's object number. A reply (an annotation with an
+    /IRT entry) has the object number of the annotation it answers as
+    parent_id, and thread_id is the id of the first comment of the thread.
+    key identifies the annotation across revisions of the document (see
+    annotation_key), and state is the review state ('Accepted', 'Completed'
+    and so on) set by a state reply.
+
+    Fields are plain str/int values held in slots rather than a dict, and
+    the type and author strings are interned, since a document typically
+    repeats a handful of each. Nothing refers back to the parser's objects,
+    so a reader can be freed as soon as its comments are extracted.
+
+    The comment is also a read-only mapping of its fields, so code written
+    for the comment dictionaries returned before (comment['content'],
+    comment.get('page'), dict(comment)) keeps working.
+    """
+
+    __slots__ = FIELDS
+
+    def __init__(self, content='', author='Unknown', date='', type='', page=None, index=None, id=None,
+                 source=None, parent_id=None, thread_id=None, key=None, state=None):
+        self.id = int(id) if id is not None else None
+        self.parent_id = int(parent_id) if parent_id is not None else None
+        self.thread_id = int(thread_id) if thread_id is not None else None
+        self.page = int(page) if page is not None else None
+        self.index = int(index) if index is not None else None
+        self.content = _text(content)
+        self.author = sys.intern(_text(author))
+        self.date = _text(date)
+        self.type = sys.intern(_text(type))
+        self.source = sys.intern(source) if source is not None else None
+        self.key = _text(key) if key is not None else None
+        self.state = sys.intern(_text(state).lstrip('/')) if state else None
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a comment from a record dictionary, as stored in the cache"""
+        return cls(**{key: data[key] for key in FIELDS if key in data})
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self}
+
+    def _replace(self, **changes):
+        """Return a copy with some fields changed"""
+        values = {key: getattr(self, key) for key in FIELDS}
+        values.update(changes)
+        return Comment(**values)
+
+    def __getitem__(self, key):
+        if key in FIELDS:
+            value = getattr(self, key)
+            if value is not None or key not in OPTIONAL_FIELDS:
+                return value
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None) if key in FIELDS else None
+        if value is None and (key in OPTIONAL_FIELDS or key not in FIELDS):
+            return default
+        return value
+
+    def __contains__(self, key):
+        return key in FIELDS and (key not in OPTIONAL_FIELDS or getattr(self, key) is not None)
+
+    def __iter__(self):
+        for key in FIELDS:
+            if key not in OPTIONAL_FIELDS or getattr(self, key) is not None:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        fields = ', '.join(f'{key}={getattr(self, key)!r}' for key in self)
+        return f'Comment({fields})'
@@ -0,0 +1,345 @@
+import os
+import re
+import time
+import sqlite3
+import logging
+import threading
+
+from batch import run_batch
+from cache import default_cache_dir
+from comment_table import date_bound
+
+logger = logging.getLogger(__name__)
+
+# Comment rows written per INSERT batch while indexing a file
+INSERT_BATCH = 1000
+
+# Queries matching more comments than this are not ranked by relevance
+RANK_LIMIT = 5000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    comments INTEGER NOT NULL,
+    error TEXT,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS comments (
+    rowid INTEGER PRIMARY KEY,
+    doc_id INTEGER NOT NULL REFERENCES documents (doc_id) ON DELETE CASCADE,
+    page INTEGER,
+    idx INTEGER,
+    comment_id INTEGER,
+    parent_id INTEGER,
+    thread_id INTEGER,
+    type TEXT NOT NULL,
+    author TEXT NOT NULL,
+    date TEXT NOT NULL,
+    sort_date TEXT NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS comments_doc ON comments (doc_id);
+CREATE INDEX IF NOT EXISTS comments_sort_date ON comments (sort_date);
+CREATE VIRTUAL TABLE IF NOT EXISTS comments_fts USING fts5 (
+    content, author, content='comments', content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS comments_ai AFTER INSERT ON comments BEGIN
+    INSERT INTO comments_fts (rowid, content, author) VALUES (new.rowid, new.content, new.author);
+END;
+CREATE TRIGGER IF NOT EXISTS comments_ad AFTER DELETE ON comments BEGIN
+    INSERT INTO comments_fts (comments_fts, rowid, content, author)
+    VALUES ('delete', old.rowid, old.content, old.author);
+END;
+"""
+
+# D:YYYYMMDDHHmmSS with every part after the year optional
+_PDF_DATE_RE = re.compile(r'^(?:D:)?(\d{4})(\d{2})?(\d{2})?(\d{2})?(\d{2})?(\d{2})?')
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def sortable_date(date):
+    """
+    Convert a PDF date string ("D:20240115093000+01'00'") to "2024-01-15 09:30:00"
+
+    The time zone is dropped. Missing parts default to the start of the
+    period, and anything that isn't a PDF date gives ''.
+    """
+    match = _PDF_DATE_RE.match(date or '')
+    if not match:
+        return ''
+    year, month, day, hour, minute, second = (part or default for part, default in zip(
+        match.groups(), ('', '01', '01', '00', '00', '00')
+    ))
+    return f"{year}-{month}-{day} {hour}:{minute}:{second}"
+
+
+def text_query(text):
+    """
+    Turn free text into an FTS5 query matching comments that contain every word
+
+    Each word is quoted, so punctuation and FTS5 operators typed by a user
+    can't cause syntax errors. A trailing '*' on a word is kept as a prefix
+    search ("toler*").
+    """
+    terms = []
+    for word in text.split():
+        prefix = word.endswith('*')
+        for term in _TERM_RE.findall(word):
+            terms.append(f'"{term}"')
+        if prefix and terms:
+            terms[-1] += '*'
+    return ' '.join(terms)
+
+
+class CommentIndex:
+    """
+    Full-text index of the comments of many PDF files
+
+    Comments are stored in SQLite with an FTS5 table over their content and
+    author, so a word query touches only the postings of its terms. Each
+    file is indexed with its size and modification time, so update() only
+    re-extracts files that changed since; prune() drops files that were
+    deleted.
+
+    Args:
+        path (str): SQLite database file (defaults to the user cache dir)
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(default_cache_dir(), 'comment-index.sqlite3')
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA foreign_keys=ON')
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def stale_paths(self, paths):
+        """
+        Yield the paths whose file is not indexed in its current state
+
+        Args:
+            paths (iterable): PDF file paths
+        """
+        for path, _ in self._stale(paths):
+            yield path
+
+    def _stale(self, paths):
+        """Yield (path, (size, mtime_ns)) for the stale files among paths"""
+        for path in paths:
+            path = os.path.abspath(path)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            with self._lock:
+                row = self._db.execute(
+                    'SELECT size, mtime_ns FROM documents WHERE path = ?', (path,)
+                ).fetchone()
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if row is None or tuple(row) != signature:
+                yield path, signature
+
+    def put(self, pdf_file_path, records, signature, error=None):
+        """
+        Replace the indexed comments of one file
+
+        Args:
+            pdf_file_path (str): Path to the PDF file
+            records (list): Comment records (Comments or dictionaries)
+            signature (tuple): (size, mtime_ns) of the file as it was before
+                extraction, so a file changed meanwhile is found stale again
+            error (str): Extraction error, stored so the file is not retried
+                until it changes
+        """
+        path = os.path.abspath(pdf_file_path)
+        size, mtime_ns = signature
+        with self._lock:
+            with self._db:
+                self._db.execute('DELETE FROM documents WHERE path = ?', (path,))
+                doc_id = self._db.execute(
+                    'INSERT INTO documents (path, size, mtime_ns, comments, error, indexed_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (path, size, mtime_ns, len(records), error, time.time())
+                ).lastrowid
+                for start in range(0, len(records), INSERT_BATCH):
+                    self._db.executemany(
+                        'INSERT INTO comments (doc_id, page, idx, comment_id, parent_id, thread_id, '
+                        'type, author, date, sort_date, content) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        [
+                            (
+                                doc_id, r.get('page'), r.get('index'), r.get('id'), r.get('parent_id'),
+                                r.get('thread_id'), str(r.get('type', '')), str(r.get('author', 'Unknown')),
+                                str(r.get('date', '')), sortable_date(str(r.get('date', ''))),
+                                str(r.get('content', ''))
+                            )
+                            for r in records[start:start + INSERT_BATCH]
+                        ]
+                    )
+
+    def remove(self, pdf_file_path):
+        with self._lock:
+            with self._db:
+                self._db.execute('DELETE FROM documents WHERE path = ?', (os.path.abspath(pdf_file_path),))
+
+    def prune(self):
+        """
+        Drop files that no longer exist from the index
+
+        Returns:
+            int: Number of files removed
+        """
+        with self._lock:
+            paths = [row[0] for row in self._db.execute('SELECT path FROM documents')]
+        missing = [path for path in paths if not os.path.exists(path)]
+        for path in missing:
+            self.remove(path)
+        return len(missing)
+
+    def update(self, paths, jobs=None, stats=None, progress=None, **options):
+        """
+        Extract and index the files among paths that changed since last indexed
+
+        Args:
+            paths (iterable): PDF file paths
+            jobs (int): Worker processes (see batch.run_batch)
+            stats (BatchStats): Optional stats updated as files finish
+            progress (callable): Called as progress(path, comment count, error)
+                after each file is stored
+            **options: Extra keyword arguments for extract_comments
+
+        Returns:
+            int: Number of files (re-)indexed
+        """
+        signatures = {}
+
+        def stale():
+            for path, signature in self._stale(paths):
+                signatures[path] = signature
+                yield path
+
+        count = 0
+        for path, records, error in run_batch(stale(), jobs=jobs, stats=stats, **options):
+            if error:
+                logger.warning(f"{path}: {error}")
+            self.put(path, records, signatures.pop(path), error)
+            count += 1
+            if progress is not None:
+                progress(path, len(records), error)
+        return count
+
+    def search(self, text='', author='', type='', since='', until='', path='', limit=100, raw=False):
+        """
+        Find indexed comments
+
+        Every criterion is optional and they all have to match. When the
+        words match at most RANK_LIMIT comments, results are ranked by
+        relevance (bm25). Otherwise ranking would score every match, so they
+        come most recently indexed first, which FTS5 can stream straight
+        from its postings and stop after limit rows.
+
+        Args:
+            text (str): Words that must all appear in the content or author
+                (see text_query); with raw=True, an FTS5 query expression
+            author (str): Words that must all appear in the author, in any
+                order and case ("j smith" finds "Smith, J.")
+            type (str): Annotation subtype, with or without the leading '/'
+            since (str): Earliest date, as "YYYY", "YYYY-MM" or "YYYY-MM-DD"
+            until (str): Latest date (inclusive), same formats as since
+            path (str): Substring of the file path
+            limit (int): Maximum number of results
+            raw (bool): Pass text to FTS5 unchanged
+
+        Returns:
+            list: One dictionary per comment with file, page, index, id,
+            type, author, date and content
+
+        Raises:
+            ValueError: If since or until is not in one of the date formats
+        """
+        # Dates are compared as "YYYY-MM-DD..." strings, which only works
+        # for bounds in that form
+        for bound in (since, until):
+            if bound:
+                date_bound(bound)
+
+        parts = []
+        query = text if raw else text_query(text or '')
+        if query:
+            parts.append(f'({query})' if raw else query)
+        author_query = text_query(author or '')
+        if author_query:
+            parts.append(f'author : ({author_query})')
+        query = ' AND '.join(parts)
+
+        clauses = []
+        params = []
+        if query:
+            source = 'comments_fts f JOIN comments c ON c.rowid = f.rowid'
+            clauses.append('comments_fts MATCH ?')
+            params.append(query)
+        else:
+            source = 'comments c'
+        if type:
+            clauses.append('c.type = ?')
+            params.append(type if type.startswith('/') else '/' + type)
+        if since:
+            clauses.append("c.sort_date >= ? AND c.sort_date != ''")
+            params.append(since)
+        if until:
+            # "2024-03" must include every date in March
+            clauses.append("c.sort_date < ? AND c.sort_date != ''")
+            params.append(until + '\uffff')
+        if path:
+            clauses.append("d.path LIKE ? ESCAPE '\\'")
+            params.append('%' + _escape_like(path) + '%')
+
+        with self._lock:
+            # Ordering by the FTS table's own rowid lets it stream, c.rowid would sort
+            order = 'f.rowid DESC' if query else 'c.rowid DESC'
+            if query and self._count_matches(query, RANK_LIMIT + 1) <= RANK_LIMIT:
+                order = 'f.rank'
+            sql = (
+                f'SELECT d.path, c.page, c.idx, c.comment_id, c.type, c.author, c.date, c.content '
+                f'FROM {source} JOIN documents d ON d.doc_id = c.doc_id'
+                + (' WHERE ' + ' AND '.join(clauses) if clauses else '')
+                + f' ORDER BY {order} LIMIT ?'
+            )
+            rows = self._db.execute(sql, params + [limit]).fetchall()
+        return [
+            dict(file=row[0], page=row[1], index=row[2], id=row[3], type=row[4], author=row[5], date=row[6],
+                 content=row[7])
+            for row in rows
+        ]
+
+    def _count_matches(self, query, stop):
+        """Count the comments matching an FTS5 query, giving up at stop"""
+        return self._db.execute(
+            'SELECT COUNT(*) FROM (SELECT rowid FROM comments_fts WHERE comments_fts MATCH ? LIMIT ?)',
+            (query, stop)
+        ).fetchone()[0]
+
+    def summary(self):
+        """Return (files, comments) currently in the index"""
+        with self._lock:
+            return tuple(self._db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(comments), 0) FROM documents'
+            ).fetchone())
+
+
+def _escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
@@ -0,0 +1,159 @@
+import re
+
+from threads import thread_order
+from comment_table import CommentTable
+
+PAGE_RANGE_PATTERN = re.compile(r'^\s*(\d*)\s*(?:-\s*(\d*)\s*)?$')
+
+
+def parse_page_range(text):
+    """
+    Parse a page range such as "5", "3-10", "7-" or "-4"
+
+    Returns:
+        tuple: (first, last) with None for an open end, or None if text is
+        empty or not a page range
+    """
+    match = PAGE_RANGE_PATTERN.match(text or '')
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    first = int(match.group(1)) if match.group(1) else None
+    if match.group(2) is None and '-' not in text:
+        return first, first
+    last = int(match.group(2)) if match.group(2) else None
+    return first, last
+
+
+def display_type(comment):
+    return str(comment.get('type', '')).replace('/', '')
+
+
+class CommentFilter:
+    """
+    Criteria for the comments shown in the viewer
+
+    Empty criteria match everything. text is matched case-insensitively
+    against the content, author and type.
+    """
+
+    def __init__(self, author='', type='', pages=None, text=''):
+        self.author = author
+        self.type = type
+        self.pages = pages
+        self.text = text.lower()
+
+    def __eq__(self, other):
+        return isinstance(other, CommentFilter) and vars(self) == vars(other)
+
+    def narrows(self, other):
+        """Whether everything this filter matches is also matched by other"""
+        return (
+            self.author == other.author and self.type == other.type
+            and self.pages == other.pages and other.text in self.text
+        )
+
+    def is_empty(self):
+        return not (self.author or self.type or self.pages or self.text)
+
+
+class CommentModel:
+    """
+    In-memory list of comments and the indices of those matching a filter
+
+    Comments are kept in a CommentTable, which computes the lowercased
+    search text and encodes the author and type of each comment once when
+    it is added, so filtering is a few passes over its columns. When a
+    filter only narrows the previous one (for example another character
+    typed into the search box) just the rows currently shown are checked
+    again.
+
+    Replies are shown right after the comment they answer, one level
+    deeper (see threads.thread_order). Comments added while a document is
+    still being extracted are appended in page order, set_comments puts
+    the whole list in thread order.
+    """
+
+    def __init__(self):
+        self.table = CommentTable()
+        self.comments = self.table.comments
+        self.visible = []
+        self.filter = CommentFilter()
+        self._order = []
+        self._depths = []
+        self._rows_by_id = {}
+
+    def __len__(self):
+        return len(self.visible)
+
+    def __getitem__(self, row):
+        """Return the comment shown at a row of the filtered view"""
+        return self.comments[self.visible[row]]
+
+    def depth(self, row):
+        """Return how deep in its reply thread the comment at a row is"""
+        return self._depths[self.visible[row]]
+
+    def parent_of(self, comment):
+        """Return the comment that comment replies to, if it was extracted"""
+        i = self._rows_by_id.get(comment.get('parent_id'))
+        return self.comments[i] if i is not None else None
+
+    def clear(self):
+        self.__init__()
+
+    def extend(self, comments):
+        """Add comments, showing those that match the current filter"""
+        start = len(self.comments)
+        comments = list(comments)
+        for row, comment in enumerate(comments, start):
+            parent = self._rows_by_id.get(comment.get('parent_id'))
+            if comment.get('id') is not None:
+                self._rows_by_id.setdefault(comment['id'], row)
+            self._depths.append(self._depths[parent] + 1 if parent is not None else 0)
+        self.table.extend(comments)
+        self._order.extend(range(start, len(self.comments)))
+        self.visible.extend(self._matching(range(start, len(self.comments)), self.filter))
+
+    def set_comments(self, comments):
+        """Replace all comments, keeping the current filter"""
+        comment_filter = self.filter
+        self.clear()
+        self.filter = comment_filter
+        self.extend(comments)
+        if any(comment.get('parent_id') is not None for comment in self.comments):
+            self._order = []
+            for i, depth in thread_order(self.comments):
+                self._order.append(i)
+                self._depths[i] = depth
+            self.visible = self._matching(self._order, self.filter)
+
+    def authors(self):
+        return sorted(self.table.authors)
+
+    def types(self):
+        return sorted(self.table.types)
+
+    def apply(self, comment_filter):
+        """
+        Show only the comments matching comment_filter
+
+        Returns:
+            bool: Whether the visible rows changed
+        """
+        if comment_filter == self.filter:
+            return False
+        if comment_filter.narrows(self.filter):
+            candidates = self.visible
+        else:
+            candidates = self._order
+        self.filter = comment_filter
+        self.visible = self._matching(candidates, comment_filter)
+        return True
+
+    def _matching(self, candidates, comment_filter):
+        if comment_filter.is_empty():
+            return list(candidates)
+        return self.table.filter(
+            candidates, author=comment_filter.author, type=comment_filter.type, pages=comment_filter.pages,
+            text=comment_filter.text
+        ).tolist()
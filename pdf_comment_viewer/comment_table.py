@@ -0,0 +1,459 @@
+import re
+import math
+import time
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Row numbers, and the codes of dictionary-encoded columns
+ROW_TYPECODE = 'q'
+CODE_TYPECODE = 'I'
+
+# Dates are parsed in blocks of this many rows, which bounds the temporary
+# arrays of the vectorised parser
+DATE_BLOCK = 65536
+
+# Characters of a date string looked at: "D:" + 14 digits + "+HH'mm'"
+DATE_WIDTH = 24
+
+GROUPS = ('author', 'type', 'file', 'pages', 'week', 'month')
+SORT_KEYS = ('page', 'author', 'type', 'file', 'date')
+
+_PDF_DATE_RE = re.compile(
+    r"^(?:D:)?(\d{4})(\d{2})?(\d{2})?(\d{2})?(\d{2})?(\d{2})?(?:([Zz+\-])(?:(\d{2})'?(\d{2})?)?)?"
+)
+
+_SECONDS_PER_DAY = 86400
+
+
+def _days_from_civil(year, month, day):
+    """Days since 1970-01-01 of a proleptic Gregorian date"""
+    year -= month <= 2
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+
+def parse_pdf_date(date):
+    """
+    Convert a PDF date string ("D:20240115093000+01'00'") to POSIX seconds
+
+    Missing parts default to the start of the period, a missing time zone
+    is taken as UTC. Anything that isn't a valid PDF date gives NaN.
+    """
+    match = _PDF_DATE_RE.match(date or '')
+    if not match:
+        return math.nan
+    parts = match.groups()
+    year = int(parts[0])
+    month, day, hour, minute, second = (
+        int(part) if part else default for part, default in zip(parts[1:6], (1, 1, 0, 0, 0))
+    )
+    if not (1 <= month <= 12 and 1 <= day <= 31 and hour <= 23 and minute <= 59 and second <= 59):
+        return math.nan
+    offset = 0
+    if parts[6] in ('+', '-') and parts[7]:
+        offset = int(parts[7]) * 3600 + int(parts[8] or 0) * 60
+        if parts[6] == '-':
+            offset = -offset
+    return float(
+        _days_from_civil(year, month, day) * _SECONDS_PER_DAY + hour * 3600 + minute * 60 + second - offset
+    )
+
+
+def parse_pdf_dates(dates):
+    """
+    Convert many PDF date strings to POSIX seconds at once (NaN when invalid)
+
+    With NumPy, each block of strings is laid out as a matrix of code points
+    and every date part is computed with array arithmetic. Without it, each
+    distinct string is parsed once with parse_pdf_date.
+
+    Returns:
+        array: Float64 ('d') array of timestamps
+    """
+    dates = [date if isinstance(date, str) else str(date or '') for date in dates]
+    result = array('d')
+    if np is None:
+        parsed = {}
+        for date in dates:
+            value = parsed.get(date)
+            if value is None:
+                value = parsed[date] = parse_pdf_date(date)
+            result.append(value)
+        return result
+
+    # Many comments have no date at all, only the others need parsing
+    present = [i for i, date in enumerate(dates) if date]
+    if len(present) < len(dates):
+        values = np.full(len(dates), np.nan)
+        if present:
+            values[present] = np.frombuffer(parse_pdf_dates([dates[i] for i in present]), dtype=np.float64)
+        return array('d', values.tobytes())
+    for start in range(0, len(dates), DATE_BLOCK):
+        result.frombytes(_parse_date_block(dates[start:start + DATE_BLOCK]).tobytes())
+    return result
+
+
+def date_bound(text, end=False):
+    """
+    Convert "YYYY", "YYYY-MM" or "YYYY-MM-DD" (UTC) to POSIX seconds
+
+    With end=True, return the start of the following year, month or day
+    instead, for use as an exclusive upper bound.
+
+    Raises:
+        ValueError: If text is not one of those formats
+    """
+    parts = text.strip().split('-')
+    if not (1 <= len(parts) <= 3 and all(part.isdigit() for part in parts) and len(parts[0]) == 4
+            and all(len(part) == 2 for part in parts[1:])):
+        raise ValueError(f"Expected YYYY, YYYY-MM or YYYY-MM-DD, got {text!r}")
+    year, month, day = (list(map(int, parts)) + [1, 1])[:3]
+    value = parse_pdf_date(f"{year:04d}{month:02d}{day:02d}")
+    if math.isnan(value):
+        raise ValueError(f"Not a valid date: {text!r}")
+    if end:
+        if len(parts) == 3:
+            return value + _SECONDS_PER_DAY
+        year, month = (year + 1, month) if len(parts) == 1 else (year + month // 12, month % 12 + 1)
+        value = parse_pdf_date(f"{year:04d}{month:02d}01")
+    return value
+
+
+def _parse_date_block(dates):
+    count = len(dates)
+    codes = np.array(dates, dtype=f'U{DATE_WIDTH + 2}').view(np.uint32).reshape(count, DATE_WIDTH + 2)
+    prefixed = (codes[:, 0] == ord('D')) & (codes[:, 1] == ord(':'))
+    chars = np.where(prefixed[:, None], codes[:, 2:], codes[:, :DATE_WIDTH]).astype(np.int64)
+    digits = chars - ord('0')
+    is_digit = (digits >= 0) & (digits <= 9)
+
+    valid = is_digit[:, :4].all(axis=1)
+    year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    # Each part is only present if every part before it is
+    present = valid.copy()
+    length = np.full(count, 4)
+    parts = []
+    for position, default in zip((4, 6, 8, 10, 12), (1, 1, 0, 0, 0)):
+        present &= is_digit[:, position] & is_digit[:, position + 1]
+        parts.append(np.where(present, digits[:, position] * 10 + digits[:, position + 1], default))
+        length += 2 * present
+    month, day, hour, minute, second = parts
+    valid &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31) & (hour <= 23) & (minute <= 59) & (second <= 59)
+
+    # Time zone: a sign right after the last digit, then HH, then optionally mm
+    rows = np.arange(count)
+    sign = chars[rows, length]
+    sign = np.where(sign == ord('+'), 1, np.where(sign == ord('-'), -1, 0))
+    has_hours = is_digit[rows, length + 1] & is_digit[rows, length + 2]
+    sign = np.where(has_hours, sign, 0)
+    tz_hours = digits[rows, length + 1] * 10 + digits[rows, length + 2]
+    minutes_at = length + 3 + (chars[rows, length + 3] == ord("'"))
+    has_minutes = is_digit[rows, minutes_at] & is_digit[rows, minutes_at + 1]
+    tz_minutes = np.where(has_minutes, digits[rows, minutes_at] * 10 + digits[rows, minutes_at + 1], 0)
+    offset = sign * (tz_hours * 3600 + tz_minutes * 60)
+
+    # _days_from_civil, on arrays
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    days = era * 146097 + day_of_era - 719468
+
+    seconds = days * _SECONDS_PER_DAY + hour * 3600 + minute * 60 + second - offset
+    return np.where(valid, seconds.astype(np.float64), np.nan)
+
+
+def _day(days, format):
+    """Format a day given as days since 1970-01-01"""
+    return time.strftime(format, time.gmtime(days * _SECONDS_PER_DAY))
+
+
+class CommentTable:
+    """
+    Comments stored column by column, for filtering and aggregating many rows
+
+    Pages are an int32 array (0 when unknown) and dates float64 POSIX
+    seconds (NaN when missing), parsed once when rows are added. Author,
+    type and file are dictionary-encoded: each distinct string is stored
+    once and rows hold its integer code. Operations use NumPy views of the
+    arrays when NumPy is installed, and plain loops over them otherwise.
+
+    Row numbers are positions in the order comments were added; the
+    comment itself is self.comments[row].
+    """
+
+    def __init__(self, comments=(), file=None):
+        self.comments = []
+        self.pages = array('i')
+        self.dates = array('d')
+        self.authors = []
+        self.types = []
+        self.files = []
+        self._author_codes = array(CODE_TYPECODE)
+        self._type_codes = array(CODE_TYPECODE)
+        self._file_codes = array(CODE_TYPECODE)
+        self._codes = {'author': {}, 'type': {}, 'file': {}}
+        self._haystacks = []
+        self.extend(comments, file)
+
+    def __len__(self):
+        return len(self.comments)
+
+    def _encode(self, column, values, value):
+        codes = self._codes[column]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+
+    def extend(self, comments, file=None):
+        """
+        Add comments
+
+        Args:
+            comments (iterable): Comment records (Comments or dictionaries)
+            file (str): File the comments come from, for grouping by file
+        """
+        comments = list(comments)
+        if not comments:
+            return
+        file_code = self._encode('file', self.files, file or '')
+        author_codes, type_codes = self._codes['author'], self._codes['type']
+        pages, authors, types, dates, haystacks = [], [], [], [], []
+        for comment in comments:
+            get = comment.get
+            author = str(get('author', 'Unknown'))
+            subtype = str(get('type', '')).replace('/', '')
+            code = author_codes.get(author)
+            authors.append(code if code is not None else self._encode('author', self.authors, author))
+            code = type_codes.get(subtype)
+            types.append(code if code is not None else self._encode('type', self.types, subtype))
+            pages.append(get('page') or 0)
+            dates.append(get('date', ''))
+            haystacks.append(f"{get('content', '')}\n{author}\n{subtype}".lower())
+
+        self.comments.extend(comments)
+        self.pages.extend(pages)
+        self._author_codes.extend(authors)
+        self._type_codes.extend(types)
+        self._file_codes.extend([file_code] * len(comments))
+        self._haystacks.extend(haystacks)
+        self.dates.extend(parse_pdf_dates(dates))
+
+    def author(self, row):
+        return self.authors[self._author_codes[row]]
+
+    def type(self, row):
+        return self.types[self._type_codes[row]]
+
+    def file(self, row):
+        return self.files[self._file_codes[row]]
+
+    def _column(self, name):
+        return {
+            'page': self.pages, 'date': self.dates, 'author': self._author_codes, 'type': self._type_codes,
+            'file': self._file_codes,
+        }[name]
+
+    def _view(self, name):
+        column = self._column(name)
+        dtype = np.dtype(column.typecode)
+        return np.frombuffer(column, dtype=dtype) if len(column) else np.zeros(0, dtype=dtype)
+
+    def _rows(self, rows):
+        """Row numbers as an array of the kind the other operations take"""
+        if rows is None:
+            rows = range(len(self.comments))
+        if np is not None:
+            if isinstance(rows, range):
+                return np.arange(rows.start, rows.stop, rows.step, dtype=np.int64)
+            return np.asarray(rows, dtype=np.int64)
+        return rows if isinstance(rows, array) else array(ROW_TYPECODE, rows)
+
+    def filter(self, rows=None, author='', type='', pages=None, since=None, until=None, text=''):
+        """
+        Return the rows matching every given criterion, in the order of rows
+
+        Args:
+            rows (sequence): Rows to consider (all by default)
+            author (str): Exact author
+            type (str): Exact type, with or without the leading '/'
+            pages (tuple): (first, last) page, either end None for open
+            since (float): Earliest date, POSIX seconds
+            until (float): Latest date (exclusive), POSIX seconds
+            text (str): Lowercase substring of the content, author or type
+
+        Returns:
+            Row numbers: a NumPy int64 array, or an array('q') without NumPy;
+            both have tolist()
+        """
+        author_code = type_code = None
+        if author:
+            author_code = self._codes['author'].get(author, -1)
+        if type:
+            type_code = self._codes['type'].get(type.replace('/', ''), -1)
+        if pages:
+            first = max(pages[0] or 1, 1)
+            last = pages[1] if pages[1] is not None else 2 ** 31 - 1
+
+        if np is not None:
+            rows = self._rows(rows)
+            if author_code is not None:
+                rows = rows[self._view('author')[rows] == author_code]
+            if type_code is not None:
+                rows = rows[self._view('type')[rows] == type_code]
+            if pages:
+                values = self._view('page')[rows]
+                rows = rows[(values >= first) & (values <= last)]
+            if since is not None:
+                rows = rows[self._view('date')[rows] >= since]
+            if until is not None:
+                rows = rows[self._view('date')[rows] < until]
+            if text:
+                haystacks = self._haystacks
+                rows = np.asarray([i for i in rows.tolist() if text in haystacks[i]], dtype=np.int64)
+            return rows
+
+        rows = range(len(self.comments)) if rows is None else rows
+        if author_code is not None:
+            codes = self._author_codes
+            rows = [i for i in rows if codes[i] == author_code]
+        if type_code is not None:
+            codes = self._type_codes
+            rows = [i for i in rows if codes[i] == type_code]
+        if pages:
+            page_numbers = self.pages
+            rows = [i for i in rows if first <= page_numbers[i] <= last]
+        # NaN compares false either way, like NumPy
+        if since is not None:
+            dates = self.dates
+            rows = [i for i in rows if dates[i] >= since]
+        if until is not None:
+            dates = self.dates
+            rows = [i for i in rows if dates[i] < until]
+        if text:
+            haystacks = self._haystacks
+            rows = [i for i in rows if text in haystacks[i]]
+        return array(ROW_TYPECODE, rows)
+
+    def sort(self, rows=None, by='page', descending=False):
+        """
+        Return rows ordered by a column (see SORT_KEYS)
+
+        The sort is stable, so rows keep their order among equal keys. Rows
+        without a date come last when sorting by date, in either direction.
+        """
+        rows = self._rows(rows)
+        ranks = None
+        if by in ('author', 'type', 'file'):
+            # Order codes by the strings they stand for
+            values = {'author': self.authors, 'type': self.types, 'file': self.files}[by]
+            ranks = [0] * len(values)
+            for rank, code in enumerate(sorted(range(len(values)), key=values.__getitem__)):
+                ranks[code] = rank
+
+        if np is not None:
+            keys = self._view(by)[rows]
+            if ranks is not None:
+                keys = np.asarray(ranks, dtype=np.int64)[keys]
+            undated = rows[:0]
+            if by == 'date':
+                missing = np.isnan(keys)
+                rows, keys, undated = rows[~missing], keys[~missing], rows[missing]
+            order = np.argsort(-keys if descending else keys, kind='stable')
+            return np.concatenate((rows[order], undated))
+
+        column = self._column(by)
+        undated = []
+        if by == 'date':
+            undated = [i for i in rows if math.isnan(column[i])]
+            rows = [i for i in rows if not math.isnan(column[i])]
+        key = (lambda i: ranks[column[i]]) if ranks is not None else column.__getitem__
+        return array(ROW_TYPECODE, sorted(rows, key=key, reverse=descending) + undated)
+
+    def counts(self, by, rows=None, band=10):
+        """
+        Count rows per group
+
+        Args:
+            by (str): 'author', 'type', 'file', 'pages' (bands of band
+                pages), 'week' (starting Monday) or 'month' of the date
+            rows (sequence): Rows to count (all by default)
+            band (int): Pages per band when grouping by pages
+
+        Returns:
+            list: (group, count) pairs, largest first for author, type and
+            file, otherwise in group order. Groups are strings; rows with
+            no page or date are counted under None, last.
+        """
+        if by not in GROUPS:
+            raise ValueError(f"Cannot group by {by!r}, expected one of {', '.join(GROUPS)}")
+        rows = self._rows(rows)
+
+        if by in ('author', 'type', 'file'):
+            names = {'author': self.authors, 'type': self.types, 'file': self.files}[by]
+            if np is not None:
+                totals = np.bincount(self._view(by)[rows], minlength=len(names)).tolist()
+            else:
+                totals = [0] * len(names)
+                column = self._column(by)
+                for i in rows:
+                    totals[column[i]] += 1
+            groups = [(names[code], total) for code, total in enumerate(totals) if total]
+            return sorted(groups, key=lambda group: (-group[1], group[0]))
+
+        name = 'page' if by == 'pages' else 'date'
+        if np is not None:
+            values = self._view(name)[rows]
+            missing = values <= 0 if by == 'pages' else np.isnan(values)
+            values = values[~missing]
+            if by == 'pages':
+                keys = (values.astype(np.int64) - 1) // band
+            else:
+                keys = np.floor(values / _SECONDS_PER_DAY).astype(np.int64)
+                if by == 'week':
+                    keys -= (keys + 3) % 7
+            unique, totals = np.unique(keys, return_counts=True)
+            pairs = list(zip(unique.tolist(), totals.tolist()))
+            missing_count = int(missing.sum())
+        else:
+            column = self._column(name)
+            totals = {}
+            missing_count = 0
+            for i in rows:
+                value = column[i]
+                if value <= 0 if by == 'pages' else math.isnan(value):
+                    missing_count += 1
+                    continue
+                if by == 'pages':
+                    key = (value - 1) // band
+                else:
+                    key = math.floor(value / _SECONDS_PER_DAY)
+                    if by == 'week':
+                        key -= (key + 3) % 7
+                totals[key] = totals.get(key, 0) + 1
+            pairs = sorted(totals.items())
+
+        if by == 'pages':
+            groups = [(f"{key * band + 1}-{(key + 1) * band}", total) for key, total in pairs]
+        elif by == 'week':
+            groups = [(_day(key, '%Y-%m-%d'), total) for key, total in pairs]
+        else:
+            # Days to months: several days can fall in the same month
+            months = {}
+            for key, total in pairs:
+                month = _day(key, '%Y-%m')
+                months[month] = months.get(month, 0) + total
+            groups = list(months.items())
+        if missing_count:
+            groups.append((None, missing_count))
+        return groups
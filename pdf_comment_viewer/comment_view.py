@@ -0,0 +1,166 @@
+import tkinter as tk
+from tkinter import ttk
+
+from comment_model import display_type
+
+COLUMNS = (
+    ('page', "Page", 50),
+    ('type', "Type", 90),
+    ('author', "Author", 120),
+    ('date', "Date", 140),
+    ('content', "Content", 400),
+)
+
+
+def row_values(comment, depth=0):
+    content = str(comment.get('content', ''))
+    if depth:
+        # Replies are indented under the comment they answer
+        content = '    ' * (depth - 1) + '\u21b3 ' + content
+    return (
+        comment.get('page') or '',
+        display_type(comment),
+        comment.get('author', 'Unknown'),
+        comment.get('date') or '',
+        # Only the first line fits in a row, the details pane shows the rest
+        content.split('\n', 1)[0][:300],
+    )
+
+
+class CommentView(ttk.Frame):
+    """
+    Table of comments that only creates rows for what is on screen
+
+    The Treeview holds just enough items to fill its height. Scrolling moves
+    an offset into the model and rewrites those items, so showing or
+    filtering 100k comments costs the same as showing 30.
+
+    Args:
+        parent: Parent widget
+        model (CommentModel): Comments to show
+        on_select (callable): Called with the selected comment, or None
+    """
+
+    def __init__(self, parent, model, on_select=None):
+        super().__init__(parent)
+        self.model = model
+        self.on_select = on_select
+        self.top = 0
+        self.selected_row = None
+        self._items = []
+        self._rendering = False
+
+        self.tree = ttk.Treeview(
+            self, columns=[c[0] for c in COLUMNS], show='headings', selectmode='browse'
+        )
+        for name, heading, width in COLUMNS:
+            self.tree.heading(name, text=heading)
+            self.tree.column(name, width=width, stretch=(name == 'content'), anchor=tk.W)
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.tree.bind('<Configure>', lambda event: self.refresh())
+        self.tree.bind('<<TreeviewSelect>>', self.on_tree_select)
+        self.tree.bind('<MouseWheel>', self.on_mousewheel)
+        self.tree.bind('<Button-4>', lambda event: self.scroll(-3))
+        self.tree.bind('<Button-5>', lambda event: self.scroll(3))
+        self.tree.bind('<Up>', lambda event: self.move_selection(-1))
+        self.tree.bind('<Down>', lambda event: self.move_selection(1))
+        self.tree.bind('<Prior>', lambda event: self.move_selection(-self.page_size()))
+        self.tree.bind('<Next>', lambda event: self.move_selection(self.page_size()))
+        self.tree.bind('<Home>', lambda event: self.move_selection(-len(self.model)))
+        self.tree.bind('<End>', lambda event: self.move_selection(len(self.model)))
+
+    def page_size(self):
+        """Number of rows that fit in the widget"""
+        height = self.tree.winfo_height()
+        row_height = int(ttk.Style().lookup('Treeview', 'rowheight') or 20)
+        header = 0
+        if self._items:
+            bbox = self.tree.bbox(self._items[0])
+            header = bbox[1] if bbox else 0
+        return max(1, (height - header) // row_height)
+
+    def reset(self):
+        """Scroll back to the top and clear the selection after the model changed"""
+        self.top = 0
+        self.select_row(None)
+        self.refresh()
+
+    def refresh(self):
+        """Redraw the visible rows from the model"""
+        size = self.page_size()
+        total = len(self.model)
+        self.top = max(0, min(self.top, total - size))
+        count = min(size, total - self.top)
+
+        while len(self._items) < count:
+            self._items.append(self.tree.insert('', tk.END))
+        while len(self._items) > count:
+            self.tree.delete(self._items.pop())
+
+        self._rendering = True
+        try:
+            for offset, item in enumerate(self._items):
+                row = self.top + offset
+                self.tree.item(item, values=row_values(self.model[row], self.model.depth(row)))
+            if self.selected_row is not None and 0 <= self.selected_row - self.top < count:
+                self.tree.selection_set(self._items[self.selected_row - self.top])
+            else:
+                self.tree.selection_set(())
+        finally:
+            self._rendering = False
+
+        if total:
+            self.scrollbar.set(self.top / total, (self.top + count) / total)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def scroll(self, rows):
+        self.top += rows
+        self.refresh()
+        return 'break'
+
+    def on_scrollbar(self, action, amount, unit=None):
+        if action == 'moveto':
+            self.top = int(float(amount) * len(self.model))
+            self.refresh()
+        elif unit == 'pages':
+            self.scroll(int(amount) * self.page_size())
+        else:
+            self.scroll(int(amount))
+
+    def on_mousewheel(self, event):
+        # Windows reports multiples of 120, macOS small deltas
+        delta = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        return self.scroll(-3 * delta)
+
+    def on_tree_select(self, event):
+        if self._rendering:
+            return
+        selection = self.tree.selection()
+        if selection and selection[0] in self._items:
+            self.select_row(self.top + self._items.index(selection[0]))
+
+    def select_row(self, row):
+        if row is not None and not 0 <= row < len(self.model):
+            row = None
+        self.selected_row = row
+        if self.on_select:
+            self.on_select(self.model[row] if row is not None else None)
+
+    def move_selection(self, rows):
+        if not len(self.model):
+            return 'break'
+        current = self.selected_row if self.selected_row is not None else self.top - (1 if rows > 0 else 0)
+        row = max(0, min(len(self.model) - 1, current + rows))
+        self.select_row(row)
+
+        size = self.page_size()
+        if row < self.top:
+            self.top = row
+        elif row >= self.top + size:
+            self.top = row - size + 1
+        self.refresh()
+        return 'break'
@@ -0,0 +1,201 @@
+import hashlib
+import logging
+import sqlite3
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from batch import extract_file, _init_worker
+from cache import ExtractionCache
+
+logger = logging.getLogger(__name__)
+
+# Review states that close a comment; any other state (such as 'None', set
+# when a comment is reopened) leaves it open
+RESOLVED_STATES = frozenset(('Accepted', 'Rejected', 'Cancelled', 'Completed'))
+
+# Fields whose change makes a comment count as edited
+EDIT_FIELDS = ('content', 'author')
+
+CHANGES = ('edited', 'moved', 'resolved', 'reopened', 'added', 'removed')
+
+
+def fingerprint(comment):
+    """
+    Return the key matching a comment with itself in another revision
+
+    This is the key the parser derived from the annotation (see
+    comment.annotation_key). Comments found without their annotation
+    dictionary have none, and are keyed by their type, author, page and
+    content instead.
+    """
+    key = comment.get('key')
+    if key:
+        return key
+    data = '\x00'.join(str(comment.get(field, '')) for field in ('type', 'author', 'page', 'content'))
+    return 'c:' + hashlib.blake2b(data.encode('utf-8', errors='replace'), digest_size=8).hexdigest()
+
+
+def _signature(comment):
+    return comment.get('type'), comment.get('author'), comment.get('content')
+
+
+def _states(comments):
+    """Return {key: state} from the latest state reply to each comment"""
+    keys = {comment['id']: fingerprint(comment) for comment in comments if comment.get('id') is not None}
+    states = {}
+    for comment in comments:
+        key = keys.get(comment.get('parent_id'))
+        if comment.get('state') and key is not None:
+            states[key] = comment['state']
+    return states
+
+
+def _event(change, old, new, state=None):
+    event = {'change': change, 'key': fingerprint(new if new is not None else old)}
+    if state is not None:
+        event['state'] = state
+    event['old'] = dict(old) if old is not None else None
+    event['new'] = dict(new) if new is not None else None
+    return event
+
+
+def diff_comments(old, new):
+    """
+    Compare the comments of two revisions of a document
+
+    Comments are matched by fingerprint through a dictionary of the old
+    revision, so the comparison is linear in the number of comments. A
+    comment whose key changed (one without a /NM name that was moved, which
+    changes the rectangle or page its key is derived from) is matched in a
+    second pass by its type, author and content. Review state replies are
+    not reported themselves; they make the comment they answer resolved or
+    reopened.
+
+    Events for comments found in both revisions are yielded while new is
+    consumed, so it can be a generator; added and removed comments follow
+    at the end.
+
+    Args:
+        old (list): Comments or comment records of the earlier revision
+        new (iterable): Comments or comment records of the later revision
+
+    Yields:
+        dict: {'change': one of CHANGES, 'key': fingerprint, 'state': review
+        state (resolved and reopened only), 'old': old record or None,
+        'new': new record or None}. A comment that was both edited and moved
+        yields an event for each.
+    """
+    old = list(old)
+    old_states = _states(old)
+    by_key = {}
+    for comment in old:
+        if not comment.get('state'):
+            by_key.setdefault(fingerprint(comment), deque()).append(comment)
+
+    seen = []
+    kept = []
+    unmatched = []
+    for comment in new:
+        seen.append(comment)
+        if comment.get('state'):
+            continue
+        candidates = by_key.get(fingerprint(comment))
+        if not candidates:
+            unmatched.append(comment)
+            continue
+        kept.append(comment)
+        yield from _changes(candidates.popleft(), comment)
+
+    # Unmatched old comments by signature, for comments whose key changed
+    by_signature = {}
+    for candidates in by_key.values():
+        for comment in candidates:
+            by_signature.setdefault(_signature(comment), deque()).append(comment)
+    added = []
+    for comment in unmatched:
+        candidates = by_signature.get(_signature(comment))
+        if candidates:
+            kept.append(comment)
+            yield _event('moved', candidates.popleft(), comment)
+        else:
+            added.append(comment)
+
+    # States are compared once every reply of the new revision has been seen
+    new_states = _states(seen)
+    for comment in kept:
+        key = fingerprint(comment)
+        before, after = old_states.get(key), new_states.get(key)
+        if before == after:
+            continue
+        if after in RESOLVED_STATES:
+            yield _event('resolved', None, comment, after)
+        elif before in RESOLVED_STATES:
+            yield _event('reopened', None, comment, after)
+
+    for comment in added:
+        yield _event('added', None, comment, new_states.get(fingerprint(comment)))
+    for candidates in by_signature.values():
+        for comment in candidates:
+            yield _event('removed', comment, None)
+
+
+def _changes(old, new):
+    if any(old.get(field) != new.get(field) for field in EDIT_FIELDS):
+        yield _event('edited', old, new)
+    if old.get('page') != new.get('page'):
+        yield _event('moved', old, new)
+
+
+def extract_revisions(old_path, new_path, fallback=False, cache=False, **options):
+    """
+    Extract the comments of two files for a diff
+
+    A file whose result is in the extraction cache is not parsed again. When
+    neither is cached, the old file is extracted in a worker process while
+    the new one is extracted in this one.
+
+    Args:
+        old_path (str): Earlier revision
+        new_path (str): Later revision
+        fallback (bool): Retry with the alternate parser when nothing is found
+        cache (bool or str): Use the extraction cache; a string selects the
+            cache database file instead of the default one
+        **options: Extra keyword arguments for extract_comments
+
+    Returns:
+        list: [(records, error) for the old file, (records, error) for the new one]
+    """
+    paths = [old_path, new_path]
+    results = [None, None]
+    if cache:
+        try:
+            # A private connection, closed before any worker is forked
+            store = ExtractionCache(cache if isinstance(cache, str) else None)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Extraction cache unavailable: {str(e)}")
+            store = None
+        if store is not None:
+            variant = store.variant(use_alternate=options.get('use_alternate', False), fallback=fallback)
+            try:
+                for i, path in enumerate(paths):
+                    records = store.get(path, variant)
+                    if records is not None:
+                        logger.info(f"Using the cached comments of {path}")
+                        results[i] = (records, None)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"Extraction cache lookup failed: {str(e)}")
+            finally:
+                store.close()
+
+    missing = [i for i, result in enumerate(results) if result is None]
+    if len(missing) == 2:
+        with ProcessPoolExecutor(
+            max_workers=1, initializer=_init_worker, initargs=(logging.getLogger().level,)
+        ) as executor:
+            future = executor.submit(extract_file, old_path, fallback, cache=cache, **options)
+            results[1] = extract_file(new_path, fallback, cache=cache, **options)[1:]
+            results[0] = future.result()[1:]
+    elif missing:
+        i = missing[0]
+        results[i] = extract_file(paths[i], fallback, cache=cache, **options)[1:]
+    return results
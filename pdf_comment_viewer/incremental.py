@@ -0,0 +1,343 @@
+import os
+import mmap
+import hashlib
+import logging
+
+from alternate_parser import (
+    ObjectIndex, RawDocument, Ref, find_startxref, read_xref_sections, get_object_index
+)
+from comment import Comment
+from threads import assign_threads
+from text_layout import DocumentLayouts, fill_markup_text
+
+logger = logging.getLogger(__name__)
+
+# Bytes at the start and at the old end of a file that must be unchanged for
+# an update to count as appended
+FINGERPRINT_BYTES = 4096
+
+
+class UnsupportedUpdate(Exception):
+    """Raised when appended revisions cannot be merged into a previous result"""
+
+
+def _fingerprint(buffer, size):
+    """Digest of the first and last FINGERPRINT_BYTES of buffer[:size]"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(buffer[:min(size, FINGERPRINT_BYTES)])
+    digest.update(buffer[max(0, size - FINGERPRINT_BYTES):size])
+    digest.update(str(size).encode('ascii'))
+    return digest.hexdigest()
+
+
+class _AppendedDocument(RawDocument):
+    """
+    RawDocument over only the objects of the appended revisions
+
+    Reading an older object is rare (for example the /Popup of an edited
+    annotation), so the index of the whole file is only loaded the first
+    time one is needed.
+    """
+
+    def __init__(self, buffer, index, pdf_file_path, deleted):
+        super().__init__(buffer, index, source=None)
+        self._path = pdf_file_path
+        self._deleted = deleted
+        self._full_index = False
+
+    def get(self, num):
+        if num in self._deleted:
+            return None
+        known = num in self._objects or num in self.index.offsets or num in self.index.compressed
+        if not known and not self._full_index:
+            logger.debug(f"Object {num} predates the appended revisions, loading full index")
+            self.index = get_object_index(self._path, self.buffer)
+            self._full_index = True
+        return super().get(num)
+
+
+def _page_layout(pdf_file_path, buffer):
+    """
+    Record the page layout needed to merge later updates into a result
+
+    Only the page tree and the /Annots arrays are read, not the annotations.
+
+    Args:
+        pdf_file_path (str): Path to the PDF file
+        buffer: The mapped file
+
+    Returns:
+        dict: Object numbers of the pages, page tree nodes, /Annots arrays
+        and annotations, or None if the raw parser cannot handle the file
+    """
+    index = get_object_index(pdf_file_path, buffer)
+    if '/Encrypt' in index.trailer:
+        return None
+
+    document = RawDocument(buffer, index, source=None)
+    catalog = document.resolve(index.trailer.get('/Root'))
+    pages_root = catalog.get('/Pages') if isinstance(catalog, dict) else None
+
+    nodes = set()
+    pages = []
+    arrays = []
+    annots = []
+    for page_num, (num, page) in enumerate(document.iter_page_refs(nodes), 1):
+        pages.append(num)
+        annots_ref = page.get('/Annots')
+        if isinstance(annots_ref, Ref):
+            arrays.append([annots_ref.num, page_num])
+        annots.extend([num, page_num] for num in _annotation_numbers(document, annots_ref))
+
+    if not pages:
+        return None
+
+    return {
+        'pages': pages,
+        'pages_root': pages_root.num if isinstance(pages_root, Ref) else None,
+        'nodes': sorted(nodes),
+        'arrays': arrays,
+        'annots': annots,
+    }
+
+
+def _annotation_numbers(document, annots_ref):
+    """Object numbers of the indirect annotations in a page's /Annots"""
+    annots = document.resolve(annots_ref)
+    if not isinstance(annots, list):
+        return []
+    return [annot.num for annot in annots if isinstance(annot, Ref)]
+
+
+def _apply_update(pdf_file_path, buffer, previous, startxref):
+    """
+    Merge the revisions appended since previous into its comments
+
+    Only the xref sections written after the previous revision are read, and
+    only the objects they list are parsed: rewritten pages have their
+    /Annots re-read (reusing the records of annotations that didn't change),
+    edited comments are re-parsed in place and freed ones are dropped. Other
+    edited annotations, which may have become comments (a note that gained
+    /Contents, the parent of a rewritten popup), have their page re-read.
+
+    Raises:
+        UnsupportedUpdate: If earlier bytes changed or the page tree itself
+            was modified, in which case a full extraction is needed
+    """
+    if _fingerprint(buffer, previous['size']) != previous['fingerprint']:
+        raise UnsupportedUpdate("earlier revisions were modified")
+    if startxref == previous['startxref']:
+        return previous['comments'], previous
+
+    sections = read_xref_sections(buffer, startxref, stop_at=previous['startxref'])
+    if 'annots' not in previous:
+        raise UnsupportedUpdate("previous state doesn't list the annotations of each page")
+    if sections is None or not sections[2]:
+        raise UnsupportedUpdate("xref chain does not lead back to the previous revision")
+    entries, trailer, _ = sections
+
+    changed = {num for num, entry in entries.items() if entry}
+    deleted = {num for num, entry in entries.items() if entry is None}
+    document = _AppendedDocument(buffer, ObjectIndex.from_entries(entries, trailer), pdf_file_path, deleted)
+
+    page_numbers = {num: page_num for page_num, num in enumerate(previous['pages'], 1) if num is not None}
+    if (changed | deleted) & set(previous['nodes']) or deleted & page_numbers.keys():
+        raise UnsupportedUpdate("page tree was modified")
+
+    root = trailer.get('/Root')
+    if isinstance(root, Ref) and root.num in changed:
+        catalog = document.resolve(root)
+        pages_root = catalog.get('/Pages') if isinstance(catalog, dict) else None
+        if not isinstance(pages_root, Ref) or pages_root.num != previous['pages_root']:
+            raise UnsupportedUpdate("catalog points to a different page tree")
+
+    arrays = {num: page_num for num, page_num in previous['arrays']}
+    annots = {num: page_num for num, page_num in previous['annots']}
+    by_id = {c['id']: c for c in previous['comments'] if c.get('id') is not None}
+
+    redo_pages = set()
+    edited = set()
+    for num in changed:
+        if num in page_numbers:
+            redo_pages.add(page_numbers[num])
+        elif num in arrays:
+            redo_pages.add(arrays[num])
+        elif num in by_id:
+            edited.add(num)
+        else:
+            if num in annots:
+                # An annotation that wasn't a comment may have become one
+                redo_pages.add(annots[num])
+            # A rewritten popup changes the contents of its parent annotation
+            obj = document.get(num)
+            if isinstance(obj, dict) and obj.get('/Subtype') == '/Popup':
+                parent = obj.get('/Parent')
+                if isinstance(parent, Ref) and (parent.num in by_id or parent.num in annots):
+                    edited.add(parent.num)
+                    if parent.num not in by_id:
+                        redo_pages.add(annots[parent.num])
+
+    rebuilt = {}
+    layouts = DocumentLayouts(pdf_file_path)
+    for page_num in redo_pages:
+        page_ref = previous['pages'][page_num - 1]
+        page = document.get(page_ref) if page_ref is not None else None
+        if not isinstance(page, dict):
+            raise UnsupportedUpdate(f"page {page_num} could not be read")
+
+        arrays = {num: p for num, p in arrays.items() if p != page_num}
+        annots_ref = page.get('/Annots')
+        if isinstance(annots_ref, Ref):
+            arrays[annots_ref.num] = page_num
+        annots = {num: p for num, p in annots.items() if p != page_num}
+        annots.update((num, page_num) for num in _annotation_numbers(document, annots_ref))
+        page_annots = document.resolve(annots_ref)
+
+        page_comments = []
+        for i, annot_ref in enumerate(page_annots if isinstance(page_annots, list) else []):
+            num = annot_ref.num if isinstance(annot_ref, Ref) else None
+            if num is not None and num not in changed and num not in edited:
+                if num in by_id:
+                    page_comments.append(by_id[num]._replace(page=page_num, index=i))
+                # Unchanged annotations without a record were not comments
+                continue
+            comment = document.comment(document.resolve(annot_ref), page_num, i, num)
+            if comment:
+                page_comments.append(comment)
+        fill_markup_text(page_comments, document, layouts)
+        rebuilt[page_num] = page_comments
+
+    comments = []
+    pending = sorted(rebuilt)
+    for comment in previous['comments']:
+        page_num = comment.get('page')
+        while pending and pending[0] < page_num:
+            comments.extend(rebuilt[pending.pop(0)])
+        if page_num in rebuilt:
+            if pending and pending[0] == page_num:
+                comments.extend(rebuilt[pending.pop(0)])
+            continue
+
+        num = comment.get('id')
+        if num in deleted:
+            continue
+        if num in edited:
+            comment = document.comment(document.get(num), page_num, comment['index'], num)
+            if not comment:
+                continue
+            edited_comment = [comment]
+            fill_markup_text(edited_comment, document, layouts)
+            comment = edited_comment[0]
+        comments.append(comment)
+    for page_num in pending:
+        comments.extend(rebuilt[page_num])
+
+    state = dict(
+        previous,
+        arrays=[[num, page_num] for num, page_num in arrays.items()],
+        annots=[[num, page_num] for num, page_num in annots.items()]
+    )
+    logger.info(
+        f"Merged {len(entries)} changed objects from appended revisions "
+        f"({len(redo_pages)} pages re-read, {len(edited)} annotations edited)"
+    )
+    return comments, state
+
+
+def extract_comments_incremental(pdf_file_path, cache, progress=None):
+    """
+    Return comments from the cache, parsing only the revisions appended since
+
+    The state of the last processed revision (file size, startxref offset, a
+    fingerprint of the file's head and old tail, the page object numbers and
+    the comments) is kept in the cache. When the file has since grown by
+    incremental saves, only the new xref sections and the objects they list
+    are read and merged into the previous comments, so the cost depends on
+    the size of the update rather than of the document. Anything else (a
+    first run, a rewritten file, a changed page tree) is left to the caller
+    to extract the usual way and save with record_revision.
+
+    Results that are reused or merged are reported at once, as the last page.
+
+    Args:
+        pdf_file_path (str): Path to the PDF file
+        cache (ExtractionCache): Cache holding the per-file state
+        progress (callable): Called as progress(page_num, page_count, comments)
+
+    Returns:
+        list: Comment records, or None if the file needs a full extraction
+    """
+    stat = os.stat(pdf_file_path)
+    previous = cache.get_revision(pdf_file_path)
+    if previous is None:
+        return None
+    previous['comments'] = [Comment.from_dict(c) for c in previous['comments']]
+    if (previous['size'], previous['mtime_ns']) == (stat.st_size, stat.st_mtime_ns):
+        _report(progress, previous['pages'], previous['comments'])
+        return previous['comments']
+    if stat.st_size < previous['size']:
+        return None
+
+    with open(pdf_file_path, 'rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            startxref = find_startxref(buffer)
+            if startxref is None:
+                return None
+            try:
+                comments, state = _apply_update(pdf_file_path, buffer, previous, startxref)
+            except UnsupportedUpdate as e:
+                logger.info(f"Re-extracting {os.path.basename(pdf_file_path)} in full: {str(e)}")
+                return None
+
+            # Replies may have been added or deleted, rebuild the threads
+            comments = assign_threads(comments)
+            state = _revision_state(state, buffer, stat, startxref, comments)
+
+    cache.put_revision(pdf_file_path, state)
+    _report(progress, state['pages'], comments)
+    return comments
+
+
+def record_revision(pdf_file_path, cache, comments, stat):
+    """
+    Save the state extract_comments_incremental needs to update comments
+
+    Args:
+        pdf_file_path (str): Path to the PDF file
+        cache (ExtractionCache): Cache holding the per-file state
+        comments (list): Comment records extracted from the file in full
+        stat (os.stat_result): The file's stat from before the extraction;
+            nothing is saved if the file has changed since
+
+    Returns:
+        bool: Whether the state was saved
+    """
+    with open(pdf_file_path, 'rb') as file:
+        current = os.fstat(file.fileno())
+        if (current.st_size, current.st_mtime_ns) != (stat.st_size, stat.st_mtime_ns) or not stat.st_size:
+            return False
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            startxref = find_startxref(buffer)
+            layout = _page_layout(pdf_file_path, buffer) if startxref is not None else None
+            if layout is None:
+                return False
+            state = _revision_state(layout, buffer, stat, startxref, comments)
+
+    cache.put_revision(pdf_file_path, state)
+    return True
+
+
+def _revision_state(layout, buffer, stat, startxref, comments):
+    return dict(
+        layout,
+        size=stat.st_size,
+        mtime_ns=stat.st_mtime_ns,
+        startxref=startxref,
+        fingerprint=_fingerprint(buffer, stat.st_size),
+        comments=comments
+    )
+
+
+def _report(progress, pages, comments):
+    if progress is not None:
+        progress(len(pages), len(pages), comments)
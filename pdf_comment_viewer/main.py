@@ -1,14 +1,31 @@
+import logging
+import importlib
+import threading
 import tkinter as tk
+import multiprocessing
 from ui import PDFCommentViewerApp
 from version import __version__
 
+# Delay before the PDF parser is imported in the background, long enough for
+# the window to be drawn first
+PRELOAD_DELAY_MS = 250
+
+def preload_parser():
+    # The parser is imported on first use; doing it now while the user picks
+    # a file means the first extraction doesn't wait for it
+    threading.Thread(target=importlib.import_module, args=('pypdf',), daemon=True).start()
+
 def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     root = tk.Tk()
     app = PDFCommentViewerApp(root)
+    root.after(PRELOAD_DELAY_MS, preload_parser)
     root.mainloop()
 
 def run_app():
     main()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Needed for the page range worker processes in frozen executables
+    multiprocessing.freeze_support()
+    main()
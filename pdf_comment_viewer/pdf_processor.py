@@ -1,11 +1,27 @@
-import pypdf
+import os
+import re
+import mmap
+import time
+import sqlite3
 import logging
+from concurrent.futures import ProcessPoolExecutor
 
-from alternate_parser import extract_comments_alternate
+from alternate_parser import (
+    extract_comments_alternate, extract_comments_pymupdf, parse_pdf_manually, sniff, get_object_index, RawDocument,
+    UNKNOWN_TRAITS, COMMENT_SUBTYPES, MARKUP_SUBTYPES
+)
+from backends import Backend, register_backend, extract_with_backends
+from incremental import extract_comments_incremental, record_revision
+from comment import Comment, annotation_key
+from stats import NULL_STATS
+from threads import assign_threads
+from text_layout import TEXT_MARKUP_SUBTYPES, DocumentLayouts, build_layout, fill_markup_text
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+class ExtractionCancelled(Exception):
+    """Raised by a progress callback to stop extraction at a page boundary"""
+
 def get_contents_from_popup(annot_obj):
     """Extract contents from a popup annotation if present"""
     if '/Popup' in annot_obj:
@@ -15,132 +31,681 @@ def get_contents_from_popup(annot_obj):
             return popup_obj.get('/Contents', '')
     return ''
 
-def extract_comments(pdf_file_path, debug_mode=False, use_alternate=False):
+# Page objects larger than this are always parsed rather than peeked at
+RAW_PEEK_LIMIT = 64 * 1024
+
+# Documents are only split into shards of at least this many pages, smaller
+# ones don't make up for starting the worker processes
+MIN_SHARD_PAGES = 500
+
+# Shards per worker process, so a worker that drew a heavily annotated page
+# range doesn't hold up the others
+SHARDS_PER_WORKER = 2
+
+# The "N G obj" header an indirect object starts with
+OBJECT_HEADER = re.compile(rb'\s*(\d+)\s+(\d+)\s+obj\b')
+
+def _peek_raw_object(reader, ref, buffer=None):
+    """
+    Return the raw bytes of an uncompressed indirect object without parsing it
+    
+    The object is located through the xref table and read from buffer (the
+    mapped file) if given, else from the reader's stream. Returns None when
+    the object is compressed, already resolved, or too large to peek at, and
+    when the bytes at its offset don't start with its own "N G obj" header
+    (a stale or broken xref), so that it is parsed instead.
+    """
+    if (ref.generation, ref.idnum) in reader.resolved_objects:
+        return None
+    offset = reader.xref.get(ref.generation, {}).get(ref.idnum)
+    if offset is None:
+        return None
+    
+    if buffer is not None:
+        end = buffer.find(b'endobj', offset, offset + RAW_PEEK_LIMIT)
+        data = buffer[offset:end] if end != -1 else None
+    else:
+        data = _read_raw_object(reader.stream, offset)
+    if data is None:
+        return None
+    
+    header = OBJECT_HEADER.match(data)
+    if header is None or (int(header.group(1)), int(header.group(2))) != (ref.idnum, ref.generation):
+        logger.debug(f"No header for object {ref.idnum} {ref.generation} at offset {offset}, parsing it instead")
+        return None
+    return data
+
+def _read_raw_object(stream, offset):
+    stream.seek(offset)
+    data = b''
+    while len(data) < RAW_PEEK_LIMIT:
+        chunk = stream.read(4096)
+        if not chunk:
+            return None
+        # Search from just before the previous end in case the keyword was split
+        search_from = max(0, len(data) - 6)
+        data += chunk
+        end = data.find(b'endobj', search_from)
+        if end != -1:
+            return data[:end]
+    return None
+
+def iter_page_dicts(reader, buffer=None):
+    """
+    Walk the page tree and yield the raw dictionary of each page in order
+    
+    Unlike reader.pages this does not build PageObjects or copy inherited
+    attributes into every page, it only follows /Kids. Content streams and
+    resources are never resolved, and page objects whose raw bytes contain
+    neither /Kids nor /Annots are not parsed at all; an empty dict is yielded
+    in their place so page numbering stays correct.
+    
+    Args:
+        reader (pypdf.PdfReader): An opened (and decrypted) reader
+        buffer: The mapped file, to peek at page objects without seeking
+    
+    Yields:
+        dict: Page dictionary (empty for pages without annotations)
+    """
+    root = reader.trailer['/Root'].get('/Pages')
+    if root is None:
+        return
+    
+    visited = set()
+    stack = [root]
+    while stack:
+        node_ref = stack.pop()
+        idnum = getattr(node_ref, 'idnum', None)
+        if idnum is not None:
+            # Guard against malformed trees with cycles
+            if idnum in visited:
+                continue
+            visited.add(idnum)
+            
+            raw = _peek_raw_object(reader, node_ref, buffer)
+            if raw is not None and b'/Kids' not in raw and b'/Annots' not in raw:
+                yield {}
+                continue
+        
+        node = node_ref.get_object()
+        if not node:
+            continue
+        
+        kids = node.get('/Kids')
+        if kids is None:
+            yield node
+        else:
+            # Push in reverse so the leftmost kid is visited first
+            stack.extend(reversed(kids.get_object()))
+
+def iter_page_range(reader, first, last, buffer=None):
+    """
+    Yield (page number, page dictionary) for the pages first to last
+    
+    Like iter_page_dicts, but subtrees that end before first are skipped
+    using their /Count, and the walk stops after page last. Leaf pages are
+    peeked at: those before first are only counted, and those in range
+    without /Annots are skipped, so only annotated pages are yielded.
+    
+    Args:
+        reader (pypdf.PdfReader): An opened (and decrypted) reader
+        first (int): First page number (1-based)
+        last (int): Last page number, inclusive
+        buffer: The mapped file, to peek at page objects without seeking
+    """
+    root = reader.trailer['/Root'].get('/Pages')
+    if root is None:
+        return
+    
+    visited = set()
+    stack = [root]
+    page_num = 0
+    while stack and page_num < last:
+        node_ref = stack.pop()
+        idnum = getattr(node_ref, 'idnum', None)
+        if idnum is not None:
+            if idnum in visited:
+                continue
+            visited.add(idnum)
+            
+            raw = _peek_raw_object(reader, node_ref, buffer)
+            if raw is not None and b'/Kids' not in raw:
+                page_num += 1
+                if page_num >= first and b'/Annots' in raw:
+                    yield page_num, node_ref.get_object()
+                continue
+        
+        node = node_ref.get_object()
+        if not node:
+            continue
+        
+        kids = node.get('/Kids')
+        if kids is None:
+            page_num += 1
+            if page_num >= first:
+                yield page_num, node
+            continue
+        
+        count = node.get('/Count')
+        if isinstance(count, int) and page_num + count < first:
+            page_num += count
+            continue
+        stack.extend(reversed(kids.get_object()))
+
+def plan_shards(page_count, workers):
+    """
+    Split pages 1 to page_count into contiguous (first, last) ranges
+    
+    Returns a single range when the document is too small to be worth
+    splitting across processes.
+    """
+    if not page_count:
+        return []
+    count = min(workers * SHARDS_PER_WORKER, page_count // MIN_SHARD_PAGES)
+    if count <= 1:
+        return [(1, page_count)]
+    
+    size, extra = divmod(page_count, count)
+    shards = []
+    first = 1
+    for i in range(count):
+        last = first + size - 1 + (1 if i < extra else 0)
+        shards.append((first, last))
+        first = last + 1
+    return shards
+
+def extract_page_range(pdf_file_path, first, last):
+    """
+    Extract the comments of pages first to last (run in a worker process)
+    
+    The file is opened independently; concurrent shards read it through the
+    OS page cache.
+    
+    Returns:
+        list: Comment records
+    """
+    import pypdf
+
+    with open(pdf_file_path, 'rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            reader = pypdf.PdfReader(file)
+            if reader.is_encrypted:
+                reader.decrypt('')
+            
+            comments = []
+            for page_num, page in iter_page_range(reader, first, last, buffer):
+                comments.extend(page_comments(page, page_num))
+            return comments
+
+def _run_shards(pdf_file_path, shards, workers):
+    """
+    Extract shards in a process pool and yield (last page, comments) in order
+    
+    Shards still waiting to start are cancelled if the consumer stops early
+    (for example when a progress callback raises ExtractionCancelled).
+    """
+    executor = ProcessPoolExecutor(max_workers=min(workers, len(shards)))
+    futures = []
+    try:
+        futures = [
+            executor.submit(extract_page_range, pdf_file_path, first, last)
+            for first, last in shards
+        ]
+        for (first, last), future in zip(shards, futures):
+            yield last, future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+def extract_comments(pdf_file_path, debug_mode=False, use_alternate=False, fast=False, cache=None, incremental=False,
+                     progress=None, fallback=False, workers=None, stats=None, backend=None, race=False):
     """
     Extract comments from a PDF file
     
     Args:
         pdf_file_path (str): Path to the PDF file
         debug_mode (bool): Whether to log detailed debug information
+        use_alternate (bool): Try the alternate parser before pypdf
+        fast (bool): Only walk the page tree for /Annots (see iter_comments)
+        cache (ExtractionCache): Optional cache to serve results from and store them in
+        incremental (bool): With a cache, only parse the revisions appended to the
+            file since it was last extracted (see extract_comments_incremental)
+        progress (callable): Called after each parsed page (see iter_comments);
+            incremental results are reported at once as the last page, other
+            results from the cache not at all
+        fallback (bool): Try the alternate parser when pypdf finds nothing
+        workers (int): Split large documents into page ranges extracted by
+            this many processes (see plan_shards)
+        stats (ExtractionStats): Optional object to record stage timings,
+            counters and the fallbacks taken in
+        backend (str): Use this registered backend, or 'auto' to pick one
+            for the file (see backends.extract_with_backends), instead of
+            pypdf with the alternate parser as fallback
+        race (bool): Run the two best backends for the file at once and
+            take the first result (implies backend='auto')
+    
+    Returns:
+        list: List of Comment records
+    """
+    if stats is None:
+        return _extract_comments(
+            pdf_file_path, debug_mode, use_alternate, fast, cache, incremental, progress, fallback, workers,
+            NULL_STATS, backend, race
+        )
+    
+    started = time.perf_counter()
+    try:
+        return _extract_comments(
+            pdf_file_path, debug_mode, use_alternate, fast, cache, incremental, progress, fallback, workers, stats,
+            backend, race
+        )
+    finally:
+        stats.elapsed = time.perf_counter() - started
+        logger.debug("Extraction statistics for %s:\n%s", pdf_file_path, stats.format())
+
+def _extract_comments(pdf_file_path, debug_mode, use_alternate, fast, cache, incremental, progress, fallback,
+                      workers, stats, backend, race):
+    if race and backend is None:
+        backend = 'auto'
+    
+    revision_stat = None
+    if cache is not None and incremental and not use_alternate and backend is None:
+        try:
+            revision_stat = os.stat(pdf_file_path)
+            with stats.stage('incremental'):
+                comments = extract_comments_incremental(pdf_file_path, cache, progress=progress)
+            if comments is not None:
+                stats.use('incremental')
+                return comments
+        except (OSError, ValueError, sqlite3.Error) as e:
+            logger.warning(f"Incremental extraction failed, extracting in full: {str(e)}")
+            stats.fallback('incremental failed')
+    
+    if cache is not None:
+        # Results of other backends are kept apart, without changing the
+        # keys of results stored before backends could be chosen
+        choice = dict(backend=backend, race=race) if backend is not None else {}
+        variant = cache.variant(use_alternate=use_alternate, fallback=fallback, **choice)
+        try:
+            with stats.stage('cache'):
+                comments = cache.get(pdf_file_path, variant)
+            if comments is not None:
+                logger.info(f"Loaded {len(comments)} comments from cache")
+                stats.use('cache')
+                return [Comment.from_dict(c) for c in comments]
+        except sqlite3.Error as e:
+            logger.warning(f"Extraction cache lookup failed: {str(e)}")
+    
+    if backend is not None:
+        comments, _ = extract_with_backends(
+            pdf_file_path, backend, race=race, fallback=fallback, stats=stats, fast=fast, workers=workers,
+            progress=progress
+        )
+        comments = assign_threads(comments)
+    else:
+        comments = assign_threads(list(iter_comments(
+            pdf_file_path, debug_mode=debug_mode, use_alternate=use_alternate, fast=fast, progress=progress,
+            fallback=fallback, workers=workers, stats=stats
+        )))
+    
+    if revision_stat is not None:
+        # Files that need a full parse go through the usual pipeline, later
+        # appended revisions are merged into its result
+        try:
+            with stats.stage('incremental'):
+                record_revision(pdf_file_path, cache, comments, revision_stat)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            logger.warning(f"Could not store the state for incremental extraction: {str(e)}")
+    
+    if cache is not None:
+        try:
+            with stats.stage('cache'):
+                cache.put(pdf_file_path, comments, variant)
+        except sqlite3.Error as e:
+            logger.warning(f"Could not store extraction result in cache: {str(e)}")
+    return comments
+
+def iter_comments(pdf_file_path, debug_mode=False, use_alternate=False, fast=False, progress=None, fallback=False,
+                  workers=None, stats=None):
+    """
+    Iterate over the comments of a PDF file, page by page
+    
+    Pages are visited in order, so comments come out sorted by page and
+    annotation index without collecting them first. The comments of a page
+    are yielded as soon as that page has been parsed.
+    
+    Args:
+        pdf_file_path (str): Path to the PDF file
+        debug_mode (bool): Whether to log detailed debug information
+        use_alternate (bool): Try the alternate parser before pypdf
+        fast (bool): Only walk the page tree for /Annots (see iter_page_dicts).
+            Files with object streams, whose pages pypdf can't peek at, are
+            read with the raw parser instead; with fallback, pypdf is still
+            tried when it finds no comments
+        progress (callable): Called as progress(page_num, page_count, comments)
+            after each page with that page's comments; page_count is None if
+            the document doesn't declare it. It may raise ExtractionCancelled
+            to stop at that page boundary. Not called for the alternate parser.
+        fallback (bool): Try the alternate parser when nothing is found
+        workers (int): Extract page ranges of large documents in this many
+            processes; comments are still yielded in page order, one shard
+            at a time
+        stats (ExtractionStats): Optional object to record timings in (see
+            extract_comments)
+    
+    Yields:
+        Comment: Comment information
+    """
+    stats = stats if stats is not None else NULL_STATS
+    
+    # The file is opened and mapped once, every parser below reads from it
+    with open(pdf_file_path, 'rb') as file:
+        with stats.stage('open'):
+            size = os.fstat(file.fileno()).st_size
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        try:
+            with stats.stage('open'):
+                traits = sniff(buffer)
+            stats.add('bytes', size)
+            if traits is None:
+                logger.warning(f"No %PDF- header at the start of {os.path.basename(pdf_file_path)}, trying pypdf")
+                traits = UNKNOWN_TRAITS
+            if debug_mode:
+                logger.info(f"Sniffed {traits}")
+            
+            # Try alternate parser first if requested
+            if use_alternate:
+                logger.info("Attempting to use alternate PDF parser")
+                with stats.stage('alternate'):
+                    alternate_comments = extract_comments_alternate(pdf_file_path, buffer=buffer)
+                if alternate_comments:
+                    logger.info(f"Alternate parser found {len(alternate_comments)} comments")
+                    stats.use('alternate')
+                    yield from alternate_comments
+                    return
+                logger.info("Alternate parser didn't find comments, falling back to pypdf")
+                stats.fallback('alternate found nothing')
+            
+            count = None
+            if fast and traits.object_streams and not traits.encrypted:
+                # Pages inside object streams can't be peeked at through pypdf,
+                # the raw parser only inflates the streams that hold pages
+                count = yield from _iter_raw(pdf_file_path, buffer, progress, stats)
+                if count == 0 and fallback:
+                    logger.info("No comments found with the raw parser, trying pypdf")
+                    stats.fallback('raw found nothing')
+                    count = None
+            if count is None:
+                count = yield from _iter_pypdf(
+                    pdf_file_path, file, buffer, debug_mode, fast, progress, fallback, workers, stats
+                )
+            
+            if count == 0 and fallback and not use_alternate:
+                logger.info("No comments found with pypdf, trying alternate parser")
+                stats.fallback('pypdf found nothing')
+                with stats.stage('alternate'):
+                    alternate_comments = extract_comments_alternate(pdf_file_path, buffer=buffer)
+                if alternate_comments:
+                    stats.use('alternate')
+                yield from alternate_comments
+        finally:
+            if size:
+                buffer.close()
+
+def _iter_raw(pdf_file_path, buffer, progress, stats=NULL_STATS):
+    """
+    Yield comments page by page with the raw object parser
     
     Returns:
-        list: List of dictionaries containing comment information
+        int: Number of comments, or None (before yielding anything) if no
+        page tree was found
+    """
+    with stats.stage('xref'):
+        document = RawDocument(buffer, get_object_index(pdf_file_path, buffer), source=None)
+        catalog = document.resolve(document.index.trailer.get('/Root'))
+        pages_root = document.resolve(catalog.get('/Pages')) if isinstance(catalog, dict) else None
+        page_count = document.resolve(pages_root.get('/Count')) if isinstance(pages_root, dict) else None
+    
+    layouts = DocumentLayouts(pdf_file_path)
+    count = None
+    try:
+        for page_num, page in enumerate(stats.timed('page tree', document.iter_pages()), 1):
+            with stats.stage('annotations'):
+                page_comments = document.page_comments(page, page_num)
+                fill_markup_text(page_comments, document, layouts)
+            stats.add('pages')
+            count = (count or 0) + len(page_comments)
+            yield from page_comments
+            if progress is not None:
+                progress(page_num, page_count if isinstance(page_count, int) else None, page_comments)
+    finally:
+        if count is not None:
+            stats.use('raw')
+        stats.add('objects resolved', document.resolved)
+    return count
+
+def page_comments(page, page_num, annotation_types_found=None, stats=NULL_STATS):
     """
+    Return the comments from the /Annots array of one pypdf page dictionary
+    
+    Highlights and other text markup without contents of their own get the
+    text under their /QuadPoints as content. The page's text is only laid
+    out (see text_layout.build_layout) when it has such an annotation, and
+    once for all of them.
+    
+    Args:
+        page: Page dictionary (a PageObject or a raw dictionary)
+        page_num (int): 1-based page number to record in each comment
+        annotation_types_found (set): If given, every annotation subtype seen
+            is added to it, for debug logging
+        stats (ExtractionStats): Records annotation, popup and text layout
+            counts and the time spent resolving popups
+    
+    Returns:
+        list: Comment records in /Annots order
+    """
+    annotations = []
     comments = []
-    annotation_types_found = set()
+    layout = None
+    
+    # Get annotations
+    if '/Annots' in page:
+        # Handle direct annotations
+        annots = page['/Annots']
+        if annots:
+            try:
+                # Handle both direct and indirect annotation arrays
+                if isinstance(annots, list):
+                    annotations.extend(annots)
+                else:
+                    # Get the actual object if it's a reference
+                    annots_obj = annots.get_object()
+                    if isinstance(annots_obj, list):
+                        annotations.extend(annots_obj)
+            except Exception as e:
+                logger.warning("Error processing annotations on page %d: %s", page_num, e)
+    
+    if annotations:
+        stats.add('annotations', len(annotations))
+    
+    for i, annot in enumerate(annotations):
+        try:
+            # Get annotation object (handle indirect references)
+            annot_obj = annot.get_object() if hasattr(annot, 'get_object') else annot
+            
+            if not annot_obj:
+                continue
+            
+            # Get annotation subtype
+            subtype = annot_obj.get('/Subtype', '')
+            
+            # Track all annotation types for debugging
+            if annotation_types_found is not None:
+                annotation_types_found.add(subtype)
+            
+            # Only process comment-like annotations
+            if subtype in COMMENT_SUBTYPES:
+                # Get content directly or from popup
+                content = annot_obj.get('/Contents', '')
+                if not content and '/Popup' in annot_obj:
+                    stats.add('popups')
+                    with stats.stage('popups'):
+                        content = get_contents_from_popup(annot_obj)
+                
+                # Skip empty comments
+                if not content and subtype not in MARKUP_SUBTYPES:
+                    continue
+                    
+                # Try to get the author (different PDFs might use different keys)
+                author = annot_obj.get('/T', '')
+                if not author:
+                    author = annot_obj.get('/TI', '')
+                    if not author:
+                        author = annot_obj.get('/TU', 'Unknown')
+                
+                # Try to get the date
+                date = annot_obj.get('/M', '')
+                if not date:
+                    date = annot_obj.get('/CreationDate', '')
+                
+                # Only the parent's object number is needed, it isn't resolved
+                parent_id = None
+                if '/IRT' in annot_obj and annot_obj.get('/RT', '/R') == '/R':
+                    parent_id = getattr(annot_obj.raw_get('/IRT'), 'idnum', None)
+                
+                # Text markup without a note of its own shows the text it covers;
+                # the page is laid out once, for its first such annotation
+                if not content and subtype in TEXT_MARKUP_SUBTYPES and '/QuadPoints' in annot_obj:
+                    if layout is None:
+                        stats.add('text layouts')
+                        layout = build_layout(page)
+                    content = layout.text_in_quads(annot_obj['/QuadPoints'])
+                
+                # For annotations like highlights that might not have content
+                if not content and subtype in MARKUP_SUBTYPES:
+                    content = f"[{subtype.replace('/', '')} annotation]"
+                
+                comments.append(Comment(
+                    id=getattr(annot, 'idnum', None),
+                    page=page_num,
+                    index=i,
+                    content=content,
+                    author=author,
+                    date=date,
+                    type=subtype,
+                    parent_id=parent_id,
+                    key=annotation_key(annot_obj.get('/NM'), subtype, annot_obj.get('/Rect'), author, page_num),
+                    state=annot_obj.get('/State')
+                ))
+            
+        except Exception as e:
+            logger.warning("Error processing annotation %d on page %d: %s", i, page_num, e)
+    
+    return comments
+
+def _iter_pypdf(pdf_file_path, file, buffer, debug_mode, fast, progress, fallback, workers, stats=NULL_STATS):
+    """
+    Yield comments page by page with pypdf, reading from the open file
     
-    # Try alternate parser first if requested
-    if use_alternate:
-        logger.info("Attempting to use alternate PDF parser")
-        alternate_comments = extract_comments_alternate(pdf_file_path)
-        if alternate_comments:
-            logger.info(f"Alternate parser found {len(alternate_comments)} comments")
-            return alternate_comments
-        logger.info("Alternate parser didn't find comments, falling back to pypdf")
+    Returns:
+        int: Number of comments found (0 without yielding anything if the
+        file is unreadable and fallback is set)
+    """
+    # Imported on first use, so starting the viewer or importing this module
+    # doesn't pay for it
+    import pypdf
+    
+    comment_count = 0
+    annotation_types_found = set()
     
     try:
-        reader = pypdf.PdfReader(pdf_file_path)
+        try:
+            with stats.stage('xref'):
+                reader = pypdf.PdfReader(file)
+        except pypdf.errors.PyPdfError as e:
+            if not fallback:
+                raise
+            logger.warning(f"pypdf could not read the file: {str(e)}")
+            stats.fallback('pypdf could not read the file')
+            return 0
         if reader.is_encrypted:
             try:
-                reader.decrypt('')  # Try empty password
+                with stats.stage('decrypt'):
+                    reader.decrypt('')  # Try empty password
                 logger.info("Successfully decrypted PDF with empty password")
             except:
                 logger.warning("PDF is encrypted and could not be decrypted with empty password")
+                stats.fallback('decryption failed')
                 # Try alternate parser as fallback for encrypted PDFs
                 logger.info("Trying alternate parser for encrypted PDF")
-                alternate_comments = extract_comments_alternate(pdf_file_path)
-                if alternate_comments:
-                    return alternate_comments
-                return []
+                with stats.stage('alternate'):
+                    comments = extract_comments_alternate(pdf_file_path, buffer=buffer)
+                stats.use('alternate')
+                yield from comments
+                return len(comments)
         
-        # Supported annotation subtypes
-        comment_subtypes = [
-            '/Text', '/FreeText', '/Highlight', '/Underline',
-            '/Squiggly', '/StrikeOut', '/Stamp', '/Caret',
-            '/Ink', '/Square', '/Circle', '/Polygon', '/PolyLine', '/Line',
-            '/FileAttachment', '/Sound', '/Note'
-        ]
+        # Read from the page tree root, counting the pages would walk the tree twice
+        page_count = reader.trailer['/Root'].get('/Pages', {}).get('/Count')
+        page_count = page_count if isinstance(page_count, int) else None
         
-        for page_num, page in enumerate(reader.pages, 1):
-            annotations = []
-            
-            # Get annotations
-            if '/Annots' in page:
-                # Handle direct annotations
-                annots = page['/Annots']
-                if annots:
-                    try:
-                        # Handle both direct and indirect annotation arrays
-                        if isinstance(annots, list):
-                            annotations.extend(annots)
-                        else:
-                            # Get the actual object if it's a reference
-                            annots_obj = annots.get_object()
-                            if isinstance(annots_obj, list):
-                                annotations.extend(annots_obj)
-                    except Exception as e:
-                        logger.warning(f"Error processing annotations on page {page_num}: {str(e)}")
-            
-            for i, annot in enumerate(annotations):
-                try:
-                    # Get annotation object (handle indirect references)
-                    annot_obj = annot.get_object() if hasattr(annot, 'get_object') else annot
-                    
-                    if not annot_obj:
-                        continue
-                    
-                    # Get annotation subtype
-                    subtype = annot_obj.get('/Subtype', '')
-                    
-                    # Track all annotation types for debugging
-                    if debug_mode:
-                        annotation_types_found.add(subtype)
-                    
-                    # Only process comment-like annotations
-                    if subtype in comment_subtypes:
-                        # Get content directly or from popup
-                        content = annot_obj.get('/Contents', '')
-                        if not content:
-                            content = get_contents_from_popup(annot_obj)
-                        
-                        # Skip empty comments
-                        if not content and subtype not in ['/Highlight', '/Underline', '/StrikeOut', '/Squiggly']:
-                            continue
-                            
-                        # Try to get the author (different PDFs might use different keys)
-                        author = annot_obj.get('/T', '')
-                        if not author:
-                            author = annot_obj.get('/TI', '')
-                            if not author:
-                                author = annot_obj.get('/TU', 'Unknown')
-                        
-                        # Try to get the date
-                        date = annot_obj.get('/M', '')
-                        if not date:
-                            date = annot_obj.get('/CreationDate', '')
-                        
-                        # For annotations like highlights that might not have content
-                        if not content and subtype in ['/Highlight', '/Underline', '/StrikeOut', '/Squiggly']:
-                            content = f"[{subtype.replace('/', '')} annotation]"
-                        
-                        comments.append({
-                            'page': page_num,
-                            'index': i,
-                            'content': content,
-                            'author': author,
-                            'date': date,
-                            'type': subtype
-                        })
-                    
-                except Exception as e:
-                    logger.warning(f"Error processing annotation {i} on page {page_num}: {str(e)}")
+        shards = plan_shards(page_count, workers) if workers and workers > 1 else []
+        if len(shards) > 1:
+            logger.info(f"Extracting {page_count} pages in {len(shards)} shards on {workers} processes")
+            stats.use('pypdf shards')
+            stats.add('shards', len(shards))
+            stats.add('pages', page_count)
+            for last_page, comments in stats.timed('shards', _run_shards(pdf_file_path, shards, workers)):
+                comment_count += len(comments)
+                yield from comments
+                if progress is not None:
+                    progress(last_page, page_count, comments)
+        else:
+            stats.use('pypdf fast' if fast else 'pypdf')
+            pages = iter_page_dicts(reader, buffer) if fast else reader.pages
+            types_found = annotation_types_found if debug_mode else None
+            for page_num, page in enumerate(stats.timed('page tree', pages), 1):
+                with stats.stage('annotations'):
+                    comments = page_comments(page, page_num, types_found, stats)
+                stats.add('pages')
+                comment_count += len(comments)
+                yield from comments
+                if progress is not None:
+                    progress(page_num, page_count, comments)
+            if stats.enabled:
+                stats.add('objects resolved', sum(len(objects) for objects in reader.resolved_objects.values()))
         
         if debug_mode:
             logger.info(f"Found annotation types: {annotation_types_found}")
-            logger.info(f"Total comments extracted: {len(comments)}")
-        
-        return sorted(comments, key=lambda x: (x['page'], x['index']))
+            logger.info(f"Total comments extracted: {comment_count}")
+        return comment_count
     
+    except ExtractionCancelled:
+        logger.info(f"Extraction cancelled after {comment_count} comments")
+        raise
     except Exception as e:
         logger.error(f"Error extracting comments: {str(e)}")
-        raise
\ No newline at end of file
+        raise
+
+def _extract_pypdf(pdf_file_path, buffer, fast=False, workers=None, progress=None, stats=NULL_STATS):
+    with open(pdf_file_path, 'rb') as file:
+        return list(_iter_pypdf(pdf_file_path, file, buffer, False, fast, progress, False, workers, stats))
+
+def _extract_pymupdf(pdf_file_path, buffer, **options):
+    return extract_comments_pymupdf(pdf_file_path)
+
+def _extract_raw(pdf_file_path, buffer, progress=None, stats=NULL_STATS, **options):
+    comments = []
+    pages = _iter_raw(pdf_file_path, buffer, progress, stats)
+    while True:
+        try:
+            comments.append(next(pages))
+        except StopIteration as stop:
+            if stop.value is None:
+                # No page tree, scan the objects instead
+                comments = parse_pdf_manually(pdf_file_path, buffer=buffer)
+            return comments
+
+register_backend(Backend('pypdf', _extract_pypdf, speed='medium', encryption=True, requires='pypdf'))
+register_backend(Backend('pymupdf', _extract_pymupdf, speed='fast', encryption=True, requires='fitz'))
+register_backend(Backend('raw', _extract_raw, speed='fast'))
@@ -0,0 +1,165 @@
+import os
+import time
+import queue
+import logging
+import threading
+import tkinter as tk
+from tkinter import ttk, filedialog
+
+from batch import iter_pdf_paths, BatchStats
+
+logger = logging.getLogger(__name__)
+
+# Queries run once typing pauses for this long
+SEARCH_DELAY_MS = 200
+
+# How often indexing progress is picked up from the indexing thread
+INDEX_POLL_MS = 100
+
+RESULT_LIMIT = 500
+
+COLUMNS = (
+    ('file', "File", 180),
+    ('page', "Page", 50),
+    ('author', "Author", 120),
+    ('content', "Content", 400),
+)
+
+
+class SearchWindow(tk.Toplevel):
+    """
+    Search the comments of every indexed file
+
+    Queries go to the CommentIndex as typing pauses. Double-clicking a
+    result (or pressing Enter) opens its file in the viewer at that page.
+    Folders are added to the index on a background thread.
+
+    Args:
+        parent: Parent window
+        index (CommentIndex): Index to search and update
+        on_open (callable): Called as on_open(path, page) to show a result
+    """
+
+    def __init__(self, parent, index, on_open):
+        super().__init__(parent)
+        self.title("Search Indexed Files")
+        self.geometry("800x450")
+        self.index = index
+        self.on_open = on_open
+        self.results = []
+        self._search_job = None
+        self._indexing = None
+
+        query_frame = ttk.Frame(self, padding=(10, 10, 10, 5))
+        query_frame.pack(fill=tk.X)
+        self.text_var = tk.StringVar()
+        self.author_var = tk.StringVar()
+        ttk.Label(query_frame, text="Search:").pack(side=tk.LEFT)
+        text_entry = ttk.Entry(query_frame, textvariable=self.text_var, width=30)
+        text_entry.pack(side=tk.LEFT, padx=(2, 8), fill=tk.X, expand=True)
+        ttk.Label(query_frame, text="Author:").pack(side=tk.LEFT)
+        ttk.Entry(query_frame, textvariable=self.author_var, width=16).pack(side=tk.LEFT, padx=(2, 8))
+        self.index_button = ttk.Button(query_frame, text="Index Folder...", command=self.index_folder)
+        self.index_button.pack(side=tk.LEFT)
+        for var in (self.text_var, self.author_var):
+            var.trace_add('write', lambda *args: self.schedule_search())
+
+        tree_frame = ttk.Frame(self, padding=(10, 0))
+        tree_frame.pack(fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(tree_frame, columns=[c[0] for c in COLUMNS], show='headings', selectmode='browse')
+        for name, heading, width in COLUMNS:
+            self.tree.heading(name, text=heading)
+            self.tree.column(name, width=width, stretch=(name == 'content'), anchor=tk.W)
+        scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.tree.bind('<Double-1>', lambda event: self.open_selected())
+        self.tree.bind('<Return>', lambda event: self.open_selected())
+
+        self.status_var = tk.StringVar()
+        ttk.Label(self, textvariable=self.status_var, anchor=tk.W, padding=(10, 5)).pack(fill=tk.X)
+        self.show_summary()
+        text_entry.focus_set()
+
+    def show_summary(self):
+        files, comments = self.index.summary()
+        self.status_var.set(f"{comments} comments from {files} indexed files")
+
+    def schedule_search(self):
+        if self._search_job is not None:
+            self.after_cancel(self._search_job)
+        self._search_job = self.after(SEARCH_DELAY_MS, self.search)
+
+    def search(self):
+        self._search_job = None
+        text, author = self.text_var.get(), self.author_var.get()
+        self.tree.delete(*self.tree.get_children())
+        if not (text.strip() or author.strip()):
+            self.results = []
+            self.show_summary()
+            return
+
+        started = time.perf_counter()
+        self.results = self.index.search(text, author=author, limit=RESULT_LIMIT)
+        elapsed = time.perf_counter() - started
+        for i, result in enumerate(self.results):
+            content = ' '.join(result['content'].split())
+            self.tree.insert('', tk.END, iid=str(i), values=(
+                os.path.basename(result['file']), result['page'] or '', result['author'], content[:300]
+            ))
+        more = "+" if len(self.results) == RESULT_LIMIT else ""
+        self.status_var.set(f"{len(self.results)}{more} results in {elapsed * 1000:.0f} ms")
+
+    def open_selected(self):
+        selection = self.tree.selection()
+        if selection:
+            result = self.results[int(selection[0])]
+            self.on_open(result['file'], result['page'])
+
+    def index_folder(self):
+        folder = filedialog.askdirectory(parent=self, title="Add a folder to the search index")
+        if not folder or self._indexing is not None:
+            return
+
+        events = queue.Queue()
+        stats = BatchStats()
+
+        def run():
+            try:
+                self.index.update(
+                    iter_pdf_paths([folder]), stats=stats, cache=True,
+                    progress=lambda path, count, error: events.put(('file', path))
+                )
+                self.index.prune()
+                events.put(('done', None))
+            except Exception as e:
+                logger.error(f"Indexing {folder} failed: {str(e)}")
+                events.put(('error', str(e)))
+
+        self._indexing = threading.Thread(target=run, daemon=True)
+        self._indexing.start()
+        self.index_button.config(state=tk.DISABLED)
+        self.status_var.set(f"Indexing {folder}...")
+        self.after(INDEX_POLL_MS, self.poll_indexing, events, stats)
+
+    def poll_indexing(self, events, stats):
+        while True:
+            try:
+                kind, detail = events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'file':
+                self.status_var.set(f"Indexing: {stats.files} files, {stats.comments} comments so far")
+                continue
+
+            self._indexing = None
+            self.index_button.config(state=tk.NORMAL)
+            if kind == 'error':
+                self.status_var.set(f"Indexing failed: {detail}")
+            else:
+                self.status_var.set(f"Indexed {stats.files} new or changed files ({stats.failed} failed)")
+                if self.results or self.text_var.get() or self.author_var.get():
+                    self.search()
+            return
+        self.after(INDEX_POLL_MS, self.poll_indexing, events, stats)
@@ -0,0 +1,310 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import tempfile
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ProcessPoolExecutor
+
+from batch import extract_file, _init_worker
+from cache import content_hash
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Largest PDF accepted as an upload
+MAX_UPLOAD_BYTES = 256 * 1024 * 1024
+
+# Request latencies kept for the percentiles reported by /metrics
+LATENCY_WINDOW = 1000
+
+# Seconds allowed for reading a request's headers
+HEADER_TIMEOUT = 10.0
+
+_REASONS = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+    422: 'Unprocessable Entity', 500: 'Internal Server Error', 503: 'Service Unavailable',
+}
+
+# Extraction options a request may set, all booleans
+OPTIONS = ('fast', 'fallback')
+
+
+class HttpError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class ServiceMetrics:
+    """Request counters and a window of recent latencies"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.started = time.time()
+        self.requests = 0
+        self.extractions = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.failed = 0
+        self.latencies = deque(maxlen=window)
+
+    def percentiles(self):
+        if not self.latencies:
+            return {}
+        ordered = sorted(self.latencies)
+        return {
+            f'p{p}': ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1000
+            for p in (50, 90, 99)
+        }
+
+
+class ExtractionService:
+    """
+    Run extractions for HTTP requests on a warm process pool
+
+    Requests for a file are keyed by its content hash and extraction options,
+    and a request arriving while the same key is being extracted waits for
+    that result instead of starting another parse. At most max_queue distinct
+    extractions are queued or running; beyond that requests are refused with
+    503 so callers back off instead of piling up.
+
+    Args:
+        jobs (int): Worker processes (defaults to the core count)
+        max_queue (int): Most extractions queued or running at once
+            (defaults to four per worker)
+        **options: Extra keyword arguments for extract_file, such as cache
+    """
+
+    def __init__(self, jobs=None, max_queue=None, **options):
+        self.jobs = jobs or os.cpu_count() or 1
+        self.max_queue = max_queue or self.jobs * 4
+        self.options = options
+        self.metrics = ServiceMetrics()
+        self.in_flight = {}
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.jobs, initializer=_init_worker, initargs=(logging.getLogger().level,)
+        )
+        # Start the workers before anything listens: the first requests don't
+        # wait for their imports, and workers forked later would inherit open
+        # client connections, which then never see a close
+        for _ in range(self.jobs):
+            self._executor.submit(_init_worker, logging.getLogger().level)
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    async def extract(self, path, digest, **options):
+        """
+        Extract comments from path, sharing the work with identical requests
+
+        Returns:
+            tuple: (list of comment records, whether the result was shared)
+
+        Raises:
+            HttpError: 503 when the queue is full, 422 when extraction fails
+        """
+        key = (digest,) + tuple(sorted(options.items()))
+        future = self.in_flight.get(key)
+        coalesced = future is not None
+        if coalesced:
+            self.metrics.coalesced += 1
+        else:
+            if len(self.in_flight) >= self.max_queue:
+                self.metrics.rejected += 1
+                raise HttpError(503, "Too many extractions in progress, try again later", {'Retry-After': '1'})
+            self.metrics.extractions += 1
+            future = asyncio.get_running_loop().run_in_executor(
+                self._executor, _extract, path, dict(self.options, **options)
+            )
+            self.in_flight[key] = future
+            future.add_done_callback(lambda f: self.in_flight.pop(key, None))
+
+        # A caller that disconnects must not cancel the work others wait on
+        _, records, error = await asyncio.shield(future)
+        if error:
+            raise HttpError(422, error)
+        return records, coalesced
+
+    async def extract_path(self, path, **options):
+        if not os.path.isfile(path):
+            raise HttpError(404, f"No such file: {path}")
+        loop = asyncio.get_running_loop()
+        digest = await loop.run_in_executor(None, content_hash, path)
+        records, coalesced = await self.extract(path, digest, **options)
+        return dict(file=path, hash=digest, coalesced=coalesced, comments=records)
+
+    async def extract_upload(self, data, **options):
+        digest = hashlib.blake2b(data, digest_size=20).hexdigest()
+        loop = asyncio.get_running_loop()
+        fd, path = tempfile.mkstemp(suffix='.pdf')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                await loop.run_in_executor(None, f.write, data)
+            records, coalesced = await self.extract(path, digest, **options)
+        finally:
+            os.remove(path)
+        return dict(file=None, hash=digest, coalesced=coalesced, comments=records)
+
+    def metrics_report(self):
+        metrics = self.metrics
+        return dict(
+            uptime=time.time() - metrics.started,
+            requests=metrics.requests,
+            extractions=metrics.extractions,
+            coalesced=metrics.coalesced,
+            rejected=metrics.rejected,
+            failed=metrics.failed,
+            queue_depth=len(self.in_flight),
+            max_queue=self.max_queue,
+            workers=self.jobs,
+            latency_ms=metrics.percentiles(),
+        )
+
+
+def _extract(path, options):
+    options = dict(options)
+    return extract_file(path, options.pop('fallback', False), **options)
+
+
+def _flag(values, name):
+    value = values.get(name)
+    return value is not None and str(value).lower() in ('1', 'true', 'yes', 'on')
+
+
+async def _read_request(reader):
+    """Return (method, target, headers, body) for one request"""
+    try:
+        head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), HEADER_TIMEOUT)
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+        raise HttpError(400, "Malformed request")
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, _ = lines[0].split(' ', 2)
+    except ValueError:
+        raise HttpError(400, "Malformed request line")
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise HttpError(400, "Bad Content-Length")
+    if length > MAX_UPLOAD_BYTES:
+        raise HttpError(413, f"Uploads are limited to {MAX_UPLOAD_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b''
+    return method, target, headers, body
+
+
+async def _dispatch(service, method, target, headers, body):
+    url = urlsplit(target)
+    query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+
+    if url.path == '/health':
+        return 200, {'status': 'ok'}
+    if url.path == '/metrics':
+        return 200, service.metrics_report()
+    if url.path != '/extract':
+        raise HttpError(404, f"Unknown endpoint {url.path}")
+
+    if method == 'GET':
+        params = query
+    elif method == 'POST' and headers.get('content-type', '').startswith('application/json'):
+        try:
+            params = json.loads(body or b'{}')
+        except ValueError:
+            raise HttpError(400, "Body is not valid JSON")
+        if not isinstance(params, dict):
+            raise HttpError(400, "Body must be a JSON object")
+    elif method == 'POST':
+        # Raw PDF upload, options in the query string
+        if not body:
+            raise HttpError(400, "Empty upload")
+        options = {name: _flag(query, name) for name in OPTIONS}
+        return 200, await service.extract_upload(body, **options)
+    else:
+        raise HttpError(405, f"{method} is not supported")
+
+    if not params.get('path'):
+        raise HttpError(400, "Give a path, or POST the PDF itself")
+    options = {name: _flag(params, name) for name in OPTIONS}
+    return 200, await service.extract_path(os.path.abspath(params['path']), **options)
+
+
+async def handle_connection(service, reader, writer):
+    """Answer one request on a connection, then close it"""
+    started = time.perf_counter()
+    extra_headers = {}
+    try:
+        method, target, headers, body = await _read_request(reader)
+        service.metrics.requests += 1
+        status, payload = await _dispatch(service, method, target, headers, body)
+    except HttpError as e:
+        status, payload, extra_headers = e.status, {'error': str(e)}, e.headers
+    except (ConnectionError, asyncio.IncompleteReadError):
+        writer.close()
+        return
+    except Exception as e:
+        logger.exception("Request failed")
+        status, payload = 500, {'error': f"{type(e).__name__}: {e}"}
+    if status >= 400 and status != 503:
+        service.metrics.failed += 1
+    service.metrics.latencies.append(time.perf_counter() - started)
+
+    data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    head = [f'HTTP/1.1 {status} {_REASONS.get(status, "")}', 'Content-Type: application/json',
+            f'Content-Length: {len(data)}', 'Connection: close']
+    head += [f'{name}: {value}' for name, value in extra_headers.items()]
+    try:
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + data)
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """Start answering requests; returns the asyncio Server"""
+    return await asyncio.start_server(
+        lambda reader, writer: handle_connection(service, reader, writer), host, port
+    )
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, jobs=None, max_queue=None, ready=None, **options):
+    """
+    Run the extraction service until cancelled
+
+    Endpoints:
+        GET /extract?path=...&fast=1&fallback=1, or POST /extract with a JSON
+            object {"path": ..., "fast": ..., "fallback": ...}: extract a file
+            readable by the server
+        POST /extract?fast=1 with the PDF as the body: extract an uploaded file
+        GET /metrics: counters, queue depth and latency percentiles
+        GET /health
+
+    Args:
+        host (str): Interface to listen on (only this machine by default)
+        port (int): TCP port, 0 for any free port
+        jobs (int): Worker processes
+        max_queue (int): Most extractions queued or running at once
+        ready (callable): Called with the listening (host, port)
+        **options: Extra keyword arguments for extract_file, such as cache
+    """
+    service = ExtractionService(jobs=jobs, max_queue=max_queue, **options)
+    try:
+        server = await start_server(service, host, port)
+        async with server:
+            if ready is not None:
+                ready(server.sockets[0].getsockname()[:2])
+            await server.serve_forever()
+    finally:
+        service.close()
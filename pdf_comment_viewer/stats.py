@@ -0,0 +1,108 @@
+import time
+from contextlib import contextmanager, nullcontext
+
+
+class ExtractionStats:
+    """
+    Where the time went while extracting one file
+
+    Pass an instance as extract_comments(..., stats=stats) to collect:
+
+        stages     wall time per stage in seconds, in the order first entered
+        counters   pages, annotations, resolved objects and so on
+        fallbacks  recovery paths that fired, in order
+        parser     the path that produced the result
+        elapsed    wall time of the whole call
+
+    Stages can nest ('popups' is part of 'annotations'), so they don't
+    necessarily add up to elapsed. Time spent in the caller between yielded
+    comments is not counted in any stage.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self.fallbacks = []
+        self.parser = None
+        self.elapsed = 0.0
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def timed(self, name, iterable):
+        """Yield from iterable, counting the time taken to produce each item as stage name"""
+        iterator = iter(iterable)
+        stages = self.stages
+        stages.setdefault(name, 0.0)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                stages[name] += time.perf_counter() - start
+                return
+            stages[name] += time.perf_counter() - start
+            yield item
+
+    def add(self, name, count=1):
+        self.counters[name] = self.counters.get(name, 0) + count
+
+    def fallback(self, name):
+        self.fallbacks.append(name)
+
+    def use(self, parser):
+        self.parser = parser
+
+    def to_dict(self):
+        return {
+            'parser': self.parser,
+            'elapsed': self.elapsed,
+            'stages': dict(self.stages),
+            'counters': dict(self.counters),
+            'fallbacks': list(self.fallbacks),
+        }
+
+    def format(self):
+        """Return a multi-line, human readable breakdown"""
+        total = self.elapsed or sum(self.stages.values()) or 1.0
+        lines = [f"Total {self.elapsed * 1000:.1f} ms with {self.parser or 'no parser'}"]
+        for name, seconds in sorted(self.stages.items(), key=lambda item: -item[1]):
+            lines.append(f"  {name:<14} {seconds * 1000:9.1f} ms {seconds / total * 100:5.1f}%")
+        if self.counters:
+            lines.append("  " + ", ".join(f"{name} {value}" for name, value in self.counters.items()))
+        if self.fallbacks:
+            lines.append("  Fallbacks: " + " -> ".join(self.fallbacks))
+        return '\n'.join(lines)
+
+
+class _NullStats:
+    """Stand-in for ExtractionStats when none was requested, every method does nothing"""
+
+    enabled = False
+
+    def stage(self, name):
+        return _NO_STAGE
+
+    def timed(self, name, iterable):
+        return iterable
+
+    def add(self, name, count=1):
+        pass
+
+    def fallback(self, name):
+        pass
+
+    def use(self, parser):
+        pass
+
+
+_NO_STAGE = nullcontext()
+
+NULL_STATS = _NullStats()
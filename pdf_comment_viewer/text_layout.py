@@ -0,0 +1,294 @@
+import math
+import logging
+from array import array
+
+logger = logging.getLogger(__name__)
+
+# Annotation subtypes that mark up text, whose /QuadPoints cover the text
+TEXT_MARKUP_SUBTYPES = frozenset(('/Highlight', '/Underline', '/StrikeOut', '/Squiggly'))
+
+# Glyph boxes reach this far below and above the baseline, as a fraction of
+# the font size, since font descriptors are not read
+DESCENT = 0.2
+ASCENT = 0.8
+
+# Glyph width in thousandths of the font size when the font gives none,
+# roughly the average of the standard fonts
+DEFAULT_WIDTH = 500
+
+# Horizontal gap between glyphs, as a fraction of their height, taken as a
+# space between words
+WORD_GAP = 0.15
+
+# Side of the grid cells glyphs are indexed in, in points; about one line of
+# body text, so a quad only looks at a few cells
+GRID_CELL = 12.0
+
+# Largest page side PDF allows, in points; boxes are clipped to this when
+# the page's own box is unknown
+PAGE_LIMIT = 14400.0
+
+
+class PageLayout:
+    """
+    The glyphs of one page and a grid index over their boxes
+
+    Glyphs are kept in content stream order, with their boxes in a flat
+    array (x0, y0, x1, y1 for each). The grid maps each cell of GRID_CELL
+    points to the glyphs whose box touches it, so finding the glyphs under a
+    quad only looks at the cells it covers rather than every glyph of the
+    page. Boxes are clipped to the page box first, so a quad with absurd or
+    non-finite coordinates costs no more than one covering the page.
+
+    Args:
+        cell (float): Side of the grid cells, in points
+        box (tuple): The page's (x0, y0, x1, y1), if known
+    """
+
+    def __init__(self, cell=GRID_CELL, box=None):
+        self.cell = cell
+        self.box = _clip_box(box)
+        self.chars = []
+        self.boxes = array('d')
+        self.grid = {}
+
+    def __len__(self):
+        return len(self.chars)
+
+    def add(self, char, x0, y0, x1, y1):
+        i = len(self.chars)
+        self.chars.append(char)
+        self.boxes.extend((x0, y0, x1, y1))
+        for cell in self._cells(x0, y0, x1, y1):
+            self.grid.setdefault(cell, []).append(i)
+
+    def _cells(self, x0, y0, x1, y1):
+        left, bottom, right, top = self.box
+        x0, y0, x1, y1 = max(x0, left), max(y0, bottom), min(x1, right), min(y1, top)
+        if not all(map(math.isfinite, (x0, y0, x1, y1))) or x0 > x1 or y0 > y1:
+            return
+        cell = self.cell
+        for cx in range(int(x0 // cell), int(x1 // cell) + 1):
+            for cy in range(int(y0 // cell), int(y1 // cell) + 1):
+                yield cx, cy
+
+    def glyphs_in(self, x0, y0, x1, y1):
+        """Return the indices of the glyphs whose centre lies in a rectangle"""
+        found = set()
+        boxes = self.boxes
+        for cell in self._cells(x0, y0, x1, y1):
+            for i in self.grid.get(cell, ()):
+                cx = (boxes[4 * i] + boxes[4 * i + 2]) / 2
+                cy = (boxes[4 * i + 1] + boxes[4 * i + 3]) / 2
+                if x0 <= cx <= x1 and y0 <= cy <= y1:
+                    found.add(i)
+        return found
+
+    def text_in_quads(self, quad_points):
+        """
+        Return the text under an annotation's /QuadPoints
+
+        Glyphs are joined in content stream order, with a space wherever
+        consecutive glyphs are not next to each other, in the content or on
+        the page (such as at the end of a highlighted line).
+
+        Args:
+            quad_points: Flat list of numbers, eight per quadrilateral
+
+        Returns:
+            str: The covered text with whitespace collapsed, '' if none
+        """
+        found = set()
+        for x0, y0, x1, y1 in quad_boxes(quad_points):
+            found |= self.glyphs_in(x0, y0, x1, y1)
+        parts = []
+        previous = None
+        for i in sorted(found):
+            if previous is not None and (i != previous + 1 or self._apart(previous, i)):
+                parts.append(' ')
+            parts.append(self.chars[i])
+            previous = i
+        return ' '.join(''.join(parts).split())
+
+    def _apart(self, i, j):
+        """Whether glyph j starts a new line or word rather than following glyph i"""
+        boxes = self.boxes
+        height = boxes[4 * j + 3] - boxes[4 * j + 1]
+        middle_i = (boxes[4 * i + 1] + boxes[4 * i + 3]) / 2
+        middle_j = (boxes[4 * j + 1] + boxes[4 * j + 3]) / 2
+        return abs(middle_i - middle_j) > height / 2 or boxes[4 * j] - boxes[4 * i + 2] > WORD_GAP * height
+
+
+def quad_boxes(quad_points):
+    """Yield the bounding box (x0, y0, x1, y1) of each quadrilateral in /QuadPoints, skipping non-finite ones"""
+    try:
+        values = [float(value) for value in quad_points]
+    except (TypeError, ValueError):
+        return
+    for i in range(0, len(values) - 7, 8):
+        if not all(map(math.isfinite, values[i:i + 8])):
+            continue
+        xs, ys = values[i:i + 8:2], values[i + 1:i + 8:2]
+        yield min(xs), min(ys), max(xs), max(ys)
+
+
+def _clip_box(box):
+    """Return box as floats within PAGE_LIMIT, or the limits themselves if box is unusable"""
+    limits = (-PAGE_LIMIT, -PAGE_LIMIT, PAGE_LIMIT, PAGE_LIMIT)
+    try:
+        x0, y0, x1, y1 = (float(value) for value in box)
+    except (TypeError, ValueError):
+        return limits
+    if not all(map(math.isfinite, (x0, y0, x1, y1))):
+        return limits
+    x0, x1 = sorted((x0, x1))
+    y0, y1 = sorted((y0, y1))
+    return max(x0, -PAGE_LIMIT), max(y0, -PAGE_LIMIT), min(x1, PAGE_LIMIT), min(y1, PAGE_LIMIT)
+
+
+def _font_widths(font):
+    """Return (first char code, widths) from a simple font's /Widths, or (0, [])"""
+    try:
+        widths = font.get('/Widths')
+        widths = widths.get_object() if hasattr(widths, 'get_object') else widths
+        if not widths:
+            return 0, []
+        return int(font.get('/FirstChar', 0)), [float(width) for width in widths]
+    except (AttributeError, TypeError, ValueError):
+        return 0, []
+
+
+def _page_object(page):
+    """Return page as a pypdf PageObject, with inherited /Resources filled in"""
+    from pypdf import PageObject
+    from pypdf.generic import NameObject
+
+    if isinstance(page, PageObject):
+        return page
+    reference = getattr(page, 'indirect_reference', None)
+    result = PageObject(pdf=getattr(reference, 'pdf', None), indirect_reference=reference)
+    result.update(page)
+    node, seen = page, set()
+    while '/Resources' not in node and '/Parent' in node and id(node) not in seen:
+        seen.add(id(node))
+        node = node['/Parent'].get_object()
+    if '/Resources' in node:
+        result[NameObject('/Resources')] = node.raw_get('/Resources')
+    return result
+
+
+def build_layout(page):
+    """
+    Lay out the glyphs of a page for text lookups by position
+
+    Text runs and their positions come from pypdf's text extraction. Each
+    character is advanced by its width from the font's /Widths (see
+    DEFAULT_WIDTH), which places glyphs closely enough to tell which words a
+    markup annotation covers, although kerning inside a run is not known.
+
+    Args:
+        page: Page dictionary (a PageObject or a raw dictionary)
+
+    Returns:
+        PageLayout: The page's glyphs, empty if its text can't be read
+    """
+    try:
+        page = _page_object(page)
+        box = page.mediabox
+    except Exception as e:
+        logger.debug(f"Could not read the page box: {str(e)}")
+        box = None
+    layout = PageLayout(box=box)
+    widths_by_font = {}
+
+    def visit(text, cm, tm, font, font_size):
+        if not text.strip() or not font_size:
+            return
+        key = id(font)
+        if key not in widths_by_font:
+            widths_by_font[key] = _font_widths(font) if font else (0, [])
+        first, widths = widths_by_font[key]
+
+        # Text space to page: the text matrix, then the current transformation
+        a = tm[0] * cm[0] + tm[1] * cm[2]
+        b = tm[0] * cm[1] + tm[1] * cm[3]
+        c = tm[2] * cm[0] + tm[3] * cm[2]
+        d = tm[2] * cm[1] + tm[3] * cm[3]
+        e = tm[4] * cm[0] + tm[5] * cm[2] + cm[4]
+        f = tm[4] * cm[1] + tm[5] * cm[3] + cm[5]
+        low, high = -DESCENT * font_size, ASCENT * font_size
+
+        x = 0.0
+        for char in text:
+            if char in '\r\n':
+                continue
+            code = ord(char) - first
+            width = widths[code] if 0 <= code < len(widths) and widths[code] else DEFAULT_WIDTH
+            advance = width * font_size / 1000
+            xs = (a * x + c * low + e, a * x + c * high + e,
+                  a * (x + advance) + c * low + e, a * (x + advance) + c * high + e)
+            ys = (b * x + d * low + f, b * x + d * high + f,
+                  b * (x + advance) + d * low + f, b * (x + advance) + d * high + f)
+            layout.add(char, min(xs), min(ys), max(xs), max(ys))
+            x += advance
+
+    try:
+        page.extract_text(visitor_text=visit)
+    except Exception as e:
+        logger.debug(f"Could not lay out page text: {str(e)}")
+    return layout
+
+
+class DocumentLayouts:
+    """
+    Page layouts of one file, for the raw parsers that don't go through pypdf
+
+    A pypdf reader is only opened when the first layout is needed, and each
+    page is laid out once however many annotations it has.
+
+    Args:
+        pdf_file_path (str): Path to the PDF file
+    """
+
+    def __init__(self, pdf_file_path):
+        self.pdf_file_path = pdf_file_path
+        self._reader = None
+        self._layouts = {}
+
+    def page(self, page_num):
+        """Return the layout of a page (1-based), empty if it can't be read"""
+        layout = self._layouts.get(page_num)
+        if layout is None:
+            layout = self._layouts[page_num] = PageLayout()
+            try:
+                if self._reader is None:
+                    import pypdf
+                    self._reader = pypdf.PdfReader(self.pdf_file_path)
+                    if self._reader.is_encrypted:
+                        self._reader.decrypt('')
+                layout = self._layouts[page_num] = build_layout(self._reader.pages[page_num - 1])
+            except Exception as e:
+                logger.debug(f"Could not lay out page {page_num}: {str(e)}")
+        return layout
+
+
+def fill_markup_text(comments, document, layouts):
+    """
+    Give raw-parsed text markup the text it covers instead of a placeholder
+
+    Args:
+        comments (list): Comments from a RawDocument, changed in place
+        document (RawDocument): The document they were read from
+        layouts (DocumentLayouts): Layouts of the same file
+    """
+    for i, comment in enumerate(comments):
+        if comment.type not in TEXT_MARKUP_SUBTYPES or comment.page is None or comment.id is None:
+            continue
+        if comment.content != f"[{comment.type.replace('/', '')} annotation]":
+            continue
+        annot = document.get(comment.id)
+        quad_points = document.resolve(annot.get('/QuadPoints')) if isinstance(annot, dict) else None
+        if isinstance(quad_points, list):
+            text = layouts.page(comment.page).text_in_quads([document.resolve(value) for value in quad_points])
+            if text:
+                comments[i] = comment._replace(content=text)
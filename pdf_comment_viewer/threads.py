@@ -0,0 +1,98 @@
+def assign_threads(comments):
+    """
+    Set thread_id on the comments that are part of a reply thread
+
+    Parents are looked up in an id-keyed map of the comments and the root
+    found for each one is remembered, so the whole pass is linear however
+    deep the reply chains are.
+
+    The thread of a comment is the id of its oldest ancestor that is itself
+    among the comments. A reply whose parent wasn't extracted (for example
+    because it isn't a comment type) starts its own thread. Cycles, which
+    only occur in broken files, are cut at the first repeated comment.
+    Comments without replies that don't answer another comment are left
+    as they are, so a document without threads costs one pass and no copies.
+
+    Args:
+        comments (list): Comment records in extraction order
+
+    Returns:
+        list: The comments, with thread_id filled in where it changed
+    """
+    by_id = {c.id: c for c in comments if c.id is not None}
+    answered = {c.parent_id for c in comments if c.parent_id in by_id and c.parent_id != c.id}
+    roots = {}
+
+    for comment in comments:
+        num = comment.id
+        if num is None or num in roots:
+            continue
+        if num not in answered and comment.parent_id not in by_id:
+            continue
+
+        # Walk up until a comment whose root is known, or the top of the chain
+        path = []
+        on_path = set()
+        while True:
+            if num in roots:
+                root = roots[num]
+                break
+            path.append(num)
+            on_path.add(num)
+            parent = by_id[num].parent_id
+            if parent is None or parent not in by_id or parent in on_path:
+                root = num
+                break
+            num = parent
+
+        for num in path:
+            roots[num] = root
+
+    return [
+        c._replace(thread_id=roots.get(c.id)) if c.thread_id != roots.get(c.id) else c
+        for c in comments
+    ]
+
+
+def thread_order(comments):
+    """
+    Order comments so each reply directly follows the comment it answers
+
+    Threads keep the position of their first comment, and replies to the
+    same comment keep their extraction order.
+
+    Args:
+        comments (list): Comment records
+
+    Returns:
+        list: (index into comments, reply depth) pairs, one per comment
+    """
+    positions = {}
+    for i, comment in enumerate(comments):
+        if comment.get('id') is not None:
+            positions.setdefault(comment['id'], i)
+
+    children = {}
+    starts = []
+    for i, comment in enumerate(comments):
+        parent = positions.get(comment.get('parent_id'))
+        if parent is None or parent == i:
+            starts.append(i)
+        else:
+            children.setdefault(parent, []).append(i)
+
+    order = []
+    placed = [False] * len(comments)
+    for start in starts:
+        stack = [(start, 0)]
+        while stack:
+            i, depth = stack.pop()
+            if placed[i]:
+                continue
+            placed[i] = True
+            order.append((i, depth))
+            stack.extend((child, depth + 1) for child in reversed(children.get(i, ())))
+
+    # Comments on a reply cycle are unreachable from any start, keep them flat
+    order.extend((i, 0) for i in range(len(comments)) if not placed[i])
+    return order
@@ -2,9 +2,23 @@ import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox
 import os
 from tkinter import filedialog
-from pdf_processor import extract_comments
+from worker import ExtractionWorker
+from comment_model import CommentModel, CommentFilter, parse_page_range
+from comment_view import CommentView
+from cache import get_cache
+from stats import ExtractionStats
+from comment_index import CommentIndex
+from search_window import SearchWindow
 from version import __version__
 import sys
+import queue
+import sqlite3
+
+# How often the UI checks for results from the extraction thread
+POLL_INTERVAL_MS = 50
+
+# Filters are applied once typing pauses for this long
+FILTER_DELAY_MS = 150
 
 class PDFCommentViewerApp:
     def __init__(self, root):
@@ -13,6 +27,16 @@ class PDFCommentViewerApp:
         self.root.geometry("800x600")
         
         self.current_file_path = None
+        self.worker = None
+        self.model = CommentModel()
+        self._filter_job = None
+        # Timings of the last finished extraction, for Help > Extraction Statistics
+        self.last_stats = None
+        # Opened on first use of File > Search Indexed Files
+        self.index = None
+        self.search_window = None
+        # Reopening a file is served from the on-disk cache (None if unavailable)
+        self.cache = get_cache()
         self.setup_ui()
     
     def setup_ui(self):
@@ -24,13 +48,23 @@ class PDFCommentViewerApp:
         file_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="File", menu=file_menu)
         file_menu.add_command(label="Open PDF...", command=self.browse_file)
+        file_menu.add_command(label="Search Indexed Files...", command=self.open_search)
         file_menu.add_command(label="Reset", command=self.reset)
         file_menu.add_separator()
         file_menu.add_command(label="Exit", command=self.root.quit)
         
+        # Options menu
+        self.parallel_var = tk.BooleanVar(value=False)
+        options_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Options", menu=options_menu)
+        options_menu.add_checkbutton(
+            label="Use all CPU cores for large documents", variable=self.parallel_var
+        )
+        
         # Help menu
         help_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="Help", menu=help_menu)
+        help_menu.add_command(label="Extraction Statistics...", command=self.show_stats)
         help_menu.add_command(label="About", command=self.show_about)
         
         main_frame = ttk.Frame(self.root, padding="10")
@@ -55,8 +89,11 @@ class PDFCommentViewerApp:
         browse_button = ttk.Button(button_frame, text="Browse PDF", command=self.browse_file)
         browse_button.pack(side=tk.LEFT, padx=5)
         
-        process_button = ttk.Button(button_frame, text="Extract Comments", command=self.process_current_file)
-        process_button.pack(side=tk.LEFT, padx=5)
+        self.process_button = ttk.Button(button_frame, text="Extract Comments", command=self.process_current_file)
+        self.process_button.pack(side=tk.LEFT, padx=5)
+        
+        self.cancel_button = ttk.Button(button_frame, text="Cancel", command=self.cancel, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
         
         reset_button = ttk.Button(button_frame, text="Reset", command=self.reset)
         reset_button.pack(side=tk.LEFT, padx=5)
@@ -65,14 +102,48 @@ class PDFCommentViewerApp:
         results_frame = ttk.LabelFrame(main_frame, text="Comments", padding="10")
         results_frame.pack(fill=tk.BOTH, expand=True, pady=10)
         
+        # Filter row
+        filter_frame = ttk.Frame(results_frame)
+        filter_frame.pack(fill=tk.X, pady=(0, 5))
+        
+        self.search_var = tk.StringVar()
+        self.author_var = tk.StringVar()
+        self.type_var = tk.StringVar()
+        self.pages_var = tk.StringVar()
+        
+        ttk.Label(filter_frame, text="Search:").pack(side=tk.LEFT)
+        ttk.Entry(filter_frame, textvariable=self.search_var, width=20).pack(side=tk.LEFT, padx=(2, 8), fill=tk.X, expand=True)
+        ttk.Label(filter_frame, text="Author:").pack(side=tk.LEFT)
+        self.author_combo = ttk.Combobox(
+            filter_frame, textvariable=self.author_var, width=14,
+            postcommand=lambda: self.update_choices(self.author_combo, self.model.authors())
+        )
+        self.author_combo.pack(side=tk.LEFT, padx=(2, 8))
+        ttk.Label(filter_frame, text="Type:").pack(side=tk.LEFT)
+        self.type_combo = ttk.Combobox(
+            filter_frame, textvariable=self.type_var, width=10,
+            postcommand=lambda: self.update_choices(self.type_combo, self.model.types())
+        )
+        self.type_combo.pack(side=tk.LEFT, padx=(2, 8))
+        ttk.Label(filter_frame, text="Pages:").pack(side=tk.LEFT)
+        ttk.Entry(filter_frame, textvariable=self.pages_var, width=8).pack(side=tk.LEFT, padx=(2, 8))
+        ttk.Button(filter_frame, text="Clear", command=self.clear_filter).pack(side=tk.LEFT)
+        
+        for var in (self.search_var, self.author_var, self.type_var, self.pages_var):
+            var.trace_add('write', lambda *args: self.schedule_filter())
+        
+        self.comment_view = CommentView(results_frame, self.model, on_select=self.show_details)
+        self.comment_view.pack(fill=tk.BOTH, expand=True)
+        
+        # Full text of the selected comment, and messages when there is nothing to list
         self.result_text = scrolledtext.ScrolledText(
             results_frame, 
             wrap=tk.WORD, 
             width=70, 
-            height=20,
+            height=6,
             font=("Courier New", 10)
         )
-        self.result_text.pack(fill=tk.BOTH, expand=True)
+        self.result_text.pack(fill=tk.X, pady=(5, 0))
         self.result_text.config(state=tk.DISABLED)
         
         self.status_var = tk.StringVar()
@@ -96,119 +167,197 @@ class PDFCommentViewerApp:
         else:
             self.status_var.set("No file selected. Please browse for a PDF file.")
     
+    def cancel(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.status_var.set("Cancelling...")
+    
     def reset(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker = None
+        self.process_button.config(state=tk.NORMAL)
+        self.cancel_button.config(state=tk.DISABLED)
         self.current_file_path = None
         self.file_var.set("No file selected")
-        self.result_text.config(state=tk.NORMAL)
-        self.result_text.delete(1.0, tk.END)
-        self.result_text.config(state=tk.DISABLED)
+        self.display_comments([])
         self.status_var.set("Ready")
     
     def process_pdf(self, file_path):
+        # Only the latest file's results are shown, a running extraction is abandoned
+        if self.worker is not None:
+            self.worker.cancel()
+        
         self.status_var.set(f"Processing: {os.path.basename(file_path)}...")
-        self.root.update()
+        self.display_comments([])
+        self.process_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
         
-        try:
-            # Try the standard parser first
-            comments = extract_comments(file_path, debug_mode=False)
-            
-            # If no comments found with the standard parser, try the alternate parser
-            if not comments:
-                self.status_var.set(f"No comments found with standard parser. Trying alternate methods...")
-                self.root.update()
-                comments = extract_comments(file_path, debug_mode=False, use_alternate=True)
+        workers = os.cpu_count() if self.parallel_var.get() else None
+        self.worker = ExtractionWorker(
+            file_path, debug_mode=False, cache=self.cache, incremental=True, workers=workers,
+            stats=ExtractionStats()
+        )
+        self.worker.start()
+        self.root.after(POLL_INTERVAL_MS, self.poll_worker, self.worker)
+    
+    def poll_worker(self, worker):
+        """Apply the events posted by a worker, rescheduling until it finishes"""
+        file_name = os.path.basename(worker.pdf_file_path)
+        while True:
+            try:
+                event = worker.events.get_nowait()
+            except queue.Empty:
+                break
             
-            self.display_comments(comments)
-            self.status_var.set(
-                f"Completed: {os.path.basename(file_path)} - {len(comments)} comments found"
-            )
+            if worker is not self.worker:
+                # Superseded by a newer file, drain the queue and drop the events
+                continue
             
-            # If no comments found, show diagnostic info
-            if not comments:
-                self.result_text.config(state=tk.NORMAL)
-                self.result_text.delete(1.0, tk.END)
-                self.result_text.insert(tk.END, "No comments were found in this PDF file.\n\n")
-                self.result_text.insert(tk.END, "Possible reasons:\n")
-                self.result_text.insert(tk.END, "1. The PDF doesn't contain any annotations/comments\n")
-                self.result_text.insert(tk.END, "2. The annotations use a format not supported by the current parser\n")
-                self.result_text.insert(tk.END, "3. The PDF was created with software that uses non-standard annotation formats\n")
-                self.result_text.insert(tk.END, "4. The PDF might be encrypted or secured\n")
-                self.result_text.config(state=tk.DISABLED)
-                
-        except Exception as e:
-            self.status_var.set(f"Error: {str(e)}")
-            self.result_text.config(state=tk.NORMAL)
-            self.result_text.delete(1.0, tk.END)
-            self.result_text.insert(tk.END, f"An error occurred: {str(e)}\n\n")
-            self.result_text.config(state=tk.DISABLED)
+            kind = event[0]
+            if kind == 'page':
+                _, page_num, page_count, comments = event
+                self.append_comments(comments)
+                total = f" of {page_count}" if page_count else ""
+                self.status_var.set(
+                    f"Processing: {file_name} - page {page_num}{total}, {len(self.model.comments)} comments so far"
+                )
+            else:
+                self.finish(worker, event)
+                return
+        
+        if worker.is_alive() or not worker.events.empty():
+            self.root.after(POLL_INTERVAL_MS, self.poll_worker, worker)
     
-    def display_comments(self, comments):
-        self.result_text.config(state=tk.NORMAL)
-        self.result_text.delete(1.0, tk.END)
+    def finish(self, worker, event):
+        self.worker = None
+        self.process_button.config(state=tk.NORMAL)
+        self.cancel_button.config(state=tk.DISABLED)
+        file_name = os.path.basename(worker.pdf_file_path)
+        self.last_stats = worker.options.get('stats')
         
-        if not comments:
-            self.result_text.insert(tk.END, "No comments found in this PDF.")
-            self.result_text.config(state=tk.DISABLED)
+        kind = event[0]
+        if kind == 'cancelled':
+            self.status_var.set(f"Cancelled: {file_name} - {len(self.model.comments)} comments found before stopping")
             return
         
-        current_page = None
+        if kind == 'error':
+            self.status_var.set(f"Error: {event[1]}")
+            self.show_message(f"An error occurred: {event[1]}\n\n")
+            return
         
-        for comment in comments:
-            if current_page != comment.get('page'):
-                current_page = comment.get('page')
-                if current_page:
-                    self.result_text.insert(tk.END, f"\n--- Page {current_page} ---\n\n")
-            
-            # Use index if available, otherwise just number them sequentially
-            index = comment.get('index', 0)
-            self.result_text.insert(tk.END, f"Comment #{index+1}:\n")
-            
-            if 'type' in comment:
-                annotation_type = comment['type'].replace('/', '')
-                self.result_text.insert(tk.END, f"  Type: {annotation_type}\n")
-            
-            self.result_text.insert(tk.END, f"  Author: {comment.get('author', 'Unknown')}\n")
-            
-            if comment.get('date'):
-                self.result_text.insert(tk.END, f"  Date: {comment['date']}\n")
-                
-            self.result_text.insert(tk.END, f"  Content: {comment.get('content', '')}\n\n")
+        _, comments, streamed = event
+        if not streamed:
+            self.display_comments(comments)
+        self.status_var.set(
+            f"Completed: {file_name} - {len(comments)} comments found in {self.last_stats.elapsed:.2f}s"
+        )
         
-        self.result_text.config(state=tk.DISABLED)
-
+        # If no comments found, show diagnostic info
+        if not comments:
+            self.show_message(
+                "No comments were found in this PDF file.\n\n"
+                "Possible reasons:\n"
+                "1. The PDF doesn't contain any annotations/comments\n"
+                "2. The annotations use a format not supported by the current parser\n"
+                "3. The PDF was created with software that uses non-standard annotation formats\n"
+                "4. The PDF might be encrypted or secured\n"
+            )
+    
     def display_comments(self, comments):
+        self.model.set_comments(comments)
+        self.comment_view.reset()
+    
+    def append_comments(self, comments):
+        """Add comments below the ones already shown"""
+        if comments:
+            self.model.extend(comments)
+            self.comment_view.refresh()
+    
+    def show_message(self, message):
         self.result_text.config(state=tk.NORMAL)
         self.result_text.delete(1.0, tk.END)
-        
-        if not comments:
-            self.result_text.insert(tk.END, "No comments found in this PDF.")
-            self.result_text.config(state=tk.DISABLED)
+        self.result_text.insert(tk.END, message)
+        self.result_text.config(state=tk.DISABLED)
+    
+    def show_details(self, comment):
+        """Show every field of the selected comment below the list"""
+        if comment is None:
+            self.show_message("")
             return
         
-        current_page = None
-        
-        for comment in comments:
-            if current_page != comment.get('page'):
-                current_page = comment.get('page')
-                if current_page:
-                    self.result_text.insert(tk.END, f"\n--- Page {current_page} ---\n\n")
-            
-            # Use index if available, otherwise just number them sequentially
-            index = comment.get('index', 0)
-            self.result_text.insert(tk.END, f"Comment #{index+1}:\n")
-            
-            if 'type' in comment:
-                annotation_type = comment['type'].replace('/', '')
-                self.result_text.insert(tk.END, f"  Type: {annotation_type}\n")
-            
-            self.result_text.insert(tk.END, f"  Author: {comment.get('author', 'Unknown')}\n")
-            
-            if comment.get('date'):
-                self.result_text.insert(tk.END, f"  Date: {comment['date']}\n")
-                
-            self.result_text.insert(tk.END, f"  Content: {comment.get('content', '')}\n\n")
-        
-        self.result_text.config(state=tk.DISABLED)
+        details = ""
+        if comment.get('page'):
+            details += f"Page {comment['page']}, comment #{comment.get('index', 0)+1}\n"
+        if 'type' in comment:
+            details += f"Type: {comment['type'].replace('/', '')}\n"
+        details += f"Author: {comment.get('author', 'Unknown')}\n"
+        parent = self.model.parent_of(comment)
+        if parent is not None:
+            location = f" on page {parent['page']}" if parent.get('page') else ""
+            details += f"In reply to: {parent.get('author', 'Unknown')}{location}\n"
+        if comment.get('date'):
+            details += f"Date: {comment['date']}\n"
+        details += f"Content: {comment.get('content', '')}\n"
+        self.show_message(details)
+    
+    def update_choices(self, combobox, values):
+        combobox['values'] = [''] + values
+    
+    def schedule_filter(self):
+        """Apply the filter once typing pauses, so each keystroke stays cheap"""
+        if self._filter_job is not None:
+            self.root.after_cancel(self._filter_job)
+        self._filter_job = self.root.after(FILTER_DELAY_MS, self.apply_filter)
+    
+    def apply_filter(self):
+        self._filter_job = None
+        comment_filter = CommentFilter(
+            author=self.author_var.get(),
+            type=self.type_var.get(),
+            pages=parse_page_range(self.pages_var.get()),
+            text=self.search_var.get()
+        )
+        if self.model.apply(comment_filter):
+            self.comment_view.reset()
+            if comment_filter.is_empty():
+                self.status_var.set(f"{len(self.model.comments)} comments")
+            else:
+                self.status_var.set(f"Showing {len(self.model)} of {len(self.model.comments)} comments")
+    
+    def clear_filter(self):
+        for var in (self.search_var, self.author_var, self.type_var, self.pages_var):
+            var.set("")
+    
+    def open_search(self):
+        """Show the window searching the comments of all indexed files"""
+        if self.search_window is not None and self.search_window.winfo_exists():
+            self.search_window.lift()
+            return
+        if self.index is None:
+            try:
+                self.index = CommentIndex()
+            except (OSError, sqlite3.Error) as e:
+                messagebox.showerror("Search Indexed Files", f"The search index could not be opened: {str(e)}")
+                return
+        self.search_window = SearchWindow(self.root, self.index, on_open=self.open_result)
+    
+    def open_result(self, file_path, page):
+        """Open a search result's file, showing only the page it is on"""
+        self.current_file_path = file_path
+        self.file_var.set(file_path)
+        self.process_pdf(file_path)
+        self.clear_filter()
+        if page:
+            self.pages_var.set(str(page))
+        self.root.lift()
+    
+    def show_stats(self):
+        """Show where the time went in the last extraction"""
+        if self.last_stats is None:
+            messagebox.showinfo("Extraction Statistics", "No file has been processed yet.")
+            return
+        messagebox.showinfo("Extraction Statistics", self.last_stats.format())
     
     def show_about(self):
         """Show the About dialog with application information"""
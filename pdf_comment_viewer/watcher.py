@@ -0,0 +1,327 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from batch import extract_file, _init_worker
+
+logger = logging.getLogger(__name__)
+
+# Default seconds between scans, and how long a file's size and modification
+# time must stay unchanged before it is treated as completely written
+SCAN_INTERVAL = 5.0
+SETTLE_TIME = 2.0
+
+# Most files waiting for a free worker; further changed files are picked up
+# again by later scans once the queue has drained
+MAX_QUEUE = 1000
+
+_STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+"""
+
+
+def snapshot(root):
+    """
+    Return {path: (size, mtime_ns)} for every PDF under root
+
+    Only directory listings and stats are needed, which works on network
+    mounts that have no change notifications.
+
+    Raises:
+        OSError: If root itself cannot be listed (for example an unmounted
+            share), so callers don't mistake it for every file being deleted
+    """
+    files = {}
+    stack = [root]
+    first = True
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            if first:
+                raise
+            continue
+        first = False
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.lower().endswith('.pdf') and entry.is_file():
+                    stat = entry.stat()
+                    files[os.path.abspath(entry.path)] = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                # Deleted between listing and stat
+                continue
+    return files
+
+
+class WatchState:
+    """
+    Size and modification time of every file already processed, kept on disk
+
+    A restarted watcher compares its first scan against this instead of
+    extracting everything again.
+
+    Args:
+        path (str): SQLite database file
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30)
+        self._db.executescript(_STATE_SCHEMA)
+        self.files = {
+            path: (size, mtime_ns) for path, size, mtime_ns in self._db.execute('SELECT * FROM files')
+        }
+
+    def put(self, path, signature):
+        self.files[path] = signature
+        with self._db:
+            self._db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?)', (path,) + tuple(signature))
+
+    def remove(self, path):
+        self.files.pop(path, None)
+        with self._db:
+            self._db.execute('DELETE FROM files WHERE path = ?', (path,))
+
+    def close(self):
+        self._db.close()
+
+
+class JsonlSink:
+    """
+    Append one JSON line per processed file
+
+    Lines look like {"file": ..., "event": "updated", "time": ..., "comments": [...]}
+    with event "updated", "failed" (with "error" instead of comments) or
+    "removed". The latest line for a file supersedes earlier ones.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def _write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.file.flush()
+
+    def write(self, path, records, error=None, signature=None):
+        if error:
+            self._write({'file': path, 'event': 'failed', 'time': time.time(), 'error': error})
+        else:
+            self._write({'file': path, 'event': 'updated', 'time': time.time(), 'comments': records})
+
+    def remove(self, path):
+        self._write({'file': path, 'event': 'removed', 'time': time.time()})
+
+    def close(self):
+        self.file.close()
+
+
+class IndexSink:
+    """Keep a CommentIndex (see comment_index) in step with the watched folders"""
+
+    def __init__(self, index):
+        self.index = index
+
+    def write(self, path, records, error=None, signature=None):
+        self.index.put(path, records, signature, error)
+
+    def remove(self, path):
+        self.index.remove(path)
+
+    def close(self):
+        self.index.close()
+
+
+class FolderWatcher:
+    """
+    Re-extract PDFs under some folders whenever they are added or changed
+
+    Each scan takes a stat snapshot of the folders and diffs it against the
+    files already processed (WatchState). A new or changed file is queued
+    once its size and modification time have stayed the same for settle
+    seconds, so files still being copied in are not read half-written.
+    Queued files are extracted by at most jobs worker processes and the
+    results handed to the sink; deleted files are removed from it.
+
+    Args:
+        roots (list): Folders to watch
+        sink: Receives write(path, records, error, signature) and remove(path),
+            signature being the file's (size, mtime_ns) when it was queued
+        state (WatchState): Files already processed
+        jobs (int): Worker processes; 1 extracts in the calling thread
+        settle (float): Seconds a file must be unchanged before extraction
+        max_queue (int): Most files waiting for a worker
+        fallback (bool): Retry with the alternate parser when nothing is found
+        **options: Extra keyword arguments for extract_comments
+    """
+
+    def __init__(self, roots, sink, state, jobs=None, settle=SETTLE_TIME, max_queue=MAX_QUEUE, fallback=False,
+                 **options):
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.sink = sink
+        self.state = state
+        self.jobs = jobs or os.cpu_count() or 1
+        self.settle = settle
+        self.max_queue = max_queue
+        self.fallback = fallback
+        self.options = options
+        self.queue = deque()
+        # Paths queued or being extracted
+        self.queued = set()
+        self.in_flight = {}
+        # path: (signature, time first seen with it), for files not yet settled
+        self.changing = {}
+        self._executor = None
+
+    def scan(self, now=None):
+        """
+        Diff the folders against the processed files and queue settled changes
+
+        Returns:
+            tuple: (number of files queued, number of files removed)
+        """
+        now = time.monotonic() if now is None else now
+        current = {}
+        listed = []
+        for root in self.roots:
+            try:
+                current.update(snapshot(root))
+                listed.append(root)
+            except OSError as e:
+                logger.warning(f"Cannot scan {root}, skipping it this time: {str(e)}")
+
+        queued = 0
+        for path, signature in current.items():
+            if self.state.files.get(path) == signature or path in self.queued:
+                self.changing.pop(path, None)
+                continue
+            seen = self.changing.get(path)
+            if seen is None or seen[0] != signature:
+                self.changing[path] = (signature, now)
+                if self.settle > 0:
+                    continue
+            elif now - seen[1] < self.settle:
+                continue
+            if len(self.queue) >= self.max_queue:
+                break
+            del self.changing[path]
+            self.queue.append((path, signature))
+            self.queued.add(path)
+            queued += 1
+
+        removed = 0
+        for path in list(self.state.files):
+            if path not in current and any(_is_under(path, root) for root in listed):
+                try:
+                    self.sink.remove(path)
+                except Exception as e:
+                    # Kept in the state, so the removal is retried next scan
+                    logger.error(f"{path}: could not be removed from the output: {type(e).__name__}: {e}")
+                    continue
+                self.state.remove(path)
+                removed += 1
+        for path in list(self.changing):
+            if path not in current:
+                del self.changing[path]
+        return queued, removed
+
+    def _finish(self, path, signature, records, error):
+        self.queued.discard(path)
+        if error:
+            logger.warning(f"{path}: {error}")
+        try:
+            self.sink.write(path, records, error, signature)
+        except Exception as e:
+            # One file's output must not stop the watcher; the state still
+            # has the file's old signature, so it is extracted again later
+            logger.error(f"{path}: could not be written to the output: {type(e).__name__}: {e}")
+            return
+        self.state.put(path, signature)
+
+    def process(self, timeout=0):
+        """
+        Start queued extractions and hand finished ones to the sink
+
+        Args:
+            timeout (float): How long to wait for a running extraction to finish
+
+        Returns:
+            int: Number of files finished
+        """
+        if self.jobs == 1:
+            finished = 0
+            while self.queue:
+                path, signature = self.queue.popleft()
+                self._finish(path, signature, *extract_file(path, self.fallback, **self.options)[1:])
+                finished += 1
+            return finished
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.jobs, initializer=_init_worker, initargs=(logging.getLogger().level,)
+            )
+        while self.queue and len(self.in_flight) < self.jobs * 2:
+            path, signature = self.queue.popleft()
+            future = self._executor.submit(extract_file, path, self.fallback, **self.options)
+            self.in_flight[future] = (path, signature)
+
+        if not self.in_flight:
+            return 0
+        done, _ = wait(list(self.in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            path, signature = self.in_flight.pop(future)
+            self._finish(path, signature, *future.result()[1:])
+        return len(done)
+
+    @property
+    def idle(self):
+        return not (self.queue or self.in_flight or self.changing)
+
+    def run(self, interval=SCAN_INTERVAL, stop=None, once=False):
+        """
+        Scan and extract until stop is set
+
+        Args:
+            interval (float): Seconds between scans
+            stop (threading.Event): Ends the loop when set
+            once (bool): Return as soon as every change seen so far has been
+                settled and processed
+        """
+        stop = stop if stop is not None else threading.Event()
+        try:
+            while not stop.is_set():
+                started = time.monotonic()
+                queued, removed = self.scan()
+                if queued or removed:
+                    logger.info(f"Scan queued {queued} files, removed {removed}")
+                while True:
+                    self.process(timeout=0.2)
+                    if not self.in_flight or time.monotonic() - started >= interval or stop.is_set():
+                        break
+                if once and self.idle:
+                    return
+                stop.wait(max(0.0, interval - (time.monotonic() - started)))
+        finally:
+            self.close()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+def _is_under(path, root):
+    return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
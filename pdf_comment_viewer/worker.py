@@ -0,0 +1,87 @@
+import time
+import queue
+import operator
+import logging
+import threading
+
+from pdf_processor import extract_comments, ExtractionCancelled
+
+logger = logging.getLogger(__name__)
+
+# Pages without comments are only reported this often, so a document with
+# hundreds of thousands of pages doesn't flood the event queue
+PROGRESS_INTERVAL = 0.1
+
+
+class ExtractionWorker(threading.Thread):
+    """
+    Extract comments from one file on a background thread
+
+    Results are posted to the events queue as tuples, for the UI to pick up
+    from its event loop:
+
+        ('page', page_num, page_count, comments)  comments found on pages up to page_num
+        ('done', comments, streamed)               the complete result, and whether it is
+                                                   exactly the records posted with the pages
+        ('cancelled',)
+        ('error', message)
+
+    Exactly one of 'done', 'cancelled' or 'error' is posted, last.
+
+    Args:
+        pdf_file_path (str): Path to the PDF file
+        fallback (bool): Retry with the alternate parser when nothing is found
+        **options: Extra keyword arguments for extract_comments
+    """
+
+    def __init__(self, pdf_file_path, fallback=True, **options):
+        super().__init__(daemon=True)
+        self.pdf_file_path = pdf_file_path
+        self.fallback = fallback
+        self.options = options
+        self.events = queue.Queue()
+        self._cancel = threading.Event()
+        self._pending = []
+        self._streamed = []
+        self._last_post = 0.0
+
+    def cancel(self):
+        """Ask the worker to stop at the next page boundary"""
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def _progress(self, page_num, page_count, comments):
+        if self._cancel.is_set():
+            raise ExtractionCancelled()
+
+        self._pending.extend(comments)
+        self._streamed.extend(comments)
+        now = time.monotonic()
+        if self._pending or now - self._last_post >= PROGRESS_INTERVAL:
+            self.events.put(('page', page_num, page_count, self._pending))
+            self._pending = []
+            self._last_post = now
+
+    def run(self):
+        try:
+            comments = extract_comments(
+                self.pdf_file_path, progress=self._progress, fallback=self.fallback, **self.options
+            )
+        except ExtractionCancelled:
+            self.events.put(('cancelled',))
+            return
+        except Exception as e:
+            logger.error(f"Extraction of {self.pdf_file_path} failed: {str(e)}")
+            self.events.put(('error', str(e)))
+            return
+
+        if self._cancel.is_set():
+            self.events.put(('cancelled',))
+        else:
+            # Cached and fallback results arrive at once and threads are
+            # assigned after the last page, so the pages may not match
+            streamed = len(comments) == len(self._streamed) and all(map(operator.is_, comments, self._streamed))
+            self.events.put(('done', comments, streamed))
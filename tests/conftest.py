@@ -0,0 +1,126 @@
+import zlib
+import pytest
+from pypdf import PdfWriter
+from pypdf.annotations import Text, Highlight
+from pypdf.generic import ArrayObject, FloatObject, NameObject, TextStringObject
+
+
+def write_annotated_pdf(path, pages=3, annotated_pages=(1,), author="Reviewer"):
+    """Write a PDF with one sticky note and one highlight on each annotated page"""
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=612, height=792)
+
+    for page_num in annotated_pages:
+        note = Text(text=f"Note on page {page_num}", rect=(50, 700, 70, 720))
+        note[NameObject("/T")] = TextStringObject(author)
+        writer.add_annotation(page_number=page_num - 1, annotation=note)
+
+        quad = ArrayObject([FloatObject(v) for v in (100, 520, 300, 520, 100, 500, 300, 500)])
+        highlight = Highlight(rect=(100, 500, 300, 520), quad_points=quad)
+        writer.add_annotation(page_number=page_num - 1, annotation=highlight)
+
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+
+def write_thread_pdf(path):
+    """
+    Write a one-page PDF with a reply thread
+
+    "Question" is answered by "Answer", which is answered by "Follow-up";
+    "Second answer" also replies to "Question". "Grouped" has an /IRT to
+    "Question" with /RT /Group, so it is not a reply. "Unrelated" stands alone.
+    """
+    writer = PdfWriter()
+    writer.add_blank_page(width=612, height=792)
+
+    def note(text, irt=None, group=False):
+        annotation = Text(text=text, rect=(50, 700, 70, 720))
+        annotation[NameObject("/T")] = TextStringObject(text.split()[0])
+        if irt is not None:
+            annotation[NameObject("/IRT")] = irt.indirect_reference
+        if group:
+            annotation[NameObject("/RT")] = NameObject("/Group")
+        return writer.add_annotation(page_number=0, annotation=annotation)
+
+    question = note("Question")
+    answer = note("Answer", question)
+    note("Follow-up", answer)
+    note("Second answer", question)
+    note("Grouped", question, group=True)
+    note("Unrelated")
+
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+
+def write_objstm_pdf(path, xref_stream=True, predictor=False):
+    """
+    Write a PDF whose page tree and annotations live in a compressed /ObjStm
+
+    pypdf cannot write object streams, so the file is assembled by hand. With
+    xref_stream=False the file has no cross-reference data at all and readers
+    have to rebuild it.
+    """
+    packed = {
+        2: b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        3: b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Annots [4 0 R 5 0 R] >>",
+        4: b"<< /Type /Annot /Subtype /Text /Rect [50 700 70 720] /T (Bob) /Contents (Compressed note) >>",
+        5: b"<< /Type /Annot /Subtype /Popup /Rect [80 600 200 700] /Parent 4 0 R >>",
+    }
+    header, body = [], b""
+    for num, obj in packed.items():
+        header.append(b"%d %d" % (num, len(body)))
+        body += obj + b" "
+    header = b" ".join(header) + b" "
+    objstm = zlib.compress(header + body)
+
+    out = bytearray(b"%PDF-1.5\n%\xe2\xe3\xcf\xd3\n")
+    offsets = {1: len(out)}
+    out += b"1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n"
+    offsets[6] = len(out)
+    out += b"6 0 obj << /Type /ObjStm /N %d /First %d /Filter /FlateDecode /Length %d >> stream\n" % (
+        len(packed), len(header), len(objstm))
+    out += objstm + b"\nendstream endobj\n"
+
+    if xref_stream:
+        rows = [(0, 0, 255), (1, offsets[1], 0)]
+        rows += [(2, 6, i) for i in range(len(packed))]
+        rows += [(1, offsets[6], 0), (1, len(out), 0)]
+        table = b"".join(bytes([t]) + f.to_bytes(4, "big") + g.to_bytes(2, "big") for t, f, g in rows)
+        params = b""
+        if predictor:
+            # PNG "Up" rows as most writers produce them
+            previous, encoded = bytes(7), b""
+            for i in range(0, len(table), 7):
+                row = table[i:i + 7]
+                encoded += b"\x02" + bytes((a - b) & 0xFF for a, b in zip(row, previous))
+                previous = row
+            table = encoded
+            params = b" /DecodeParms << /Predictor 12 /Columns 7 >>"
+        data = zlib.compress(table)
+        xref_offset = len(out)
+        out += b"7 0 obj << /Type /XRef /Size 8 /W [1 4 2] /Root 1 0 R /Filter /FlateDecode%s /Length %d >> stream\n" % (
+            params, len(data))
+        out += data + b"\nendstream endobj\n"
+        out += b"startxref\n%d\n%%%%EOF\n" % xref_offset
+    else:
+        out += b"trailer << /Root 1 0 R >>\n%%EOF\n"
+
+    with open(path, "wb") as f:
+        f.write(bytes(out))
+    return str(path)
+
+
+@pytest.fixture
+def annotated_pdf(tmp_path):
+    """Factory fixture returning the path of a freshly written annotated PDF"""
+    counter = iter(range(1000))
+
+    def factory(**kwargs):
+        return write_annotated_pdf(tmp_path / f"doc{next(counter)}.pdf", **kwargs)
+
+    return factory
@@ -0,0 +1,150 @@
+import re
+import sys
+import threading
+
+import pypdf
+from pdf_comment_viewer.alternate_parser import (
+    parse_pdf_manually, get_object_index, ObjectIndex, RawDocument, sniff, parse_value, decode_text,
+)
+from tests.conftest import write_objstm_pdf
+
+
+class TestAlternateParser:
+    def test_parse_pdf_manually_empty_file(self, tmp_path):
+        empty = tmp_path / "empty.pdf"
+        empty.write_bytes(b"")
+        assert parse_pdf_manually(str(empty)) == []
+
+    def test_parse_pdf_manually_attributes_nearby_author(self, tmp_path):
+        pdf = tmp_path / "raw.pdf"
+        pdf.write_bytes(
+            b"%PDF-1.4\n"
+            b"1 0 obj << /Type /Annot /Subtype /Text /T (Alice) /Contents (Check \\(this\\)) >> endobj\n"
+            + b" " * 400 +
+            b"2 0 obj << /Type /Annot /Subtype /Text /Contents (Orphan) >> endobj\n"
+        )
+
+        comments = parse_pdf_manually(str(pdf))
+
+        assert [(c['author'], c['content']) for c in comments] == [
+            ('Alice', 'Check (this)'),
+            ('Unknown', 'Orphan'),
+        ]
+
+    def test_fields_come_from_the_owning_annotation(self, tmp_path):
+        pdf = tmp_path / "neighbours.pdf"
+        pdf.write_bytes(
+            b"%PDF-1.4\n"
+            b"1 0 obj << /Type /Annot /Subtype /Text /T (Alice) /Contents (First) >> endobj\n"
+            b"2 0 obj << /Type /Annot /Subtype /Text /Contents 3 0 R /M (D:20250102) >> endobj\n"
+            b"3 0 obj (Second) endobj\n"
+            b"4 0 obj << /Type /Font /Subtype /Type1 /BaseFont /Helvetica >> endobj\n"
+        )
+
+        comments = parse_pdf_manually(str(pdf))
+
+        assert [(c['author'], c['content'], c['date']) for c in comments] == [
+            ('Alice', 'First', ''),
+            ('Unknown', 'Second', 'D:20250102'),
+        ]
+
+    def test_text_without_a_bom_is_pdfdoc_encoded(self):
+        value, _ = parse_value(b'(it\\220s \\204 \\215quoted\\216 \\240 5)', 0)
+        assert decode_text(value) == 'it\u2019s \u2014 \u201cquoted\u201d \u20ac 5'
+        assert decode_text(b'caf\xe9') == 'caf\xe9'
+        assert decode_text(b'\xfe\xff\x20\x19') == '\u2019'
+
+    def test_object_index_is_reused(self, annotated_pdf):
+        pdf = annotated_pdf(pages=2, annotated_pages=(2,))
+        with open(pdf, 'rb') as f:
+            data = f.read()
+
+        index = get_object_index(pdf, data)
+        assert not index.rebuilt
+        assert get_object_index(pdf, data) is index
+
+        comments = parse_pdf_manually(pdf)
+        assert [(c['page'], c['index'], c['type']) for c in comments] == [(2, 0, '/Text'), (2, 1, '/Highlight')]
+
+    def test_rebuilt_index_replaces_the_cached_one(self, annotated_pdf, tmp_path):
+        data = open(annotated_pdf(), 'rb').read()
+        # Point the catalog's xref entry at the object before it
+        root = int(re.search(rb'/Root (\d+) 0 R', data).group(1))
+        xref = data.rindex(b'\nxref')
+        entries = re.findall(rb'(\d{10}) (\d{5}) [nf]', data[xref:])
+        wrong = b'%010d' % int(entries[root - 1][0])
+        start = xref + data[xref:].index(entries[root][0])
+        pdf = tmp_path / "stale.pdf"
+        pdf.write_bytes(data[:start] + wrong + data[start + 10:])
+        data = pdf.read_bytes()
+
+        index = get_object_index(str(pdf), data)
+        assert not index.rebuilt
+        document = RawDocument(data, index)
+        assert document.get(root)['/Type'] == '/Catalog'
+        assert document.index.rebuilt
+        # Later readers get the rebuilt index rather than scanning again
+        assert get_object_index(str(pdf), data) is document.index
+        assert index.rebuild(data) is document.index
+
+    def test_shared_index_locates_objects_from_many_threads(self, tmp_path):
+        pdf = write_objstm_pdf(tmp_path / "shared.pdf", xref_stream=False)
+        data = open(pdf, 'rb').read()
+        index = ObjectIndex.build(data)
+        assert index.pending_streams
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        barrier = threading.Barrier(8)
+        found = []
+
+        def read():
+            document = RawDocument(data, index)
+            barrier.wait()
+            found.append(document.get(4) and document.get(4)['/Contents'])
+
+        try:
+            threads = [threading.Thread(target=read) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+        assert found == [b'Compressed note'] * 8
+
+    def test_reads_annotations_from_object_streams(self, tmp_path):
+        for name, kwargs in [('xref', {}), ('predictor', {'predictor': True}), ('rebuild', {'xref_stream': False})]:
+            pdf = write_objstm_pdf(tmp_path / f"{name}.pdf", **kwargs)
+
+            comments = parse_pdf_manually(pdf)
+
+            assert [(c['page'], c['author'], c['content']) for c in comments] == [(1, 'Bob', 'Compressed note')], name
+
+    def test_object_streams_are_inflated_lazily(self, tmp_path):
+        pdf = write_objstm_pdf(tmp_path / "lazy.pdf", xref_stream=False)
+        with open(pdf, 'rb') as f:
+            data = f.read()
+
+        document = RawDocument(data, ObjectIndex.build(data))
+        assert document.get(1)['/Type'] == '/Catalog'
+        assert document.inflated == set()
+
+        assert document.get(4)['/Contents'] == b'Compressed note'
+        assert document.inflated == {6}
+
+    def test_sniff_reads_header_and_trailer(self, tmp_path, annotated_pdf):
+        plain = open(annotated_pdf(), 'rb').read()
+        assert sniff(plain) == ('1.3', False, False, False)
+
+        compressed = tmp_path / "objstm.pdf"
+        write_objstm_pdf(str(compressed))
+        traits = sniff(compressed.read_bytes())
+        assert (traits.xref_stream, traits.object_streams, traits.encrypted) == (True, True, False)
+
+        writer = pypdf.PdfWriter(clone_from=annotated_pdf())
+        writer.encrypt('', 'owner')
+        encrypted = tmp_path / "encrypted.pdf"
+        writer.write(str(encrypted))
+        assert sniff(encrypted.read_bytes()).encrypted
+
+        assert sniff(b"not really a pdf") is None
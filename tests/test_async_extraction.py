@@ -0,0 +1,120 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+from pdf_comment_viewer import async_extraction
+from pdf_comment_viewer.async_extraction import extract_comments_async, iter_comments_async
+from pdf_comment_viewer.pdf_processor import extract_comments, iter_comments
+
+
+class SlowParse:
+    """Stands in for extract_comments/iter_comments, one page every few milliseconds"""
+
+    def __init__(self, pages=1000, delay=0.005):
+        self.pages = pages
+        self.delay = delay
+        self.reached = 0
+        self.running = 0
+        self.most_running = 0
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+
+    def __call__(self, path, progress=None, **options):
+        with self.lock:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        try:
+            for page in range(1, self.pages + 1):
+                time.sleep(self.delay)
+                self.reached = page
+                progress(page, self.pages, [])
+            return []
+        finally:
+            with self.lock:
+                self.running -= 1
+            self.stopped.set()
+
+
+class TestExtractCommentsAsync:
+    def test_matches_blocking_extraction(self, annotated_pdf):
+        pdf = annotated_pdf(pages=3, annotated_pages=(1, 3))
+        expected = extract_comments(pdf)
+        assert asyncio.run(extract_comments_async(pdf)) == expected
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            assert asyncio.run(extract_comments_async(pdf, executor=executor)) == expected
+
+    def test_timeout_stops_the_worker(self, monkeypatch):
+        parse = SlowParse()
+        monkeypatch.setattr(async_extraction, 'extract_comments', parse)
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(extract_comments_async('any.pdf', timeout=0.05))
+        # Returned only once the worker had stopped, at a page boundary
+        assert parse.stopped.is_set()
+        assert 0 < parse.reached < parse.pages
+
+    def test_cancellation_stops_the_worker(self, monkeypatch):
+        parse = SlowParse()
+        monkeypatch.setattr(async_extraction, 'extract_comments', parse)
+
+        async def scenario():
+            task = asyncio.ensure_future(extract_comments_async('any.pdf'))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(scenario())
+        assert parse.stopped.is_set() and parse.reached < parse.pages
+
+    def test_concurrent_parses_are_limited(self, monkeypatch):
+        parse = SlowParse(pages=5, delay=0.002)
+        monkeypatch.setattr(async_extraction, 'extract_comments', parse)
+        monkeypatch.setattr(async_extraction, '_max_parses', 2)
+
+        async def scenario():
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                await asyncio.gather(*(extract_comments_async('any.pdf', executor=executor) for _ in range(10)))
+
+        asyncio.run(scenario())
+        assert parse.most_running == 2
+
+
+class TestIterCommentsAsync:
+    def test_matches_blocking_iteration(self, annotated_pdf):
+        pdf = annotated_pdf(pages=4, annotated_pages=(1, 2, 4))
+        expected = list(iter_comments(pdf))
+
+        async def collect(**kwargs):
+            return [comment async for comment in iter_comments_async(pdf, buffer=1, **kwargs)]
+
+        assert asyncio.run(collect()) == expected
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            assert asyncio.run(collect(executor=executor)) == expected
+
+    def test_leaving_early_stops_the_worker(self, monkeypatch, annotated_pdf):
+        pdf = annotated_pdf(pages=200, annotated_pages=range(1, 201))
+        reached = []
+        real_iter_comments = async_extraction.iter_comments
+
+        def iter_comments_tracked(path, progress=None, **options):
+            def track(page_num, page_count, comments):
+                reached.append(page_num)
+                progress(page_num, page_count, comments)
+            return real_iter_comments(path, progress=track, **options)
+
+        monkeypatch.setattr(async_extraction, 'iter_comments', iter_comments_tracked)
+
+        async def first_comment():
+            comments = iter_comments_async(pdf, buffer=2)
+            try:
+                async for comment in comments:
+                    return comment
+            finally:
+                await comments.aclose()
+
+        assert asyncio.run(first_comment())['page'] == 1
+        # The parser got at most a few pages past the buffer before stopping
+        assert len(reached) < 10
@@ -0,0 +1,136 @@
+import sys
+import logging
+import time
+import multiprocessing
+
+import pytest
+from pypdf import PdfReader, PdfWriter
+
+from pdf_comment_viewer import pdf_processor
+from pdf_comment_viewer.batch import _init_worker
+from pdf_comment_viewer.cli import main
+from pdf_comment_viewer.alternate_parser import PdfTraits
+from pdf_comment_viewer.pdf_processor import extract_comments
+from pdf_comment_viewer.stats import ExtractionStats
+
+# The registry the built-in backends were registered in when pdf_processor was imported
+backends = sys.modules[pdf_processor.extract_with_backends.__module__]
+Backend = backends.Backend
+BackendTimings = backends.BackendTimings
+extract_with_backends = backends.extract_with_backends
+select_backends = backends.select_backends
+
+PLAIN = PdfTraits('1.7', False, False, False)
+ENCRYPTED = PdfTraits('1.7', True, False, False)
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """The registered backends, restored after the test"""
+    monkeypatch.setattr(backends, 'BACKENDS', dict(backends.BACKENDS))
+    return backends.BACKENDS
+
+
+def _names(candidates):
+    return [backend.name for backend in candidates]
+
+
+def _found_nothing(pdf_file_path, buffer, **options):
+    return []
+
+
+def _slow(pdf_file_path, buffer, **options):
+    time.sleep(30)
+    return []
+
+
+class TestSelection:
+    def test_traits_rule_out_backends(self, registry):
+        registry.pop('pymupdf')
+        assert _names(select_backends(PLAIN, BackendTimings())) == ['raw', 'pypdf']
+        assert _names(select_backends(ENCRYPTED, BackendTimings())) == ['pypdf']
+
+    def test_unavailable_backends_are_skipped(self, registry):
+        backends.register_backend(Backend('missing', _found_nothing, speed='fast', requires='no_such_module'))
+        assert 'missing' not in _names(select_backends(PLAIN, BackendTimings()))
+
+    def test_recorded_timings_change_the_ranking(self, registry):
+        registry.pop('pymupdf')
+        timings = BackendTimings()
+        timings.record('raw', 2.0, 1_000_000)
+        timings.record('pypdf', 0.5, 1_000_000)
+        assert _names(select_backends(PLAIN, timings)) == ['pypdf', 'raw']
+        # A moving average: one fast run doesn't undo the slow ones at once
+        timings.record('raw', 0.0, 1_000_000)
+        assert timings.rates['raw'] == pytest.approx(1.6)
+
+    def test_unknown_backend(self, annotated_pdf):
+        with pytest.raises(ValueError, match='Unknown backend'):
+            extract_comments(annotated_pdf(), backend='nope')
+
+
+class TestExtraction:
+    @pytest.mark.parametrize('backend', ['auto', 'pypdf', 'raw'])
+    def test_backends_agree(self, annotated_pdf, backend):
+        pdf = annotated_pdf(pages=3, annotated_pages=(1, 3))
+        expected = extract_comments(pdf)
+        stats = ExtractionStats()
+        assert extract_comments(pdf, backend=backend, stats=stats) == expected
+        assert stats.parser
+
+    def test_encrypted_file_goes_to_pypdf(self, annotated_pdf, tmp_path, registry):
+        registry.pop('pymupdf')
+        writer = PdfWriter(clone_from=PdfReader(annotated_pdf()))
+        writer.encrypt('', 'owner')
+        encrypted = str(tmp_path / 'encrypted.pdf')
+        writer.write(encrypted)
+        comments, name = extract_with_backends(encrypted, timings=BackendTimings())
+        assert name == 'pypdf'
+        assert [c.content for c in comments][0] == 'Note on page 1'
+
+    def test_fallback_after_finding_nothing(self, annotated_pdf, registry):
+        backends.register_backend(Backend('empty', _found_nothing, speed='fast'))
+        registry.pop('pymupdf')
+        timings = BackendTimings()
+        timings.record('empty', 0.0, 1_000_000)
+        pdf = annotated_pdf()
+
+        assert extract_with_backends(pdf, timings=timings) == ([], 'empty')
+        stats = ExtractionStats()
+        comments, name = extract_with_backends(pdf, fallback=True, timings=timings, stats=stats)
+        assert len(comments) == 2 and name != 'empty'
+        assert 'empty found nothing' in stats.fallbacks
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork', reason='fake backends are registered before forking')
+class TestRace:
+    def test_race_matches_pypdf(self, annotated_pdf):
+        pdf = annotated_pdf(pages=3, annotated_pages=(1, 2))
+        stats = ExtractionStats()
+        assert extract_comments(pdf, race=True, stats=stats) == extract_comments(pdf)
+        assert stats.parser.endswith('(race)')
+
+    def test_slow_backend_loses_and_is_stopped(self, annotated_pdf, registry):
+        backends.register_backend(Backend('slow', _slow, speed='fast'))
+        registry.pop('pymupdf')
+        timings = BackendTimings()
+        timings.record('slow', 0.0, 1_000_000)
+        pdf = annotated_pdf()
+        children = set(multiprocessing.active_children())
+
+        started = time.perf_counter()
+        comments, name = extract_with_backends(pdf, race=True, timings=timings)
+        assert name == 'raw' and len(comments) == 2
+        assert time.perf_counter() - started < 10
+        assert set(multiprocessing.active_children()) == children
+
+    def test_no_race_in_batch_workers(self, annotated_pdf, monkeypatch, capsys):
+        monkeypatch.setattr(backends, '_in_worker', False)
+        pdf = annotated_pdf()
+        _init_worker(logging.getLogger().level)
+        stats = ExtractionStats()
+        assert len(extract_comments(pdf, race=True, stats=stats)) == 2
+        assert not stats.parser.endswith('(race)')
+
+        assert main(['extract', pdf, '--race', '--jobs', '2', '--no-cache']) == 2
+        assert capsys.readouterr().out == ''
@@ -0,0 +1,52 @@
+import json
+from pdf_comment_viewer.batch import iter_pdf_paths, run_batch, BatchStats
+from pdf_comment_viewer.cli import main
+
+
+class TestBatch:
+    def test_iter_pdf_paths_walks_directories_once(self, tmp_path, annotated_pdf):
+        nested = tmp_path / "nested"
+        nested.mkdir()
+        first = annotated_pdf()
+        (tmp_path / "notes.txt").write_text("not a pdf")
+        second = str(nested / "copy.pdf")
+        with open(first, 'rb') as src, open(second, 'wb') as dst:
+            dst.write(src.read())
+
+        paths = list(iter_pdf_paths([str(tmp_path), first, str(tmp_path / "*.pdf")]))
+        assert sorted(paths) == sorted([first, second])
+
+    def test_run_batch_isolates_failures(self, tmp_path, annotated_pdf):
+        good = annotated_pdf(pages=2, annotated_pages=(1, 2))
+        bad = tmp_path / "broken.pdf"
+        bad.write_bytes(b"not really a pdf")
+
+        stats = BatchStats()
+        results = {path: (records, error) for path, records, error in run_batch([good, str(bad)], jobs=2, stats=stats)}
+
+        assert len(results[good][0]) == 4
+        assert results[good][1] is None
+        assert results[str(bad)][1]
+        assert (stats.files, stats.failed, stats.comments) == (2, 1, 4)
+
+    def test_cli_extract_writes_jsonl(self, tmp_path, annotated_pdf):
+        pdf = annotated_pdf(pages=1)
+        output = tmp_path / "out.jsonl"
+
+        assert main(['extract', '--jobs', '1', '--cache-path', str(tmp_path / 'cache.sqlite3'), '-o', str(output), pdf]) == 0
+
+        records = [json.loads(line) for line in output.read_text().splitlines()]
+        assert [r['type'] for r in records] == ['/Text', '/Highlight']
+        assert records[0]['file'] == pdf
+        assert records[0]['content'] == 'Note on page 1'
+
+    def test_cli_profile_reports_stages(self, annotated_pdf, capsys):
+        pdf = annotated_pdf(pages=2, annotated_pages=(2,))
+
+        assert main(['profile', '--json', pdf]) == 0
+
+        report = json.loads(capsys.readouterr().out)
+        assert report['file'] == pdf
+        assert report['comments'] == 2
+        assert report['parser'] == 'pypdf'
+        assert report['counters']['pages'] == 2
@@ -0,0 +1,66 @@
+import os
+from pdf_comment_viewer import cache as cache_module
+from pdf_comment_viewer.cache import ExtractionCache
+from pdf_comment_viewer import pdf_processor
+
+
+class TestExtractionCache:
+    def test_hit_after_touch_and_miss_after_change(self, tmp_path, annotated_pdf):
+        cache = ExtractionCache(str(tmp_path / "cache.sqlite3"))
+        pdf = annotated_pdf(pages=1)
+        comments = [{'page': 1, 'index': 0, 'content': 'cached', 'author': 'A', 'date': '', 'type': '/Text'}]
+
+        assert cache.get(pdf, 'v') is None
+        cache.put(pdf, comments, 'v')
+        assert cache.get(pdf, 'v') == comments
+        assert cache.get(pdf, 'other') is None
+
+        # Same content under a new mtime is found through the content hash
+        stat = os.stat(pdf)
+        os.utime(pdf, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert cache.get(pdf, 'v') == comments
+
+        with open(pdf, 'ab') as f:
+            f.write(b'\n% appended\n')
+        assert cache.get(pdf, 'v') is None
+
+    def test_a_miss_is_hashed_once(self, tmp_path, annotated_pdf, monkeypatch):
+        cache = ExtractionCache(str(tmp_path / "cache.sqlite3"))
+        first, second = annotated_pdf(pages=1), annotated_pdf(pages=2)
+        hashed = []
+        content_hash = cache_module.content_hash
+        monkeypatch.setattr(cache_module, 'content_hash', lambda path: hashed.append(path) or content_hash(path))
+
+        assert cache.get(first, 'v') is None
+        cache.put(first, [], 'v')
+        assert hashed == [first]
+
+        # A file changed between the miss and the put is hashed again
+        assert cache.get(second, 'v') is None
+        with open(second, 'ab') as f:
+            f.write(b'\n% appended\n')
+        cache.put(second, [], 'v')
+        assert hashed == [first, second, second]
+
+    def test_least_recently_used_entries_are_evicted(self, tmp_path, annotated_pdf):
+        cache = ExtractionCache(str(tmp_path / "cache.sqlite3"), max_bytes=300)
+        first, second = annotated_pdf(pages=1), annotated_pdf(pages=2)
+        payload = [{'content': 'x' * 200}]
+
+        cache.put(first, payload, 'v')
+        cache.put(second, payload, 'v')
+
+        assert cache.get(first, 'v') is None
+        assert cache.get(second, 'v') == payload
+
+    def test_extract_comments_is_served_from_cache(self, tmp_path, annotated_pdf, monkeypatch):
+        cache = ExtractionCache(str(tmp_path / "cache.sqlite3"))
+        pdf = annotated_pdf(pages=2, annotated_pages=(2,))
+
+        first = pdf_processor.extract_comments(pdf, cache=cache)
+
+        def fail(*args, **kwargs):
+            raise AssertionError("file was parsed again")
+        monkeypatch.setattr(pdf_processor, 'iter_comments', fail)
+
+        assert pdf_processor.extract_comments(pdf, cache=cache) == first
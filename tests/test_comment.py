@@ -0,0 +1,39 @@
+import pickle
+from pypdf.generic import TextStringObject, NameObject
+from pdf_comment_viewer.comment import Comment
+
+
+class TestComment:
+    def test_behaves_like_the_old_dictionaries(self):
+        comment = Comment(
+            id=7, page=2, index=0, content=TextStringObject("Fix this"),
+            author=TextStringObject("Alice"), date='', type=NameObject('/Text')
+        )
+        record = {
+            'id': 7, 'page': 2, 'index': 0, 'content': 'Fix this',
+            'author': 'Alice', 'date': '', 'type': '/Text'
+        }
+
+        assert comment == record
+        assert dict(comment) == record
+        assert comment['content'] == 'Fix this'
+        assert type(comment['content']) is str and type(comment['type']) is str
+        assert comment.get('source', 'pypdf') == 'pypdf'
+        assert 'source' not in comment and 'page' in comment
+        assert not hasattr(comment, '__dict__')
+
+    def test_optional_fields_and_round_trips(self):
+        loose = Comment(content="Found by scan", source='alternate_parser')
+        assert list(loose) == ['id', 'content', 'author', 'date', 'type', 'source']
+        assert loose.get('page') is None
+
+        assert Comment.from_dict(loose.to_dict()) == loose
+        assert pickle.loads(pickle.dumps(loose)) == loose
+        moved = loose._replace(page=3, index=1)
+        assert (moved['page'], moved['index'], loose.get('page')) == (3, 1, None)
+
+    def test_type_and_author_are_interned(self):
+        first = Comment(author=''.join(['Rev', 'iewer']), type=''.join(['/High', 'light']))
+        second = Comment(author=''.join(['Revi', 'ewer']), type=''.join(['/Highl', 'ight']))
+        assert first.author is second.author
+        assert first.type is second.type
@@ -0,0 +1,85 @@
+import pytest
+import os
+from pdf_comment_viewer import comment_index
+from pdf_comment_viewer.comment_index import CommentIndex, sortable_date, text_query
+from pdf_comment_viewer.cli import main
+
+
+class TestCommentIndex:
+    def test_sortable_date_and_text_query(self):
+        assert sortable_date("D:20240115093000+01'00'") == "2024-01-15 09:30:00"
+        assert sortable_date("D:2024") == "2024-01-01 00:00:00"
+        assert sortable_date("yesterday") == ""
+        assert text_query('tolerance "AND (x') == '"tolerance" "AND" "x"'
+        assert text_query('toler*') == '"toler"*'
+
+    def test_search_filters(self, tmp_path):
+        index = CommentIndex(str(tmp_path / "index.sqlite3"))
+        pdf = tmp_path / "a.pdf"
+        pdf.write_bytes(b"%PDF-1.4\n")
+        stat = os.stat(pdf)
+        index.put(str(pdf), [
+            {'page': 1, 'index': 0, 'content': 'Check the tolerance here', 'author': 'J. Smith',
+             'date': 'D:20240210', 'type': '/Text'},
+            {'page': 2, 'index': 0, 'content': 'Tolerances look fine', 'author': 'A. Jones',
+             'date': 'D:20240305', 'type': '/Highlight'},
+            {'page': 3, 'index': 0, 'content': 'Tolerance missing', 'author': 'J. Smith',
+             'date': 'D:20240620', 'type': '/Text'},
+        ], (stat.st_size, stat.st_mtime_ns))
+
+        def pages(**query):
+            return sorted(r['page'] for r in index.search(**query))
+
+        assert pages(text='tolerance') == [1, 3]
+        assert pages(text='toler*') == [1, 2, 3]
+        assert pages(text='tolerance', author='smith j') == [1, 3]
+        assert pages(author='jones') == [2]
+        assert pages(text='toler*', since='2024-02', until='2024-03') == [1, 2]
+        for malformed in ['2024/01', '24-03', '2024-3', '2024-13']:
+            with pytest.raises(ValueError):
+                index.search(text='toler*', until=malformed)
+        assert pages(text='toler*', type='Highlight') == [2]
+        assert index.search(text='missing')[0]['file'] == str(pdf)
+        assert pages(text='nothing') == []
+
+    def test_cli_indexes_only_changed_files(self, tmp_path, annotated_pdf, capsys):
+        first = annotated_pdf(pages=2, annotated_pages=(2,))
+        second = annotated_pdf(pages=1, annotated_pages=(1,), author="Carol")
+        args = ['--index-path', str(tmp_path / 'index.sqlite3'), '--no-cache', '--jobs', '1']
+
+        assert main(['index', str(tmp_path)] + args) == 0
+        assert '2 files indexed' in capsys.readouterr().err
+
+        os.remove(first)
+        stat = os.stat(second)
+        os.utime(second, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+        assert main(['index', str(tmp_path)] + args) == 0
+        assert '1 files indexed (0 failed), 1 removed' in capsys.readouterr().err
+
+        assert main(['search', 'note', '--author', 'carol', '--json', '--index-path', str(tmp_path / 'index.sqlite3')]) == 0
+        results = capsys.readouterr().out.splitlines()
+        assert len(results) == 1
+        assert '"page": 1' in results[0]
+
+        assert main(['search', 'note', '--since', '2024/01', '--index-path', str(tmp_path / 'index.sqlite3')]) == 2
+        assert capsys.readouterr().out == ''
+
+    def test_files_changed_during_extraction(self, tmp_path, annotated_pdf, monkeypatch):
+        index = CommentIndex(str(tmp_path / "index.sqlite3"))
+        edited = annotated_pdf()
+        deleted = annotated_pdf()
+        real_run_batch = comment_index.run_batch
+
+        def run_batch(paths, **options):
+            for path, records, error in real_run_batch(paths, **options):
+                if path == os.path.abspath(edited):
+                    stat = os.stat(edited)
+                    os.utime(edited, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+                else:
+                    os.remove(deleted)
+                yield path, records, error
+
+        monkeypatch.setattr(comment_index, 'run_batch', run_batch)
+        assert index.update([edited, deleted], jobs=1, cache=False) == 2
+        # Indexed as it was when extracted, so the edit is picked up next time
+        assert list(index.stale_paths([edited, deleted])) == [os.path.abspath(edited)]
@@ -0,0 +1,70 @@
+from pdf_comment_viewer.comment import Comment
+from pdf_comment_viewer.comment_model import CommentModel, CommentFilter, parse_page_range
+
+
+def make_comments(count):
+    authors = ['Alice', 'Bob', 'Carol']
+    types = ['/Text', '/Highlight']
+    return [
+        {
+            'page': i // 10 + 1,
+            'index': i % 10,
+            'content': f"Comment {i} about section {i % 7}",
+            'author': authors[i % 3],
+            'date': '',
+            'type': types[i % 2]
+        }
+        for i in range(count)
+    ]
+
+
+class TestCommentModel:
+    def test_parse_page_range(self):
+        assert parse_page_range("5") == (5, 5)
+        assert parse_page_range(" 3 - 10 ") == (3, 10)
+        assert parse_page_range("7-") == (7, None)
+        assert parse_page_range("-4") == (None, 4)
+        assert parse_page_range("") is None
+        assert parse_page_range("abc") is None
+
+    def test_filters_combine_and_narrow(self):
+        model = CommentModel()
+        model.set_comments(make_comments(100))
+        assert len(model) == 100
+
+        model.apply(CommentFilter(author='Bob', pages=(2, 3)))
+        assert [c['index'] for c in (model[i] for i in range(len(model)))] == [0, 3, 6, 9, 2, 5, 8]
+
+        model.apply(CommentFilter(author='Bob', pages=(2, 3), text='SECTION 3'))
+        assert all('section 3' in model[i]['content'] for i in range(len(model)))
+        assert len(model) == 1
+
+        model.apply(CommentFilter(type='Highlight'))
+        assert len(model) == 50
+
+    def test_extend_applies_current_filter(self):
+        model = CommentModel()
+        model.apply(CommentFilter(author='Carol'))
+        comments = make_comments(30)
+        model.extend(comments[:15])
+        model.extend(comments[15:])
+
+        assert len(model.comments) == 30
+        assert [model[i] for i in range(len(model))] == comments[2::3]
+        assert model.authors() == ['Alice', 'Bob', 'Carol']
+
+    def test_replies_follow_their_parent(self):
+        model = CommentModel()
+        model.set_comments([
+            Comment(id=1, page=1, content="Question", author="Alice"),
+            Comment(id=5, page=1, content="Unrelated", author="Bob"),
+            Comment(id=2, page=1, content="Answer", author="Bob", parent_id=1),
+            Comment(id=3, page=1, content="Follow-up", author="Alice", parent_id=2),
+        ])
+
+        assert [model[row]['content'] for row in range(len(model))] == ["Question", "Answer", "Follow-up", "Unrelated"]
+        assert [model.depth(row) for row in range(len(model))] == [0, 1, 2, 0]
+        assert model.parent_of(model[2])['content'] == "Answer"
+
+        model.apply(CommentFilter(author="Alice"))
+        assert [model[row]['content'] for row in range(len(model))] == ["Question", "Follow-up"]
@@ -0,0 +1,87 @@
+import math
+import json
+import pytest
+from pdf_comment_viewer import comment_table
+from pdf_comment_viewer.comment_table import CommentTable, parse_pdf_date, parse_pdf_dates, date_bound
+from pdf_comment_viewer.cli import main
+
+DATES = [
+    "D:20240115093000+01'00'", "D:20240115093000Z", "D:20240115093000-05'30'", "20240115", "D:2024",
+    "D:20240229120000+0100", "D:20241301", "garbage", "", "D:2024011509300",
+]
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def backend(request, monkeypatch):
+    """Run a test with NumPy (when installed) and with the pure Python fallback"""
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(comment_table, 'np', None)
+    return request.param
+
+
+def make_table():
+    def comment(page, author, type, date, content=''):
+        return {'page': page, 'author': author, 'type': type, 'date': date, 'content': content}
+
+    table = CommentTable([
+        comment(1, 'Ann', '/Text', 'D:20240102', 'Check tolerance'),
+        comment(2, 'Bob', '/Highlight', 'D:20240109'),
+        comment(12, 'Ann', '/Text', 'D:20240110', 'Tolerance again'),
+        comment(None, 'Cy', '/FreeText', ''),
+    ], file='a.pdf')
+    table.extend([comment(25, 'Bob', '/Text', 'D:20240201')], file='b.pdf')
+    return table
+
+
+class TestCommentTable:
+    def test_parse_pdf_date(self):
+        assert parse_pdf_date("D:20240115093000+01'00'") == 1705307400.0
+        assert parse_pdf_date("D:20240115093000Z") == parse_pdf_date("D:20240115103000+01")
+        assert parse_pdf_date("D:2024") == 1704067200.0
+        assert math.isnan(parse_pdf_date("D:20241301"))
+        assert date_bound('2024-12', end=True) == parse_pdf_date('D:2025')
+
+    def test_parse_pdf_dates_matches_single_parser(self, backend):
+        expected = [parse_pdf_date(date) for date in DATES]
+        for value, single in zip(parse_pdf_dates(DATES), expected):
+            assert value == single or (math.isnan(value) and math.isnan(single))
+
+    def test_filter_sort_and_counts(self, backend):
+        table = make_table()
+        assert table.authors == ['Ann', 'Bob', 'Cy']
+
+        assert table.filter(author='Ann').tolist() == [0, 2]
+        assert table.filter(type='/Text', pages=(2, None)).tolist() == [2, 4]
+        assert table.filter(text='tolerance').tolist() == [0, 2]
+        assert table.filter(since=date_bound('2024-01-05'), until=date_bound('2024-01', end=True)).tolist() == [1, 2]
+        assert table.filter(rows=[4, 2, 0], author='nobody').tolist() == []
+        # The order of rows is kept
+        assert table.filter(rows=[4, 2, 0], type='Text').tolist() == [4, 2, 0]
+
+        assert table.sort(by='author').tolist() == [0, 2, 1, 4, 3]
+        assert table.sort(by='date', descending=True).tolist() == [4, 2, 1, 0, 3]
+
+        assert table.counts('author') == [('Ann', 2), ('Bob', 2), ('Cy', 1)]
+        assert table.counts('file') == [('a.pdf', 4), ('b.pdf', 1)]
+        assert table.counts('pages', band=10) == [('1-10', 2), ('11-20', 1), ('21-30', 1), (None, 1)]
+        # 2024-01-01 was a Monday
+        assert table.counts('week') == [('2024-01-01', 1), ('2024-01-08', 2), ('2024-01-29', 1), (None, 1)]
+        assert table.counts('month', table.filter(author='Bob')) == [('2024-01', 1), ('2024-02', 1)]
+
+    def test_cli_report(self, tmp_path, annotated_pdf, capsys):
+        annotated_pdf(pages=3, annotated_pages=(1, 3))
+        annotated_pdf(pages=1, annotated_pages=(1,), author="Carol")
+        assert main(['report', str(tmp_path), '--by', 'type', '--by', 'author', '--type', 'Text', '--json',
+                     '--no-cache', '-j', '1']) == 0
+        by_type, by_author = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert by_type == {'by': 'type', 'groups': [['Text', 3]]}
+        assert by_author['groups'] == [['Reviewer', 2], ['Carol', 1]]
+
+    @pytest.mark.parametrize('band', ['0', '-5', 'ten'])
+    def test_cli_report_rejects_bad_bands(self, tmp_path, band, capsys):
+        with pytest.raises(SystemExit) as exit_info:
+            main(['report', str(tmp_path), '--by', 'pages', '--band', band])
+        assert exit_info.value.code == 2
+        assert '--band' in capsys.readouterr().err
@@ -0,0 +1,151 @@
+import json
+from pypdf import PdfWriter
+from pypdf.annotations import Text
+from pypdf.generic import NameObject, TextStringObject
+
+from pdf_comment_viewer import diff
+from pdf_comment_viewer.diff import diff_comments, extract_revisions, fingerprint
+from pdf_comment_viewer.pdf_processor import extract_comments
+from pdf_comment_viewer.cli import main
+
+
+def write_revision(path, notes, pages=2):
+    """
+    Write a PDF with one sticky note per (name, page, text) in notes
+
+    A name of None leaves out /NM. A note whose text starts with "state:"
+    is a review state reply (with that state) to the note before it.
+    """
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=612, height=792)
+    previous = None
+    for name, page, text in notes:
+        note = Text(text=text, rect=(50, 700, 70, 720))
+        note[NameObject("/T")] = TextStringObject("Reviewer")
+        if name is not None:
+            note[NameObject("/NM")] = TextStringObject(name)
+        if text.startswith("state:"):
+            note[NameObject("/IRT")] = previous.indirect_reference
+            note[NameObject("/State")] = TextStringObject(text.split(":", 1)[1])
+            note[NameObject("/StateModel")] = TextStringObject("Review")
+        previous = writer.add_annotation(page_number=page - 1, annotation=note)
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+
+def _record(key, content, page=1, author="Reviewer", id=None, **fields):
+    return dict(id=id, key=key, content=content, page=page, author=author, type="/Text", **fields)
+
+
+def _changes(events):
+    return sorted((event['change'], (event['new'] or event['old'])['content']) for event in events)
+
+
+class TestDiffComments:
+    def test_unchanged(self):
+        comments = [_record("nm:a", "One"), _record("nm:b", "Two")]
+        assert list(diff_comments(comments, list(comments))) == []
+
+    def test_added_removed_edited_moved(self):
+        old = [_record("nm:a", "Keep"), _record("nm:b", "Typo"), _record("nm:c", "Gone"), _record("nm:d", "Here")]
+        new = [_record("nm:a", "Keep"), _record("nm:b", "Fixed"), _record("nm:d", "Here", page=2),
+               _record("nm:e", "New")]
+        events = list(diff_comments(old, new))
+        assert _changes(events) == [
+            ('added', 'New'), ('edited', 'Fixed'), ('moved', 'Here'), ('removed', 'Gone')
+        ]
+        edited = next(event for event in events if event['change'] == 'edited')
+        assert edited['old']['content'] == "Typo"
+
+    def test_key_change_is_matched_by_content(self):
+        # Without /NM a moved annotation gets another key
+        old = [_record("h:1", "Wandering", page=1)]
+        new = [_record("h:2", "Wandering", page=2)]
+        assert _changes(diff_comments(old, new)) == [('moved', 'Wandering')]
+
+    def test_duplicate_keys_are_matched_in_order(self):
+        old = [_record("h:1", "Same"), _record("h:1", "Same")]
+        new = [_record("h:1", "Same")]
+        assert _changes(diff_comments(old, new)) == [('removed', 'Same')]
+
+    def test_resolved_and_reopened(self):
+        old = [
+            _record("nm:a", "Fix this", id=1), _record("nm:b", "And this", id=2),
+            _record("nm:s", "Accepted", id=3, parent_id=2, state="Accepted"),
+        ]
+        new = [
+            _record("nm:a", "Fix this", id=10), _record("nm:b", "And this", id=11),
+            _record("nm:t", "Completed", id=12, parent_id=10, state="Completed"),
+            _record("nm:u", "Reopened", id=13, parent_id=11, state="None"),
+        ]
+        events = list(diff_comments(old, new))
+        assert _changes(events) == [('reopened', 'And this'), ('resolved', 'Fix this')]
+        assert {event['state'] for event in events} == {'Completed', 'None'}
+
+    def test_new_side_is_streamed(self):
+        old = [_record("nm:a", "Before")]
+        seen = []
+
+        def new():
+            seen.append("first")
+            yield _record("nm:a", "After")
+            seen.append("second")
+
+        events = diff_comments(old, new())
+        assert next(events)['change'] == 'edited'
+        assert seen == ["first"]
+
+    def test_fingerprint_without_key(self):
+        assert fingerprint(dict(content="x", author="A")) == fingerprint(dict(content="x", author="A"))
+        assert fingerprint(dict(content="x", author="A")) != fingerprint(dict(content="y", author="A"))
+
+
+class TestRevisions:
+    def test_parsers_read_name_and_state(self, tmp_path):
+        path = write_revision(tmp_path / "a.pdf", [("n1", 1, "Fix"), ("n2", 1, "state:Completed")])
+        comments = extract_comments(path)
+        assert [c.key for c in comments] == ["nm:n1", "nm:n2"]
+        assert comments[1].state == "Completed"
+        assert [c.key for c in extract_comments(path, use_alternate=True)] == ["nm:n1", "nm:n2"]
+
+    def test_unnamed_keys_are_stable(self, tmp_path):
+        first = write_revision(tmp_path / "a.pdf", [(None, 1, "One")])
+        second = write_revision(tmp_path / "b.pdf", [(None, 1, "One, edited")])
+        assert extract_comments(first)[0].key == extract_comments(second)[0].key
+
+    def test_cached_revision_is_not_parsed_again(self, tmp_path, monkeypatch):
+        old = write_revision(tmp_path / "old.pdf", [("n1", 1, "Fix")])
+        new = write_revision(tmp_path / "new.pdf", [("n1", 2, "Fix")])
+        cache = str(tmp_path / "cache.sqlite3")
+        extract_comments(old, cache=diff.ExtractionCache(cache))
+
+        parsed = []
+        real_extract_file = diff.extract_file
+
+        def extract_file(path, *args, **kwargs):
+            parsed.append(path)
+            return real_extract_file(path, *args, **kwargs)
+
+        monkeypatch.setattr(diff, 'extract_file', extract_file)
+        (old_records, old_error), (new_records, new_error) = extract_revisions(old, new, cache=cache)
+        assert parsed == [new]
+        assert old_error is None and new_error is None
+        assert _changes(diff_comments(old_records, new_records)) == [('moved', 'Fix')]
+
+    def test_both_revisions_extracted(self, tmp_path):
+        old = write_revision(tmp_path / "old.pdf", [("n1", 1, "Fix"), ("n2", 1, "Gone")])
+        new = write_revision(tmp_path / "new.pdf", [("n1", 1, "Fix"), ("n1s", 1, "state:Accepted")])
+        (old_records, _), (new_records, _) = extract_revisions(old, new)
+        assert _changes(diff_comments(old_records, new_records)) == [('removed', 'Gone'), ('resolved', 'Fix')]
+
+
+def test_cli_diff(tmp_path, capsys):
+    old = write_revision(tmp_path / "old.pdf", [("n1", 1, "Fix"), ("n2", 2, "Gone")])
+    new = write_revision(tmp_path / "new.pdf", [("n1", 1, "Fixed"), ("n3", 2, "New")])
+    assert main(['diff', old, new, '--json', '--no-cache']) == 0
+    events = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert _changes(events) == [('added', 'New'), ('edited', 'Fixed'), ('removed', 'Gone')]
+
+    assert main(['diff', old, str(tmp_path / "missing.pdf"), '--no-cache']) == 1
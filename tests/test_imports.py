@@ -0,0 +1,47 @@
+import os
+import sys
+import json
+import subprocess
+
+PACKAGE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pdf_comment_viewer')
+
+# Generous, so slow CI machines pass; importing pypdf alone takes longer than
+# everything allowed here on a typical machine
+IMPORT_BUDGET = 0.3
+
+PROBE = """
+import sys, time, json, logging
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps(dict(
+    elapsed=elapsed,
+    modules=sorted(name for name in ('pypdf', 'fitz', 'tkinter') if name in sys.modules),
+    handlers=len(logging.getLogger().handlers),
+)))
+"""
+
+
+def probe(module):
+    """Import module in a fresh interpreter and report what it pulled in"""
+    env = dict(os.environ, PYTHONPATH=PACKAGE_DIR)
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE.format(module=module)], env=env, cwd=PACKAGE_DIR,
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output)
+
+
+class TestImports:
+    def test_extraction_api_is_headless_and_lazy(self):
+        result = probe('pdf_processor')
+        assert result['modules'] == []
+        # Importing the library must not configure logging
+        assert result['handlers'] == 0
+        assert result['elapsed'] < IMPORT_BUDGET
+
+    def test_viewer_starts_without_a_pdf_library(self):
+        result = probe('main')
+        assert result['modules'] == ['tkinter']
+        assert result['handlers'] == 0
+        assert result['elapsed'] < IMPORT_BUDGET
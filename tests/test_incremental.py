@@ -0,0 +1,93 @@
+import pypdf
+from pypdf.annotations import Text
+from pypdf.generic import DictionaryObject, NameObject, TextStringObject
+from pdf_comment_viewer.cache import ExtractionCache
+from pdf_comment_viewer import pdf_processor
+from pdf_comment_viewer.stats import ExtractionStats
+
+
+def append_note(path, page_index, text):
+    """Add a note to a page with an incremental save, as PDF editors do"""
+    writer = pypdf.PdfWriter(path, incremental=True)
+    annotation = Text(text=text, rect=(50, 50, 70, 70))
+    writer.add_annotation(page_number=page_index, annotation=annotation)
+    with open(path, 'wb') as f:
+        writer.write(f)
+
+
+def fail(*args, **kwargs):
+    raise AssertionError("whole file was parsed again")
+
+
+class TestIncrementalExtraction:
+    def test_appended_note_is_merged_without_full_parse(self, tmp_path, annotated_pdf, monkeypatch):
+        cache = ExtractionCache(str(tmp_path / "cache.sqlite3"))
+        pdf = annotated_pdf(pages=4, annotated_pages=(1, 3))
+        stats = ExtractionStats()
+        before = pdf_processor.extract_comments(pdf, cache=cache, incremental=True, stats=stats)
+        assert len(before) == 4
+        # The first run is a normal extraction, which only records the layout
+        assert stats.parser == 'pypdf'
+
+        append_note(pdf, 1, "Added later")
+        expected = pdf_processor.extract_comments(pdf)
+        monkeypatch.setattr(pdf_processor, 'iter_comments', fail)
+
+        merged = pdf_processor.extract_comments(pdf, cache=cache, incremental=True)
+        assert merged == expected
+        assert [c['page'] for c in merged] == [1, 1, 2, 3, 3]
+        assert merged[2]['content'] == 'Added later'
+
+    def test_rewritten_file_is_extracted_in_full(self, tmp_path, annotated_pdf):
+        cache = ExtractionCache(str(tmp_path / "cache.sqlite3"))
+        pdf = annotated_pdf(pages=2, annotated_pages=(1,))
+        pdf_processor.extract_comments(pdf, cache=cache, incremental=True)
+
+        other = annotated_pdf(pages=2, annotated_pages=(2,), author="Someone else")
+        with open(other, 'rb') as src, open(pdf, 'wb') as dst:
+            dst.write(src.read() + b'\n% padding so the file grows\n')
+
+        comments = pdf_processor.extract_comments(pdf, cache=cache, incremental=True)
+        assert comments == pdf_processor.extract_comments(pdf)
+        assert [c['page'] for c in comments] == [2, 2]
+
+    def test_annotation_edited_into_a_comment(self, tmp_path, monkeypatch):
+        cache = ExtractionCache(str(tmp_path / "cache.sqlite3"))
+        pdf = str(tmp_path / "empty_note.pdf")
+        writer = pypdf.PdfWriter()
+        for _ in range(3):
+            writer.add_blank_page(width=612, height=792)
+        writer.add_annotation(page_number=1, annotation=Text(text="", rect=(50, 50, 70, 70)))
+        with open(pdf, 'wb') as f:
+            writer.write(f)
+        assert pdf_processor.extract_comments(pdf, cache=cache, incremental=True) == []
+
+        # The note gains text in place, the page and its /Annots are untouched
+        writer = pypdf.PdfWriter(pdf, incremental=True)
+        note = writer.pages[1]['/Annots'][0].get_object()
+        note[NameObject('/Contents')] = TextStringObject('Filled in later')
+        with open(pdf, 'wb') as f:
+            writer.write(f)
+        expected = pdf_processor.extract_comments(pdf)
+        assert [c['content'] for c in expected] == ['Filled in later']
+
+        monkeypatch.setattr(pdf_processor, 'iter_comments', fail)
+        assert pdf_processor.extract_comments(pdf, cache=cache, incremental=True) == expected
+
+    def test_first_run_honours_fallback(self, tmp_path):
+        cache = ExtractionCache(str(tmp_path / "cache.sqlite3"))
+        pdf = str(tmp_path / "orphan.pdf")
+        # A note that no page lists, which only the alternate parser finds
+        writer = pypdf.PdfWriter()
+        writer.add_blank_page(width=612, height=792)
+        writer._add_object(DictionaryObject({
+            NameObject('/Type'): NameObject('/Annot'),
+            NameObject('/Subtype'): NameObject('/Text'),
+            NameObject('/Contents'): TextStringObject('Loose'),
+        }))
+        writer.write(pdf)
+
+        stats = ExtractionStats()
+        comments = pdf_processor.extract_comments(pdf, cache=cache, incremental=True, fallback=True, stats=stats)
+        assert [c['content'] for c in comments] == ['Loose']
+        assert stats.parser == 'alternate'
@@ -1,7 +1,13 @@
 import pytest
 import os
 import tempfile
-from pdf_comment_viewer.pdf_processor import extract_comments
+import builtins
+from pypdf import PdfReader
+from pdf_comment_viewer import pdf_processor
+from pdf_comment_viewer.pdf_processor import extract_comments, iter_comments, plan_shards
+from pdf_comment_viewer.cache import ExtractionCache
+from pdf_comment_viewer.stats import ExtractionStats
+from tests.conftest import write_objstm_pdf, write_thread_pdf
 
 class TestPDFProcessor:
     def test_extract_comments_nonexistent_file(self):
@@ -21,4 +27,157 @@ class TestPDFProcessor:
         finally:
             # Clean up the temporary file
             if os.path.exists(tmp_path):
-                os.unlink(tmp_path)
\ No newline at end of file
+                os.unlink(tmp_path)
+    
+    def test_iter_comments_yields_in_page_order(self, annotated_pdf):
+        pdf = annotated_pdf(pages=4, annotated_pages=(2, 4))
+        
+        comments = iter_comments(pdf)
+        first = next(comments)
+        assert (first['page'], first['index']) == (2, 0)
+        
+        rest = [(c['page'], c['index']) for c in comments]
+        assert rest == [(2, 1), (4, 0), (4, 1)]
+        assert extract_comments(pdf)[0] == first
+    
+    def test_fast_path_matches_default(self, annotated_pdf):
+        pdf = annotated_pdf(pages=30, annotated_pages=(1, 17, 30))
+        
+        fast = extract_comments(pdf, fast=True)
+        assert [c['page'] for c in fast] == [1, 1, 17, 17, 30, 30]
+        assert fast == extract_comments(pdf)
+    
+    def test_fast_path_parses_pages_a_stale_xref_points_away_from(self, annotated_pdf):
+        pdf = annotated_pdf(pages=3, annotated_pages=(2,))
+        reader = PdfReader(pdf)
+        first, second, third = list.__iter__(reader.trailer['/Root']['/Pages']['/Kids'])
+        # The annotated page's entry points at the first page, which has no /Annots
+        reader.xref[0][second.idnum] = reader.xref[0][first.idnum]
+        
+        assert pdf_processor._peek_raw_object(reader, second) is None
+        assert pdf_processor._peek_raw_object(reader, third).startswith(b'%d 0 obj' % third.idnum)
+        assert [bool(page) for page in pdf_processor.iter_page_dicts(reader)] == [False, True, False]
+    
+    def test_fast_path_reads_object_streams_with_raw_parser(self, tmp_path):
+        pdf = str(tmp_path / "objstm.pdf")
+        write_objstm_pdf(pdf)
+        
+        comments = extract_comments(pdf, fast=True)
+        assert [(c['author'], c['content']) for c in comments] == [('Bob', 'Compressed note')]
+        assert comments == extract_comments(pdf)
+    
+    def test_fast_path_falls_back_to_pypdf_when_raw_finds_nothing(self, tmp_path, monkeypatch):
+        pdf = str(tmp_path / "objstm.pdf")
+        write_objstm_pdf(pdf)
+        expected = extract_comments(pdf)
+        monkeypatch.setattr(pdf_processor.RawDocument, 'page_comments', lambda self, page, page_num: [])
+        
+        assert extract_comments(pdf, fast=True) == []
+        stats = ExtractionStats()
+        assert extract_comments(pdf, fast=True, fallback=True, stats=stats) == expected
+        assert stats.parser == 'pypdf fast'
+        assert 'raw found nothing' in stats.fallbacks
+    
+    def test_fallback_reuses_the_open_file(self, tmp_path, monkeypatch):
+        pdf = tmp_path / "no_page_tree.pdf"
+        pdf.write_bytes(
+            b"%PDF-1.4\n"
+            b"1 0 obj << /Type /Annot /Subtype /Text /T (Alice) /Contents (Loose note) >> endobj\n"
+        )
+        opened = []
+        real_open = builtins.open
+        def counting_open(file, *args, **kwargs):
+            if str(file) == str(pdf):
+                opened.append(file)
+            return real_open(file, *args, **kwargs)
+        monkeypatch.setattr(builtins, 'open', counting_open)
+        
+        with pytest.raises(Exception):
+            extract_comments(str(pdf))
+        opened.clear()
+        comments = extract_comments(str(pdf), fallback=True)
+        
+        assert [c['content'] for c in comments] == ['Loose note']
+        assert len(opened) == 1
+    
+    def test_stats_record_stages_and_fallbacks(self, annotated_pdf, tmp_path):
+        pdf = annotated_pdf(pages=4, annotated_pages=(2, 3))
+        stats = ExtractionStats()
+        comments = extract_comments(pdf, stats=stats)
+        
+        assert stats.parser == 'pypdf'
+        assert {'open', 'xref', 'page tree', 'annotations'} <= set(stats.stages)
+        assert stats.counters['pages'] == 4
+        assert stats.counters['annotations'] == len(comments) == 4
+        assert stats.fallbacks == []
+        assert stats.elapsed >= sum(stats.stages.values()) > 0
+        
+        raw = tmp_path / "no_page_tree.pdf"
+        raw.write_bytes(b"%PDF-1.4\n1 0 obj << /Type /Annot /Subtype /Text /Contents (Loose) >> endobj\n")
+        stats = ExtractionStats()
+        extract_comments(str(raw), fallback=True, stats=stats)
+        assert stats.parser == 'alternate'
+        assert stats.fallbacks == ['pypdf could not read the file', 'pypdf found nothing']
+    
+    def test_replies_get_parent_and_thread(self, tmp_path):
+        pdf = write_thread_pdf(tmp_path / "thread.pdf")
+        
+        comments = extract_comments(pdf)
+        by_content = {c['content']: c for c in comments}
+        question = by_content['Question']['id']
+        answer = by_content['Answer']['id']
+        
+        assert by_content['Answer']['parent_id'] == question
+        assert by_content['Follow-up']['parent_id'] == answer
+        assert by_content['Second answer']['parent_id'] == question
+        assert 'parent_id' not in by_content['Grouped']
+        assert [c.get('thread_id') for c in comments] == [question] * 4 + [None, None]
+        
+        raw = extract_comments(pdf, use_alternate=True)
+        assert [(c.get('parent_id'), c.get('thread_id')) for c in raw] == \
+            [(c.get('parent_id'), c.get('thread_id')) for c in comments]
+    
+    def test_plan_shards(self):
+        assert plan_shards(0, 4) == []
+        assert plan_shards(300, 4) == [(1, 300)]
+        shards = plan_shards(10001, 2)
+        assert shards == [(1, 2501), (2502, 5001), (5002, 7501), (7502, 10001)]
+    
+    def test_sharded_extraction_matches_sequential(self, annotated_pdf, monkeypatch):
+        pdf = annotated_pdf(pages=9, annotated_pages=(1, 4, 5, 9))
+        monkeypatch.setattr(pdf_processor, 'MIN_SHARD_PAGES', 2)
+        
+        progress = []
+        sharded = extract_comments(pdf, workers=2, progress=lambda page, count, found: progress.append(page))
+        
+        assert sharded == extract_comments(pdf)
+        assert progress == [3, 5, 7, 9]
+    
+    def test_sharded_extraction_with_incremental_cache(self, annotated_pdf, monkeypatch, tmp_path):
+        pdf = annotated_pdf(pages=9, annotated_pages=(1, 4, 5, 9))
+        monkeypatch.setattr(pdf_processor, 'MIN_SHARD_PAGES', 2)
+        cache = ExtractionCache(str(tmp_path / "cache.sqlite3"))
+        
+        progress = []
+        sharded = extract_comments(
+            pdf, workers=2, cache=cache, incremental=True,
+            progress=lambda page, count, found: progress.append(page)
+        )
+        
+        assert sharded == extract_comments(pdf)
+        assert progress == [3, 5, 7, 9]
+        stats = ExtractionStats()
+        assert extract_comments(pdf, workers=2, cache=cache, incremental=True, stats=stats) == sharded
+        assert stats.parser == 'incremental'
+    
+    def test_junk_before_the_header_is_left_to_pypdf(self, annotated_pdf, tmp_path):
+        pdf = annotated_pdf(pages=2, annotated_pages=(2,))
+        expected = extract_comments(pdf)
+        data = open(pdf, 'rb').read()
+        for name, prefix in [('bom', b'\xef\xbb\xbf'), ('preamble', b'Content-Type: application/pdf\r\n' * 100)]:
+            prefixed = tmp_path / f"{name}.pdf"
+            prefixed.write_bytes(prefix + data)
+            
+            comments = extract_comments(str(prefixed))
+            assert [(c['page'], c['type']) for c in comments] == [(2, '/Text'), (2, '/Highlight')], name
+            assert [c['content'] for c in comments] == [c['content'] for c in expected]
@@ -0,0 +1,105 @@
+import json
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from pdf_comment_viewer import server
+from pdf_comment_viewer.batch import to_record
+from pdf_comment_viewer.pdf_processor import extract_comments
+from pdf_comment_viewer.server import ExtractionService, start_server
+
+
+async def _request(port, method, target, body=b'', content_type='application/json'):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(
+        f'{method} {target} HTTP/1.1\r\nHost: localhost\r\nContent-Type: {content_type}\r\n'
+        f'Content-Length: {len(body)}\r\n\r\n'.encode() + body
+    )
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(payload)
+
+
+def _run(scenario, **options):
+    async def main():
+        service = ExtractionService(jobs=1, cache=False, **options)
+        server = await start_server(service, port=0)
+        try:
+            return await scenario(server.sockets[0].getsockname()[1], service)
+        finally:
+            server.close()
+            await server.wait_closed()
+            service.close()
+
+    return asyncio.run(main())
+
+
+class TestServer:
+    def test_extract_path_and_upload(self, annotated_pdf):
+        path = annotated_pdf(pages=2, annotated_pages=(2,))
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        async def scenario(port, service):
+            by_path = await _request(port, 'POST', '/extract', json.dumps({'path': path}).encode())
+            upload = await _request(port, 'POST', '/extract?fast=1', data, content_type='application/pdf')
+            missing = await _request(port, 'GET', '/extract?path=/no/such.pdf')
+            metrics = await _request(port, 'GET', '/metrics')
+            return by_path, upload, missing, metrics
+
+        (status, result), (upload_status, upload), missing, (_, metrics) = _run(scenario)
+        assert status == 200 and result['file'] == path
+        assert [c['page'] for c in result['comments']] == [2, 2]
+        assert upload_status == 200 and upload['hash'] == result['hash']
+        assert len(upload['comments']) == 2
+        assert missing[0] == 404
+        assert metrics['requests'] == 4
+        assert metrics['extractions'] == 2
+        assert set(metrics['latency_ms']) == {'p50', 'p90', 'p99'}
+
+    def test_coalescing_and_backpressure(self, annotated_pdf, monkeypatch):
+        first = annotated_pdf(pages=3, annotated_pages=(1, 2))
+        second = annotated_pdf(pages=1, annotated_pages=(1,), author="Carol")
+        expected = [to_record(c) for c in extract_comments(first)]
+        started = threading.Event()
+        release = threading.Event()
+        real_extract = server._extract
+
+        def blocked_extract(path, options):
+            # Holds the extraction until the duplicate requests have arrived
+            started.set()
+            release.wait(10)
+            return real_extract(path, options)
+
+        monkeypatch.setattr(server, '_extract', blocked_extract)
+
+        async def scenario(port, service):
+            service._executor.shutdown()
+            service._executor = ThreadPoolExecutor(max_workers=1)
+
+            requests = [asyncio.ensure_future(_request(port, 'GET', f'/extract?path={first}'))]
+            while not started.is_set():
+                await asyncio.sleep(0.01)
+            in_flight = len(service.in_flight)
+            requests += [asyncio.ensure_future(_request(port, 'GET', f'/extract?path={first}')) for _ in range(2)]
+            rejected = await _request(port, 'GET', f'/extract?path={second}')
+            while service.metrics.coalesced < 2:
+                await asyncio.sleep(0.01)
+            release.set()
+            joined = await asyncio.gather(*requests)
+            metrics = await _request(port, 'GET', '/metrics')
+            return in_flight, joined, rejected, metrics[1]
+
+        in_flight, joined, rejected, metrics = _run(scenario, max_queue=1)
+        assert in_flight == 1
+        assert [status for status, _ in joined] == [200, 200, 200]
+        assert [body['coalesced'] for _, body in joined] == [False, True, True]
+        assert all(body['comments'] == expected for _, body in joined)
+        assert rejected[0] == 503
+        assert metrics['extractions'] == 1
+        assert metrics['coalesced'] == 2
+        assert metrics['rejected'] == 1
+        # The finished extraction removed itself
+        assert metrics['queue_depth'] == 0
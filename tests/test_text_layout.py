@@ -0,0 +1,119 @@
+import time
+
+import pypdf
+from pypdf import PdfWriter
+from pypdf.annotations import Highlight
+from pypdf.generic import ArrayObject, DecodedStreamObject, DictionaryObject, FloatObject, NameObject, TextStringObject
+
+from pdf_comment_viewer.cache import ExtractionCache
+from pdf_comment_viewer.pdf_processor import extract_comments
+from pdf_comment_viewer.stats import ExtractionStats
+from pdf_comment_viewer.text_layout import PageLayout, quad_boxes
+
+# Helvetica without /Widths, so every glyph is 6 points wide at 12 points
+LINES = b"BT /F1 12 Tf 100 505 Td (The quick brown fox) Tj 0 -20 Td (jumps over the dog) Tj ET"
+
+
+def _quads(*boxes):
+    values = []
+    for x0, y0, x1, y1 in boxes:
+        values += [x0, y1, x1, y1, x0, y0, x1, y0]
+    return ArrayObject([FloatObject(v) for v in values])
+
+
+def _highlight(writer, page_index, *boxes, contents=None):
+    highlight = Highlight(rect=boxes[0], quad_points=_quads(*boxes))
+    if contents:
+        highlight[NameObject("/Contents")] = TextStringObject(contents)
+    writer.add_annotation(page_number=page_index, annotation=highlight)
+
+
+def write_text_pdf(path, highlights, pages=2):
+    """Write pages of two text lines, with a highlight for each (page, boxes, contents) in highlights"""
+    writer = PdfWriter()
+    font = DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"), NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    })
+    for _ in range(pages):
+        page = writer.add_blank_page(width=612, height=792)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})
+        })
+        content = DecodedStreamObject()
+        content.set_data(LINES)
+        page.replace_contents(content)
+    for page_num, boxes, contents in highlights:
+        _highlight(writer, page_num - 1, *boxes, contents=contents)
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+
+QUICK = (123, 500, 155, 518)
+BROWN_FOX_JUMPS = [(159, 500, 215, 518), (99, 480, 131, 498)]
+
+
+class TestHighlightedText:
+    def test_highlights_get_the_text_they_cover(self, tmp_path):
+        path = write_text_pdf(tmp_path / "a.pdf", [(1, [QUICK], None), (2, BROWN_FOX_JUMPS, None)])
+        for fast in (False, True):
+            assert [c.content for c in extract_comments(path, fast=fast)] == ["quick", "brown fox jumps"]
+
+    def test_page_is_laid_out_once(self, tmp_path):
+        path = write_text_pdf(tmp_path / "a.pdf", [(1, [QUICK], None), (1, BROWN_FOX_JUMPS, None)], pages=3)
+        stats = ExtractionStats()
+        extract_comments(path, stats=stats)
+        assert stats.counters['text layouts'] == 1
+
+    def test_own_contents_and_empty_areas(self, tmp_path):
+        path = write_text_pdf(tmp_path / "a.pdf", [
+            (1, [QUICK], "Use another word"), (1, [(300, 300, 400, 320)], None),
+        ])
+        assert [c.content for c in extract_comments(path)] == ["Use another word", "[Highlight annotation]"]
+
+    def test_huge_quads_are_clipped_to_the_page(self, tmp_path):
+        path = write_text_pdf(tmp_path / "a.pdf", [(1, [(-1e12, -1e12, 1e12, 1e12)], None)], pages=1)
+        started = time.perf_counter()
+        assert [c.content for c in extract_comments(path)] == ["The quick brown fox jumps over the dog"]
+        assert time.perf_counter() - started < 5
+
+    def test_incremental_extraction(self, tmp_path):
+        path = write_text_pdf(tmp_path / "a.pdf", [(1, [QUICK], None)])
+        cache = ExtractionCache(str(tmp_path / "cache.sqlite3"))
+        assert [c.content for c in extract_comments(path, cache=cache, incremental=True)] == ["quick"]
+
+        writer = pypdf.PdfWriter(path, incremental=True)
+        _highlight(writer, 1, *BROWN_FOX_JUMPS)
+        with open(path, "wb") as f:
+            writer.write(f)
+        comments = extract_comments(path, cache=cache, incremental=True)
+        assert [c.content for c in comments] == ["quick", "brown fox jumps"]
+
+
+class TestPageLayout:
+    def test_grid_lookup(self):
+        layout = PageLayout(cell=10)
+        for i, char in enumerate("abc def"):
+            layout.add(char, i * 5, 0, i * 5 + 5, 8)
+        layout.add("x", 500, 500, 505, 508)
+        assert layout.glyphs_in(0, 0, 15, 8) == {0, 1, 2}
+        assert layout.text_in_quads([18, 8, 40, 8, 18, 0, 40, 0]) == "def"
+        assert layout.text_in_quads([0, 8, 10, 8, 0, 0, 10, 0, 499, 509, 506, 509, 499, 499, 506, 499]) == "ab x"
+        # Only the cells under the quad are looked at
+        assert all(0 <= cx <= 1 for cx, cy in layout._cells(0, 0, 15, 8))
+
+    def test_out_of_range_boxes(self):
+        layout = PageLayout(box=(0, 0, 612, 792))
+        layout.add("a", 10, 10, 15, 18)
+        layout.add("z", float("nan"), 0, float("inf"), 8)
+        assert layout.glyphs_in(-1e300, -1e300, 1e300, 1e300) == {0}
+        assert layout.glyphs_in(float("-inf"), 0, float("inf"), 20) == {0}
+        assert layout.glyphs_in(float("nan"), 0, 20, 20) == set()
+        assert layout.text_in_quads([0, 1e300, 1e300, 1e300, 0, 0, 1e300, 0]) == "a"
+
+    def test_quad_boxes(self):
+        assert list(quad_boxes([1, 4, 3, 4, 1, 2, 3, 2])) == [(1, 2, 3, 4)]
+        assert list(quad_boxes([1, 2, 3])) == []
+        assert list(quad_boxes(None)) == []
+        assert list(quad_boxes([1, 4, 3, 4, 1, 2, 3, float("nan")])) == []
@@ -0,0 +1,33 @@
+from pdf_comment_viewer.comment import Comment
+from pdf_comment_viewer.threads import assign_threads, thread_order
+
+
+def make(num, parent=None):
+    return Comment(id=num, content=f"Comment {num}", parent_id=parent)
+
+
+class TestThreads:
+    def test_assign_threads_follows_chains(self):
+        comments = [make(1), make(2, 1), make(3, 2), make(4, 1), make(5), make(6, 99)]
+        threaded = assign_threads(comments)
+
+        assert [c.get('thread_id') for c in threaded] == [1, 1, 1, 1, None, None]
+        # Comments outside any thread are passed through, not copied
+        assert threaded[4] is comments[4]
+        assert threaded[5] is comments[5]
+
+    def test_assign_threads_cuts_cycles(self):
+        threaded = assign_threads([make(1, 3), make(2, 1), make(3, 2)])
+        assert len({c.thread_id for c in threaded}) == 1
+
+    def test_assign_threads_handles_deep_chains(self):
+        comments = [make(1)] + [make(i, i - 1) for i in range(2, 20001)]
+        assert {c.thread_id for c in assign_threads(comments[::-1])} == {1}
+
+    def test_thread_order_puts_replies_after_parents(self):
+        comments = [make(1), make(5), make(2, 1), make(3, 2), make(4, 1)]
+        order = thread_order(comments)
+        assert [(comments[i].id, depth) for i, depth in order] == [(1, 0), (2, 1), (3, 2), (4, 1), (5, 0)]
+
+        cycle = [make(1, 2), make(2, 1)]
+        assert sorted(i for i, _ in thread_order(cycle)) == [0, 1]
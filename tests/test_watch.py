@@ -0,0 +1,132 @@
+import os
+import json
+from pdf_comment_viewer.watcher import FolderWatcher, WatchState, JsonlSink
+from pdf_comment_viewer.cli import main
+from tests.conftest import write_annotated_pdf
+
+
+class RecordingSink:
+    def __init__(self):
+        self.written = []
+        self.removed = []
+
+    def write(self, path, records, error=None, signature=None):
+        self.written.append((os.path.basename(path), len(records), error))
+
+    def remove(self, path):
+        self.removed.append(os.path.basename(path))
+
+    def close(self):
+        pass
+
+
+def _touch(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+
+
+class TestFolderWatcher:
+    def test_waits_for_files_to_settle(self, tmp_path):
+        folder = tmp_path / "shared"
+        folder.mkdir()
+        write_annotated_pdf(str(folder / "a.pdf"), pages=2, annotated_pages=(1, 2))
+        sink = RecordingSink()
+        watcher = FolderWatcher([str(folder)], sink, WatchState(str(tmp_path / "state")), jobs=1, settle=2,
+                                cache=False)
+
+        assert watcher.scan(now=0) == (0, 0)
+        # Still being written
+        _touch(folder / "a.pdf")
+        assert watcher.scan(now=1) == (0, 0)
+        assert watcher.scan(now=2) == (0, 0)
+        assert watcher.scan(now=3) == (1, 0)
+        watcher.process()
+        assert sink.written == [("a.pdf", 4, None)]
+
+        # Nothing changed, nothing to do
+        assert watcher.scan(now=10) == (0, 0)
+        assert watcher.idle
+
+        os.remove(folder / "a.pdf")
+        assert watcher.scan(now=11) == (0, 1)
+        assert sink.removed == ["a.pdf"]
+
+    def test_restart_skips_unchanged_files(self, tmp_path):
+        folder = tmp_path / "shared"
+        folder.mkdir()
+        for name in ("a.pdf", "b.pdf"):
+            write_annotated_pdf(str(folder / name))
+        state_path = str(tmp_path / "state")
+
+        sink = RecordingSink()
+        watcher = FolderWatcher([str(folder)], sink, WatchState(state_path), jobs=1, settle=0, cache=False)
+        assert watcher.scan(now=0) == (2, 0)
+        watcher.process()
+        watcher.state.close()
+
+        _touch(folder / "b.pdf")
+        sink = RecordingSink()
+        watcher = FolderWatcher([str(folder)], sink, WatchState(state_path), jobs=1, settle=0, cache=False)
+        assert watcher.scan(now=0) == (1, 0)
+        watcher.process()
+        assert sink.written == [("b.pdf", 2, None)]
+
+    def test_unreachable_folder_is_not_treated_as_emptied(self, tmp_path):
+        folder = tmp_path / "shared"
+        folder.mkdir()
+        write_annotated_pdf(str(folder / "a.pdf"))
+        sink = RecordingSink()
+        watcher = FolderWatcher([str(folder)], sink, WatchState(str(tmp_path / "state")), jobs=1, settle=0,
+                                cache=False)
+        watcher.scan(now=0)
+        watcher.process()
+
+        os.rename(folder, tmp_path / "unmounted")
+        assert watcher.scan(now=1) == (0, 0)
+        assert sink.removed == []
+
+    def test_sink_errors_dont_stop_the_watcher(self, tmp_path):
+        folder = tmp_path / "shared"
+        folder.mkdir()
+        for name in ("a.pdf", "b.pdf"):
+            write_annotated_pdf(str(folder / name))
+        sink = RecordingSink()
+        failing = {"a.pdf"}
+        record = sink.write
+
+        def write(path, records, error=None, signature=None):
+            if os.path.basename(path) in failing:
+                failing.clear()
+                raise OSError("disk full")
+            record(path, records, error, signature)
+
+        sink.write = write
+        watcher = FolderWatcher([str(folder)], sink, WatchState(str(tmp_path / "state")), jobs=1, settle=0,
+                                cache=False)
+        assert watcher.scan(now=0) == (2, 0)
+        assert watcher.process() == 2
+        assert sink.written == [("b.pdf", 2, None)]
+
+        # The file that couldn't be written is extracted again
+        assert watcher.scan(now=1) == (1, 0)
+        watcher.process()
+        assert sink.written == [("b.pdf", 2, None), ("a.pdf", 2, None)]
+        assert watcher.scan(now=2) == (0, 0)
+
+    def test_cli_watch_once_writes_jsonl(self, tmp_path):
+        folder = tmp_path / "shared"
+        folder.mkdir()
+        write_annotated_pdf(str(folder / "a.pdf"), pages=2, annotated_pages=(1, 2))
+        output = str(tmp_path / "out.jsonl")
+        args = ['watch', str(folder), '-o', output, '--once', '--interval', '0.05', '--settle', '0',
+                '--jobs', '1', '--no-cache']
+
+        assert main(args) == 0
+        assert main(args) == 0
+        with open(output, encoding='utf-8') as f:
+            lines = [json.loads(line) for line in f]
+        # The second run found nothing new
+        assert len(lines) == 1
+        assert lines[0]['event'] == 'updated'
+        assert len(lines[0]['comments']) == 4
+        assert os.path.exists(output + '.watch-state')
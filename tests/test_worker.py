@@ -0,0 +1,76 @@
+from pdf_comment_viewer.cache import ExtractionCache
+from pdf_comment_viewer.stats import ExtractionStats
+from pdf_comment_viewer.worker import ExtractionWorker
+from tests.conftest import write_thread_pdf
+
+
+def collect(worker):
+    worker.join(timeout=30)
+    events = []
+    while not worker.events.empty():
+        events.append(worker.events.get_nowait())
+    return events
+
+
+class TestExtractionWorker:
+    def test_comments_arrive_page_by_page(self, annotated_pdf):
+        pdf = annotated_pdf(pages=3, annotated_pages=(1, 3))
+        worker = ExtractionWorker(pdf)
+        worker.start()
+        events = collect(worker)
+
+        pages = [e for e in events if e[0] == 'page']
+        assert [(e[1], e[2]) for e in pages if e[3]] == [(1, 3), (3, 3)]
+        streamed = [c for e in pages for c in e[3]]
+        assert events[-1] == ('done', streamed, True)
+        assert len(streamed) == 4
+
+    def test_cancel_stops_at_page_boundary(self, annotated_pdf):
+        pdf = annotated_pdf(pages=3, annotated_pages=(1, 2, 3))
+        worker = ExtractionWorker(pdf)
+        worker.cancel()
+        worker.start()
+        events = collect(worker)
+
+        assert events == [('cancelled',)]
+
+    def test_threads_assigned_after_the_pages_are_flagged(self, tmp_path):
+        pdf = write_thread_pdf(tmp_path / "thread.pdf")
+        worker = ExtractionWorker(pdf)
+        worker.start()
+        events = collect(worker)
+
+        _, comments, streamed = events[-1]
+        assert not streamed
+        assert len(comments) == len([c for e in events[:-1] for c in e[3]])
+        assert any(c.thread_id is not None for c in comments)
+
+    def test_incremental_cache_streams_and_cancels(self, annotated_pdf, tmp_path):
+        # As the viewer runs it, with the cache on
+        cache = ExtractionCache(str(tmp_path / "cache.sqlite3"))
+        pdf = annotated_pdf(pages=3, annotated_pages=(1, 3))
+
+        stats = ExtractionStats()
+        worker = ExtractionWorker(pdf, cache=cache, incremental=True, stats=stats)
+        worker.cancel()
+        worker.start()
+        assert collect(worker) == [('cancelled',)]
+        assert cache.get_revision(pdf) is None
+
+        stats = ExtractionStats()
+        worker = ExtractionWorker(pdf, cache=cache, incremental=True, stats=stats)
+        worker.start()
+        events = collect(worker)
+        pages = [e for e in events if e[0] == 'page']
+        assert [(e[1], e[2]) for e in pages if e[3]] == [(1, 3), (3, 3)]
+        assert events[-1] == ('done', [c for e in pages for c in e[3]], True)
+        assert stats.parser == 'pypdf'
+
+        # The unchanged file's saved result arrives as one last page
+        stats = ExtractionStats()
+        worker = ExtractionWorker(pdf, cache=cache, incremental=True, stats=stats)
+        worker.start()
+        events = collect(worker)
+        assert [e[0] for e in events] == ['page', 'done']
+        assert events[0][1:3] == (3, 3) and events[0][3] == events[1][1] and events[1][2]
+        assert stats.parser == 'incremental'